@@ -0,0 +1,177 @@
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+CLICKS_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS clicks (
+        code TEXT NOT NULL,
+        minute INTEGER NOT NULL,
+        clicks INTEGER NOT NULL,
+        PRIMARY KEY (code, minute)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_clicks_minute ON clicks (minute)",
+    """
+    CREATE TABLE IF NOT EXISTS click_referrers (
+        code TEXT NOT NULL,
+        referrer TEXT NOT NULL,
+        clicks INTEGER NOT NULL,
+        last_minute INTEGER NOT NULL,
+        PRIMARY KEY (code, referrer)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_click_referrers_last_minute ON click_referrers (last_minute)",
+)
+
+
+def current_minute():
+    return int(time.time() // 60) * 60
+
+
+def create_click_tables(cursor):
+    """Create the click tables, adding last_minute to a click_referrers table from before it existed"""
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(click_referrers)")}
+    if columns and "last_minute" not in columns:
+        # Existing counters start their retention clock now
+        cursor.execute(
+            f"ALTER TABLE click_referrers ADD COLUMN last_minute INTEGER NOT NULL DEFAULT {current_minute()}"
+        )
+    for statement in CLICKS_SCHEMA:
+        cursor.execute(statement)
+
+
+def referrer_host(referrer):
+    """Reduce a Referer header to its host; direct visits become an empty string"""
+    if not referrer:
+        return ""
+    try:
+        return urlsplit(referrer).hostname or ""
+    except ValueError:
+        return ""
+
+
+class ClickRecorder:
+    """Captures redirects without blocking and aggregates them per minute
+
+    ``record`` is the only call on the redirect path: one append to a bounded
+    deque, which is atomic under the GIL and takes no lock. When the buffer is
+    full the oldest events are overwritten and counted as dropped. ``drain``
+    folds buffered events into per-minute and per-referrer counters that are
+    later written out in one batch by ``store_counts``.
+    """
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self._events = deque(maxlen=capacity)
+        self.recorded = 0
+        self.dropped = 0
+        self.minute_counts = {}
+        self.referrer_counts = {}
+
+    def record(self, code, referrer=None):
+        if len(self._events) == self.capacity:
+            self.dropped += 1
+        self._events.append((code, referrer, time.time()))
+
+    def drain(self):
+        """Move buffered events into the pending counters"""
+        events = self._events
+        minute_counts = self.minute_counts
+        referrer_counts = self.referrer_counts
+        while True:
+            try:
+                code, referrer, timestamp = events.popleft()
+            except IndexError:
+                break
+            key = (code, int(timestamp // 60) * 60)
+            minute_counts[key] = minute_counts.get(key, 0) + 1
+            key = (code, referrer_host(referrer))
+            referrer_counts[key] = referrer_counts.get(key, 0) + 1
+            self.recorded += 1
+
+    def take_counts(self):
+        """Drain and hand over the pending counters, starting fresh ones"""
+        self.drain()
+        counts = (self.minute_counts, self.referrer_counts)
+        self.minute_counts = {}
+        self.referrer_counts = {}
+        return counts
+
+    def restore_counts(self, minute_counts, referrer_counts):
+        """Put counters back after a failed flush so they are retried"""
+        for key, count in minute_counts.items():
+            self.minute_counts[key] = self.minute_counts.get(key, 0) + count
+        for key, count in referrer_counts.items():
+            self.referrer_counts[key] = self.referrer_counts.get(key, 0) + count
+
+    def reset(self):
+        """Discard buffered events and pending counters"""
+        self._events.clear()
+        self.minute_counts = {}
+        self.referrer_counts = {}
+
+    def stats(self):
+        return {
+            "buffered": len(self._events),
+            "capacity": self.capacity,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+        }
+
+
+def store_counts(conn, minute_counts, referrer_counts, before=None):
+    """Add aggregated counters to the click tables
+
+    With ``before``, minutes older than it are deleted, along with referrer
+    counters that have had no clicks since then.
+    """
+    conn.executemany(
+        """
+        INSERT INTO clicks (code, minute, clicks) VALUES (?, ?, ?)
+        ON CONFLICT (code, minute) DO UPDATE SET clicks = clicks + excluded.clicks
+        """,
+        ((code, minute, count) for (code, minute), count in minute_counts.items()),
+    )
+    # Referrer counters aren't per minute; the flush stands in for their last click
+    flushed = current_minute()
+    conn.executemany(
+        """
+        INSERT INTO click_referrers (code, referrer, clicks, last_minute) VALUES (?, ?, ?, ?)
+        ON CONFLICT (code, referrer) DO UPDATE SET
+            clicks = clicks + excluded.clicks,
+            last_minute = MAX(last_minute, excluded.last_minute)
+        """,
+        ((code, referrer, count, flushed) for (code, referrer), count in referrer_counts.items()),
+    )
+    if before is not None:
+        conn.execute("DELETE FROM clicks WHERE minute < ?", (before,))
+        conn.execute("DELETE FROM click_referrers WHERE last_minute < ?", (before,))
+
+
+def top_codes(conn, since, limit):
+    cursor = conn.execute(
+        """
+        SELECT code, SUM(clicks) AS total FROM clicks
+        WHERE minute >= ? GROUP BY code ORDER BY total DESC, code LIMIT ?
+        """,
+        (since, limit),
+    )
+    return [{"code": code, "clicks": total} for code, total in cursor.fetchall()]
+
+
+def code_series(conn, code, since, referrer_limit=10):
+    cursor = conn.execute(
+        "SELECT minute, clicks FROM clicks WHERE code = ? AND minute >= ? ORDER BY minute",
+        (code, since),
+    )
+    series = [{"minute": minute, "clicks": clicks} for minute, clicks in cursor.fetchall()]
+    cursor = conn.execute(
+        """
+        SELECT referrer, clicks FROM click_referrers
+        WHERE code = ? ORDER BY clicks DESC, referrer LIMIT ?
+        """,
+        (code, referrer_limit),
+    )
+    referrers = [{"referrer": referrer, "clicks": clicks} for referrer, clicks in cursor.fetchall()]
+    return {"code": code, "series": series, "referrers": referrers}
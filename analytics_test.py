@@ -0,0 +1,90 @@
+import sqlite3
+from unittest.mock import patch
+
+import pytest
+
+from analytics import (
+    CLICKS_SCHEMA,
+    ClickRecorder,
+    code_series,
+    referrer_host,
+    store_counts,
+    top_codes,
+)
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    for statement in CLICKS_SCHEMA:
+        conn.execute(statement)
+    yield conn
+    conn.close()
+
+
+class TestClickRecorder:
+    """Tests for buffering and aggregating clicks"""
+
+    def test_aggregates_per_minute_and_referrer(self):
+        recorder = ClickRecorder()
+        with patch("analytics.time.time", return_value=120.5):
+            recorder.record("a", "https://news.example.com/story")
+            recorder.record("a")
+        with patch("analytics.time.time", return_value=185.0):
+            recorder.record("a", "https://news.example.com/other")
+            recorder.record("b")
+        minute_counts, referrer_counts = recorder.take_counts()
+        assert minute_counts == {("a", 120): 2, ("a", 180): 1, ("b", 180): 1}
+        assert referrer_counts == {("a", "news.example.com"): 2, ("a", ""): 1, ("b", ""): 1}
+        assert recorder.take_counts() == ({}, {})
+        assert recorder.stats()["recorded"] == 4
+
+    def test_full_buffer_drops_oldest(self):
+        recorder = ClickRecorder(capacity=2)
+        for code in ("a", "b", "c"):
+            recorder.record(code)
+        minute_counts, _ = recorder.take_counts()
+        assert sorted(code for code, _ in minute_counts) == ["b", "c"]
+        assert recorder.stats()["dropped"] == 1
+
+    def test_restore_counts_merges(self):
+        recorder = ClickRecorder()
+        with patch("analytics.time.time", return_value=60):
+            recorder.record("a")
+        counts = recorder.take_counts()
+        with patch("analytics.time.time", return_value=60):
+            recorder.record("a")
+        recorder.drain()
+        recorder.restore_counts(*counts)
+        assert recorder.take_counts()[0] == {("a", 60): 2}
+
+    def test_referrer_host(self):
+        assert referrer_host(None) == ""
+        assert referrer_host("https://Example.com:8080/x") == "example.com"
+        assert referrer_host("not a url") == ""
+
+
+class TestClickStore:
+    """Tests for flushing and querying click counters"""
+
+    def test_store_accumulates(self, conn):
+        store_counts(conn, {("a", 60): 2}, {("a", "x.com"): 2})
+        store_counts(conn, {("a", 60): 1, ("a", 120): 4}, {("a", "x.com"): 5})
+        assert code_series(conn, "a", 0) == {
+            "code": "a",
+            "series": [{"minute": 60, "clicks": 3}, {"minute": 120, "clicks": 4}],
+            "referrers": [{"referrer": "x.com", "clicks": 7}],
+        }
+
+    def test_store_drops_counters_older_than_before(self, conn):
+        with patch("analytics.time.time", return_value=60):
+            store_counts(conn, {("a", 60): 2, ("b", 60): 1}, {("a", "x.com"): 2})
+        with patch("analytics.time.time", return_value=120):
+            store_counts(conn, {("a", 120): 1}, {("a", "y.com"): 1}, before=120)
+        assert top_codes(conn, 0, 10) == [{"code": "a", "clicks": 1}]
+        assert code_series(conn, "a", 0)["referrers"] == [{"referrer": "y.com", "clicks": 1}]
+
+    def test_top_codes_respects_window(self, conn):
+        store_counts(conn, {("a", 60): 10, ("b", 120): 3, ("c", 120): 5}, {})
+        assert top_codes(conn, 0, 2) == [{"code": "a", "clicks": 10}, {"code": "c", "clicks": 5}]
+        assert top_codes(conn, 120, 10) == [{"code": "c", "clicks": 5}, {"code": "b", "clicks": 3}]
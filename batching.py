@@ -0,0 +1,115 @@
+import asyncio
+import sqlite3
+
+
+def run_batch(conn, ops, isolate=(sqlite3.Error,)):
+    """Run every (fn, args) op against ``conn`` in a single transaction
+
+    Each op gets its own savepoint, so one that fails with an ``isolate``
+    exception (by default any database error, say a duplicate code) is rolled
+    back on its own and reported without affecting the others. Any other
+    exception aborts the whole batch.
+    Returns one (result, exception) pair per op; nothing is visible to readers
+    until the final commit.
+    """
+    results = []
+    conn.execute("BEGIN")
+    try:
+        for fn, args in ops:
+            conn.execute("SAVEPOINT op")
+            try:
+                result = fn(conn, *args)
+            except isolate as exc:
+                conn.execute("ROLLBACK TO op")
+                conn.execute("RELEASE op")
+                results.append((None, exc))
+            else:
+                conn.execute("RELEASE op")
+                results.append((result, None))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return results
+
+
+class WriteBatcher:
+    """Coalesces concurrent writes into group commits
+
+    ``submit`` queues an op and waits. Queued ops are flushed as one
+    transaction once ``max_batch`` are waiting or ``max_delay`` seconds after
+    the first one arrived, whichever comes first. ``flush(ops)`` is an async
+    callable that runs the (op, args) pairs (on the database writer thread)
+    and returns their (result, exception) pairs. Each caller is answered only
+    after the transaction holding its op has committed, so an acknowledged
+    write is visible to every subsequent read. It is only fsynced when the
+    database runs with ``synchronous=FULL``; under the default WAL profile
+    with ``synchronous=NORMAL`` the last commits can be lost on power failure.
+    """
+
+    def __init__(self, flush, max_batch=256, max_delay=0.002):
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.ops = 0
+        self._pending = []
+        self._timer = None
+        self._flushing = False
+
+    async def submit(self, op, *args):
+        """Queue ``(op, args)`` for ``flush`` and return the op's result once committed
+
+        The app passes storage write names (``"put"``, ``"update"``, ...),
+        which ``Storage.write_batch`` dispatches.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((op, args, future))
+        if len(self._pending) >= self.max_batch:
+            self._start_flush(loop)
+        elif self._timer is None and not self._flushing:
+            self._timer = loop.call_later(self.max_delay, self._start_flush, loop)
+        return await future
+
+    def _start_flush(self, loop):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._flushing or not self._pending:
+            return
+        self._flushing = True
+        batch = self._pending[:self.max_batch]
+        del self._pending[:self.max_batch]
+        task = loop.create_task(self.flush([(op, args) for op, args, _ in batch]))
+        task.add_done_callback(lambda task: self._finish_flush(loop, batch, task))
+
+    def _finish_flush(self, loop, batch, task):
+        if task.cancelled():
+            results = [(None, asyncio.CancelledError())] * len(batch)
+        elif task.exception() is not None:
+            # The whole transaction failed; every caller in it gets the error
+            results = [(None, task.exception())] * len(batch)
+        else:
+            results = task.result()
+        self.batches += 1
+        self.ops += len(batch)
+        for (_, _, future), (result, exc) in zip(batch, results):
+            if future.done():
+                continue
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+        self._flushing = False
+        # Ops that queued up during the commit go out right away
+        if self._pending:
+            self._start_flush(loop)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "ops": self.ops,
+            "ops_per_batch": self.ops / self.batches if self.batches else 0.0,
+            "pending": len(self._pending),
+        }
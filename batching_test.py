@@ -0,0 +1,108 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from batching import WriteBatcher, run_batch
+
+
+def insert(conn, value):
+    conn.execute("INSERT INTO t (x) VALUES (?)", (value,))
+    return value
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (x INTEGER PRIMARY KEY)")
+    yield conn
+    conn.close()
+
+
+class TestRunBatch:
+    """Tests for running queued writes as one transaction"""
+
+    def test_failed_op_is_isolated(self, conn):
+        results = run_batch(conn, [(insert, (1,)), (insert, (1,)), (insert, (2,))])
+        assert results[0] == (1, None)
+        assert isinstance(results[1][1], sqlite3.IntegrityError)
+        assert results[2] == (2, None)
+        assert not conn.in_transaction
+        assert conn.execute("SELECT x FROM t ORDER BY x").fetchall() == [(1,), (2,)]
+
+    def test_commit_is_atomic(self, conn):
+        def boom(conn):
+            raise KeyboardInterrupt
+
+        with pytest.raises(KeyboardInterrupt):
+            run_batch(conn, [(insert, (1,)), (boom, ())])
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+
+class TestWriteBatcher:
+    """Tests for coalescing writes into group commits"""
+
+    def test_concurrent_writes_share_a_flush(self, conn):
+        flushes = []
+
+        async def flush(ops):
+            flushes.append(len(ops))
+            return run_batch(conn, ops)
+
+        batcher = WriteBatcher(flush, max_batch=100, max_delay=0.01)
+
+        async def scenario():
+            return await asyncio.gather(*(batcher.submit(insert, i) for i in range(10)))
+
+        assert asyncio.run(scenario()) == list(range(10))
+        assert flushes == [10]
+        assert batcher.stats()["ops_per_batch"] == 10
+
+    def test_full_batch_flushes_without_waiting(self, conn):
+        flushes = []
+
+        async def flush(ops):
+            flushes.append(len(ops))
+            return run_batch(conn, ops)
+
+        batcher = WriteBatcher(flush, max_batch=4, max_delay=60)
+
+        async def scenario():
+            return await asyncio.wait_for(
+                asyncio.gather(*(batcher.submit(insert, i) for i in range(8))), 1
+            )
+
+        assert len(asyncio.run(scenario())) == 8
+        assert flushes == [4, 4]
+
+    def test_errors_reach_their_caller_only(self, conn):
+        async def flush(ops):
+            return run_batch(conn, ops)
+
+        batcher = WriteBatcher(flush, max_delay=0.001)
+
+        async def scenario():
+            return await asyncio.gather(
+                batcher.submit(insert, 1),
+                batcher.submit(insert, 1),
+                return_exceptions=True,
+            )
+
+        first, second = asyncio.run(scenario())
+        assert first == 1
+        assert isinstance(second, sqlite3.IntegrityError)
+
+    def test_failed_flush_fails_every_caller(self):
+        async def flush(ops):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        batcher = WriteBatcher(flush, max_delay=0.001)
+
+        async def scenario():
+            return await asyncio.gather(
+                batcher.submit(insert, 1),
+                batcher.submit(insert, 2),
+                return_exceptions=True,
+            )
+
+        assert all(isinstance(result, sqlite3.OperationalError) for result in asyncio.run(scenario()))
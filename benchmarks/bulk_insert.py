@@ -0,0 +1,83 @@
+"""Measure bulk import throughput in rows per second
+
+Compares one POST /shorten per row against NDJSON batches sent to
+POST /shorten/bulk. Run from the repository root:
+
+    python -m benchmarks.bulk_insert --rows 100000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import httpx
+
+import main
+
+
+async def single_inserts(client, rows):
+    start = time.perf_counter()
+    for i in range(rows):
+        response = await client.post("/shorten", json={"code": f"s{i}", "url": f"https://example.com/{i}"})
+        assert response.status_code == 200
+    return time.perf_counter() - start
+
+
+async def bulk_insert(client, rows):
+    async def body():
+        for i in range(rows):
+            yield (json.dumps({"code": f"b{i}", "url": f"https://example.com/{i}"}) + "\n").encode()
+
+    start = time.perf_counter()
+    response = await client.post(
+        "/shorten/bulk",
+        content=body(),
+        headers={"Content-Type": "application/x-ndjson"},
+        timeout=None,
+    )
+    elapsed = time.perf_counter() - start
+    assert response.json()["created"] == rows
+    return elapsed
+
+
+async def drive(rows, single_rows):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        single = await single_inserts(client, single_rows)
+        bulk = await bulk_insert(client, rows)
+    return {
+        "single": {"rows": single_rows, "seconds": single, "rows_per_second": single_rows / single},
+        "bulk": {
+            "rows": rows,
+            "batch_size": main.BULK_BATCH_SIZE,
+            "seconds": bulk,
+            "rows_per_second": rows / bulk,
+        },
+    }
+
+
+def run(rows, single_rows):
+    db_fd, db_path = tempfile.mkstemp()
+    try:
+        main.DATABASE = db_path
+        main.init_db()
+        results = asyncio.run(drive(rows, single_rows))
+        results["speedup"] = results["bulk"]["rows_per_second"] / results["single"]["rows_per_second"]
+        return results
+    finally:
+        main.storage.close()
+        os.close(db_fd)
+        for path in (db_path, db_path + "-wal", db_path + "-shm"):
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--single-rows", type=int, default=2_000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.single_rows), indent=2))
@@ -0,0 +1,106 @@
+"""Measure how much storage deduplicated creation saves
+
+Replays the same stream of create requests into SQLite twice, once
+creating a row per request and once with dedupe (``find_code`` first,
+as POST /shorten does with ``dedupe``). Popular URLs are requested far
+more often than the rest, and some repeats spell the URL differently
+(upper-case host, explicit default port). Reports rows, database size,
+the size of the digest index and create throughput. Run from the
+repository root:
+
+    python -m benchmarks.dedupe --requests 500000 --distinct 100000
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.search import realistic_urls
+from ids import base62_encode
+from policy import Redirect
+from storage import SqliteStorage
+
+
+def respell(url, rng):
+    """An equivalent spelling of ``url``, as another client might send it"""
+    scheme, _, rest = url.partition("://")
+    host, slash, path = rest.partition("/")
+    if rng.random() < 0.5:
+        host = host.upper()
+    else:
+        host = f"{host}:443"
+    return f"{scheme}://{host}{slash}{path}"
+
+
+def create_requests(total, distinct, rng, skew=1.0, respelled=0.1):
+    """Yield ``total`` URLs drawn from ``distinct`` with a Zipf-like skew"""
+    pool = list(realistic_urls(distinct, rng))
+    weights = [1 / (rank + 1) ** skew for rank in range(distinct)]
+    for url in rng.choices(pool, weights, k=total):
+        yield respell(url, rng) if rng.random() < respelled else url
+
+
+def database_sizes(path):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        sizes = {"database_bytes": conn.execute("PRAGMA page_count").fetchone()[0] * page_size}
+        try:
+            sizes["digest_index_bytes"] = conn.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = 'urls_url_digest'"
+            ).fetchone()[0]
+        except sqlite3.OperationalError:
+            # SQLite built without the dbstat table
+            pass
+        return sizes
+    finally:
+        conn.close()
+
+
+def run_store(store, path, urls, dedupe):
+    start = time.perf_counter()
+    next_id = 0
+    for url in urls:
+        if dedupe and store.find_code(Redirect(url)) is not None:
+            continue
+        store.put(base62_encode(62**3 + next_id), url)
+        next_id += 1
+    elapsed = time.perf_counter() - start
+    return {"rows": store.count(), "requests_per_second": len(urls) / elapsed, **database_sizes(path)}
+
+
+def run(total, distinct, seed_value=0):
+    urls = list(create_requests(total, distinct, random.Random(seed_value)))
+    report = {
+        "config": {"requests": total, "distinct": distinct, "seed": seed_value},
+        "results": {},
+    }
+    for name, dedupe in (("plain", False), ("dedupe", True)):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/urls.db"
+            store = SqliteStorage(path)
+            store.init()
+            try:
+                report["results"][name] = run_store(store, path, urls, dedupe)
+            finally:
+                store.close()
+    plain, dedupe = report["results"]["plain"], report["results"]["dedupe"]
+    report["saved"] = {
+        "rows": plain["rows"] - dedupe["rows"],
+        "bytes": plain["database_bytes"] - dedupe["database_bytes"],
+        "ratio": 1 - dedupe["database_bytes"] / plain["database_bytes"],
+    }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500_000)
+    parser.add_argument("--distinct", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests, args.distinct, args.seed), indent=2))
@@ -0,0 +1,70 @@
+"""Compare cache-hit redirects per second through FastAPI vs the raw ASGI fast path
+
+Run from the repository root:
+
+    python -m benchmarks.fastpath --codes 1000 --requests 50000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+import httpx
+
+import main
+from benchmarks.redirects import seed
+
+
+async def drive(app, codes, total, concurrency):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = iter(range(total))
+
+        async def worker():
+            for _ in remaining:
+                response = await client.get(f"/{random.choice(codes)}")
+                assert response.status_code == 302
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+
+def run(codes, total, concurrency):
+    db_fd, db_path = tempfile.mkstemp()
+    try:
+        main.DATABASE = db_path
+        main.init_db()
+        seed(db_path, codes)
+        keys = [f"c{i}" for i in range(codes)]
+        main.url_cache.max_size = max(main.url_cache.max_size, codes)
+        # Warm the cache so both runs measure hits only
+        asyncio.run(drive(main.app, keys, codes * 5, concurrency))
+
+        results = {}
+        for name, app in (("fastapi", main.app), ("fast_path", main.fast_app)):
+            elapsed = asyncio.run(drive(app, keys, total, concurrency))
+            results[name] = {"seconds": elapsed, "redirects_per_second": total / elapsed}
+        results["speedup"] = (
+            results["fast_path"]["redirects_per_second"] / results["fastapi"]["redirects_per_second"]
+        )
+        return results
+    finally:
+        main.storage.close()
+        os.close(db_fd)
+        for path in (db_path, db_path + "-wal", db_path + "-shm"):
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--codes", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=50_000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    print(json.dumps(run(args.codes, args.requests, args.concurrency), indent=2))
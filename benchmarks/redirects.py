@@ -0,0 +1,93 @@
+"""Compare redirects per second with per-request connects vs the connection pool
+
+Run from the repository root:
+
+    python -m benchmarks.redirects --codes 10000 --requests 20000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+import httpx
+
+import main
+
+
+@contextmanager
+def connect_per_request(readonly=False):
+    """The original get_db: open and close a connection on every request"""
+    conn = sqlite3.connect(main.DATABASE)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def seed(path, count):
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO urls (code, url) VALUES (?, ?)",
+        ((f"c{i}", f"https://example.com/{i}") for i in range(count)),
+    )
+    conn.commit()
+    conn.close()
+
+
+async def drive(codes, total, concurrency):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = iter(range(total))
+
+        async def worker():
+            for _ in remaining:
+                response = await client.get(f"/{random.choice(codes)}")
+                assert response.status_code == 302
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+
+def run(codes, total, concurrency):
+    db_fd, db_path = tempfile.mkstemp()
+    try:
+        main.DATABASE = db_path
+        main.init_db()
+        seed(db_path, codes)
+        # Measure the database path only
+        main.url_cache.max_size = 0
+        keys = [f"c{i}" for i in range(codes)]
+
+        results = {}
+        pooled = main.storage.connection
+        for name, connection in (("per_request_connect", connect_per_request), ("pool", pooled)):
+            main.storage.connection = connection
+            elapsed = asyncio.run(drive(keys, total, concurrency))
+            results[name] = {"seconds": elapsed, "redirects_per_second": total / elapsed}
+        results["speedup"] = (
+            results["pool"]["redirects_per_second"]
+            / results["per_request_connect"]["redirects_per_second"]
+        )
+        return results
+    finally:
+        main.storage.close()
+        os.close(db_fd)
+        for path in (db_path, db_path + "-wal", db_path + "-shm"):
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--codes", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    print(json.dumps(run(args.codes, args.requests, args.concurrency), indent=2))
@@ -0,0 +1,85 @@
+"""Measure URL search latency with and without the trigram index
+
+Loads the same generated URLs into SQLite twice, once with the urls_fts index
+and once without, then reports bulk load throughput, database size and
+search latency for rare and common substrings. Run from the repository root:
+
+    python -m benchmarks.search --codes 1000000 --queries 200
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from storage import SqliteStorage
+
+HOSTS = ("example.com", "shop.example.com", "news.site.org", "docs.python.org", "github.com", "youtu.be")
+WORDS = ("promo", "sale", "spring", "blog", "post", "watch", "item", "video", "release", "notes", "user", "docs")
+
+
+def realistic_urls(count, rng):
+    """Yield ``count`` URLs with a few hosts, word paths and numeric ids"""
+    for i in range(count):
+        path = "/".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+        query = f"?id={rng.randrange(10**6)}" if rng.random() < 0.5 else ""
+        yield f"https://{rng.choice(HOSTS)}/{path}/{i}{query}"
+
+
+def database_bytes(path):
+    return sum(os.path.getsize(name) for name in (path, path + "-wal") if os.path.exists(name))
+
+
+def run_store(store, path, codes, queries, rng, batch_size=1000):
+    urls = realistic_urls(codes, rng)
+    start = time.perf_counter()
+    for first in range(0, codes, batch_size):
+        store.put_many([(f"c{i}", next(urls)) for i in range(first, min(first + batch_size, codes))])
+    load = time.perf_counter() - start
+    results = {
+        "bulk_load_rows_per_second": codes / load,
+        "database_bytes": database_bytes(path),
+    }
+    # A unique id matches one row; a word matches a large share of them
+    for name, make_query in (
+        ("rare", lambda: f"/{rng.randrange(codes)}?"),
+        ("common", lambda: f"{rng.choice(HOSTS)}/{rng.choice(WORDS)}"),
+    ):
+        timings = []
+        for _ in range(queries):
+            text = make_query()
+            start = time.perf_counter()
+            store.search(text, limit=100)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        results[f"search_{name}_ms"] = {
+            "median": statistics.median(timings) * 1000,
+            "p99": timings[int(len(timings) * 0.99) - 1] * 1000,
+        }
+    return results
+
+
+def run(codes, queries, seed_value=0):
+    report = {"config": {"codes": codes, "queries": queries, "seed": seed_value}, "results": {}}
+    for name, search_index in (("trigram_index", True), ("scan", False)):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/urls.db"
+            store = SqliteStorage(path, search_index=search_index)
+            store.init()
+            try:
+                report["results"][name] = run_store(store, path, codes, queries, random.Random(seed_value))
+            finally:
+                store.close()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--codes", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.codes, args.queries, args.seed), indent=2))
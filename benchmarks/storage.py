@@ -0,0 +1,111 @@
+"""Compare storage backends operation by operation
+
+Runs the same workload directly against each backend, without HTTP or the
+event loop in the way: bulk load (then compaction, for the log store),
+random gets (hits and misses), single puts, updates, ordered scans and
+deletes. Run from the repository root:
+
+    python -m benchmarks.storage --codes 100000 --ops 20000
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import time
+
+from logstore import LogStorage
+from storage import MemoryStorage, SqliteStorage
+
+BACKENDS = ("sqlite", "log", "memory")
+
+
+def open_backend(name, directory):
+    if name == "sqlite":
+        return SqliteStorage(f"{directory}/urls.db")
+    if name == "log":
+        return LogStorage(f"{directory}/logstore")
+    if name == "memory":
+        return MemoryStorage()
+    raise ValueError(f"Unknown backend: {name}")
+
+
+def timed(count, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    return {"ops": count, "seconds": elapsed, "ops_per_second": count / elapsed if elapsed else 0.0}
+
+
+def run_backend(store, codes, ops, rng):
+    keys = [f"c{i}" for i in range(codes)]
+    hits = [rng.choice(keys) for _ in range(ops)]
+    results = {}
+
+    def bulk_load(batch_size=1000):
+        for start in range(0, codes, batch_size):
+            store.put_many([(key, f"https://example.com/{key}") for key in keys[start:start + batch_size]])
+
+    def get_hits():
+        for key in hits:
+            store.get(key)
+
+    def get_misses():
+        for i in range(ops):
+            store.get(f"missing{i}")
+
+    def put():
+        for i in range(ops):
+            store.put(f"new{i}", f"https://new.example.com/{i}")
+
+    def update():
+        for key in hits:
+            store.update(key, f"https://updated.example.com/{key}")
+
+    def scan(page_size=100):
+        for key in hits[: ops // 10]:
+            store.scan(after=key, limit=page_size)
+
+    def delete():
+        for i in range(ops):
+            store.delete(f"new{i}")
+
+    results["bulk_load"] = timed(codes, bulk_load)
+    if hasattr(store, "compact"):
+        # Serve the reads below from the index rather than the in-memory overlay
+        results["compact"] = timed(codes, store.compact)
+    results["get_hit"] = timed(ops, get_hits)
+    results["get_miss"] = timed(ops, get_misses)
+    results["put"] = timed(ops, put)
+    results["update"] = timed(ops, update)
+    results["scan_100"] = timed(ops // 10, scan)
+    results["delete"] = timed(ops, delete)
+    return results
+
+
+def run(codes, ops, backends, seed_value=0):
+    report = {"config": {"codes": codes, "ops": ops, "seed": seed_value}, "results": {}}
+    for name in backends:
+        with tempfile.TemporaryDirectory() as directory:
+            store = open_backend(name, directory)
+            store.init()
+            try:
+                report["results"][name] = run_backend(store, codes, ops, random.Random(seed_value))
+            finally:
+                store.close()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--codes", type=int, default=100_000)
+    parser.add_argument("--ops", type=int, default=20_000)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    backends = [name for name in args.backends.split(",") if name]
+    unknown = set(backends) - set(BACKENDS)
+    if unknown:
+        parser.error(f"unknown backends: {', '.join(sorted(unknown))}")
+    print(json.dumps(run(args.codes, args.ops, backends, args.seed), indent=2))
@@ -0,0 +1,218 @@
+"""Reproducible load test for the redirect and write paths
+
+Seeds a database with N codes, then drives each scenario through an
+in-process ASGI client with configurable concurrency and Zipfian key skew.
+Prints (or writes) JSON with requests per second and p50/p95/p99 latency so
+runs can be diffed, plus the cold-start time: from the startup hook until
+/ready reports the cache warmup finished. Run from the repository root:
+
+    python -m benchmarks.suite --codes 1000000 --requests 50000 --output before.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import httpx
+
+import main
+from warmup import save_hot_codes
+
+SCENARIOS = ("resolve", "create", "update", "manage")
+
+
+def seed(store, count, batch_size=50_000):
+    """Insert ``count`` codes in large batches"""
+    rows = ((f"c{i}", f"https://example.com/{i}") for i in range(count))
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        store.put_many(batch)
+    if hasattr(store, "compact"):
+        store.compact()
+
+
+def zipf_keys(count, total, s, rng):
+    """Draw ``total`` code indexes in [0, count) with Zipf exponent ``s``
+
+    ``s=0`` is uniform; around 1 a few codes take most of the traffic.
+    """
+    if s == 0:
+        return [rng.randrange(count) for _ in range(total)]
+    cumulative = list(itertools.accumulate(1 / (rank**s) for rank in range(1, count + 1)))
+    return rng.choices(range(count), cum_weights=cumulative, k=total)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    position = min(len(sorted_values) - 1, round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[position]
+
+
+async def run_scenario(client, requests, concurrency):
+    """Send every request with ``concurrency`` workers and collect latencies"""
+    latencies = []
+    errors = 0
+    remaining = iter(requests)
+
+    async def worker():
+        nonlocal errors
+        for method, url, body in remaining:
+            start = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def build_requests(scenario, codes, total, skew, rng):
+    if scenario == "resolve":
+        return [("GET", f"/c{i}", None) for i in zipf_keys(codes, total, skew, rng)]
+    if scenario == "create":
+        return [("POST", "/shorten", {"code": f"new{i}", "url": f"https://new.example.com/{i}"}) for i in range(total)]
+    if scenario == "update":
+        return [
+            ("PUT", f"/update/c{i}", {"url": f"https://updated.example.com/{i}"})
+            for i in zipf_keys(codes, total, skew, rng)
+        ]
+    if scenario == "manage":
+        return [("GET", f"/manage?after=c{i}", None) for i in zipf_keys(codes, total, 0, rng)]
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+async def start(client):
+    """Run the startup hook and poll /ready, timing both"""
+    began = time.perf_counter()
+    await main.startup_event()
+    startup_seconds = time.perf_counter() - began
+    while (await client.get("/ready")).status_code != 200:
+        await asyncio.sleep(0.001)
+    return {
+        "startup_seconds": startup_seconds,
+        "ready_seconds": time.perf_counter() - began,
+        "warmup": dict(main.warmup_status),
+    }
+
+
+async def drive(app, scenarios, codes, total, concurrency, skew, seed_value):
+    rng = random.Random(seed_value)
+    transport = httpx.ASGITransport(app=app)
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        startup = await start(client)
+        try:
+            for scenario in scenarios:
+                requests = build_requests(scenario, codes, total, skew, rng)
+                results[scenario] = await run_scenario(client, requests, concurrency)
+        finally:
+            await main.shutdown_event()
+    return startup, results
+
+
+def run(
+    codes, total, concurrency, skew, scenarios, app_name="app", seed_value=0, backend="sqlite", warmup_codes=0
+):
+    directory = tempfile.mkdtemp()
+    try:
+        main.STORAGE_BACKEND = backend
+        main.DATABASE = os.path.join(directory, "urls.db")
+        main.LOG_STORE_DIR = os.path.join(directory, "logstore")
+        main.init_db()
+        start = time.perf_counter()
+        seed(main.storage, codes)
+        seed_seconds = time.perf_counter() - start
+
+        # Zipf rank order: the lowest code indexes get the most traffic
+        main.WARMUP_CODES = warmup_codes
+        main.WARMUP_FILE = os.path.join(directory, "hot.json")
+        save_hot_codes(main.WARMUP_FILE, [{"code": f"c{i}", "clicks": 0} for i in range(min(warmup_codes, codes))])
+
+        app = getattr(main, app_name)
+        startup, results = asyncio.run(drive(app, scenarios, codes, total, concurrency, skew, seed_value))
+        return {
+            "config": {
+                "codes": codes,
+                "requests": total,
+                "concurrency": concurrency,
+                "zipf_s": skew,
+                "app": app_name,
+                "storage": backend,
+                "seed": seed_value,
+                "cache_size": main.url_cache.max_size,
+                "db_pool_size": main.DB_POOL_SIZE,
+                "db_readers": main.DB_READERS,
+                "warmup_codes": warmup_codes,
+            },
+            "environment": {
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+            },
+            "seed_seconds": seed_seconds,
+            "startup": startup,
+            "results": results,
+            "cache": main.url_cache.stats(),
+        }
+    finally:
+        main.storage.close()
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--codes", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=10_000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="key skew; 0 is uniform")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--app", choices=("app", "fast_app"), default="app")
+    parser.add_argument("--storage", choices=("sqlite", "log", "memory"), default="sqlite")
+    parser.add_argument("--warmup-codes", type=int, default=0, help="hottest codes to preload before ready")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    report = run(
+        args.codes,
+        args.requests,
+        args.concurrency,
+        args.zipf_s,
+        scenarios,
+        args.app,
+        args.seed,
+        args.storage,
+        args.warmup_codes,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
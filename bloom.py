@@ -0,0 +1,65 @@
+import hashlib
+import math
+
+
+class CountingBloomFilter:
+    """Probabilistic set of codes that supports removal
+
+    A lookup that returns False is definite: the code was never added (or was
+    removed). True means "probably present". Each slot is an 8-bit counter
+    rather than a bit so deletes can be applied; a counter that reaches 255
+    sticks there, which can only cause extra false positives, never false
+    negatives.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._counters = bytearray(self.size)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        # Odd step so successive probes don't collapse onto the same slot
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        counters = self._counters
+        for position in self._positions(item):
+            if counters[position] < 255:
+                counters[position] += 1
+        self.count += 1
+
+    def remove(self, item):
+        """Remove an item that was added; unknown items are ignored"""
+        positions = self._positions(item)
+        counters = self._counters
+        if not all(counters[position] for position in positions):
+            return
+        for position in positions:
+            if counters[position] < 255:
+                counters[position] -= 1
+        self.count -= 1
+
+    def __contains__(self, item):
+        counters = self._counters
+        return all(counters[position] for position in self._positions(item))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def memory_bytes(self):
+        return len(self._counters)
+
+    def expected_false_positive_rate(self):
+        """Theoretical false positive rate at the current fill"""
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
@@ -0,0 +1,51 @@
+import pytest
+
+from bloom import CountingBloomFilter
+
+
+class TestCountingBloomFilter:
+    """Tests for the counting Bloom filter over codes"""
+
+    def test_added_items_are_present(self):
+        bloom = CountingBloomFilter(1000)
+        codes = [f"code{i}" for i in range(1000)]
+        for code in codes:
+            bloom.add(code)
+        assert all(code in bloom for code in codes)
+        assert len(bloom) == 1000
+
+    def test_false_positive_rate_near_target(self):
+        bloom = CountingBloomFilter(10_000, error_rate=0.01)
+        for i in range(10_000):
+            bloom.add(f"present{i}")
+        false_positives = sum(f"absent{i}" in bloom for i in range(10_000))
+        assert false_positives / 10_000 < 0.02
+        assert bloom.expected_false_positive_rate() == pytest.approx(0.01, rel=0.2)
+
+    def test_remove(self):
+        bloom = CountingBloomFilter(100)
+        bloom.add("a")
+        bloom.add("b")
+        bloom.remove("a")
+        assert "a" not in bloom
+        assert "b" in bloom
+        assert len(bloom) == 1
+
+    def test_remove_unknown_item_is_ignored(self):
+        bloom = CountingBloomFilter(100)
+        bloom.add("a")
+        bloom.remove("never-added")
+        assert "a" in bloom
+        assert len(bloom) == 1
+
+    def test_memory_footprint(self):
+        bloom = CountingBloomFilter(100_000, error_rate=0.01)
+        # About 9.6 one-byte counters per item at 1%
+        assert 900_000 < bloom.memory_bytes < 1_000_000
+        assert bloom.hash_count == 7
+
+    def test_rejects_bad_parameters(self):
+        with pytest.raises(ValueError):
+            CountingBloomFilter(0)
+        with pytest.raises(ValueError):
+            CountingBloomFilter(100, error_rate=1.5)
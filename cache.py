@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class URLCache:
+    """Bounded in-memory cache of redirects with LRU eviction and optional TTL
+
+    Values are the ``policy.Redirect`` of each code, so a hit carries the
+    status and caching headers as well as the URL.
+    """
+
+    def __init__(self, max_size=10_000, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped on every invalidation so a lookup that raced with a write
+        # can avoid caching the value it read before the write committed
+        self.version = 0
+
+    def get(self, code, count_miss=True):
+        """Return the cached Redirect for a code, or None on a miss
+
+        Callers that fall through to another cache lookup on a miss pass
+        ``count_miss=False`` so the miss is only counted once.
+        """
+        with self._lock:
+            entry = self._entries.get(code)
+            if entry is None:
+                self.misses += count_miss
+                return None
+            redirect, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[code]
+                self.misses += count_miss
+                return None
+            self._entries.move_to_end(code)
+            self.hits += 1
+            return redirect
+
+    def set(self, code, redirect, version=None):
+        """Store a Redirect, evicting the least recently used entries if full
+
+        When ``version`` is given the entry is only stored if nothing has been
+        invalidated since that version was read.
+        """
+        if self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._entries[code] = (redirect, expires_at)
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, code):
+        """Drop a single code from the cache"""
+        with self._lock:
+            self._entries.pop(code, None)
+            self.version += 1
+
+    def invalidate_all(self):
+        """Drop every entry, keeping the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.version += 1
+
+    def clear(self):
+        """Drop every entry and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.version += 1
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Counters used to size the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
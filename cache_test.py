@@ -0,0 +1,74 @@
+from unittest.mock import patch
+
+from cache import URLCache
+
+
+class TestURLCache:
+    """Tests for the redirect cache"""
+
+    def test_get_miss_then_hit(self):
+        cache = URLCache(max_size=10)
+        assert cache.get("a") is None
+        cache.set("a", "https://a.com")
+        assert cache.get("a") == "https://a.com"
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_evicts_least_recently_used(self):
+        cache = URLCache(max_size=2)
+        cache.set("a", "https://a.com")
+        cache.set("b", "https://b.com")
+        # Touch "a" so "b" becomes the eviction candidate
+        cache.get("a")
+        cache.set("c", "https://c.com")
+        assert cache.get("b") is None
+        assert cache.get("a") == "https://a.com"
+        assert cache.get("c") == "https://c.com"
+        assert cache.evictions == 1
+        assert len(cache) == 2
+
+    def test_ttl_expiry(self):
+        cache = URLCache(max_size=10, ttl=5)
+        with patch("cache.time.monotonic", return_value=100.0):
+            cache.set("a", "https://a.com")
+        with patch("cache.time.monotonic", return_value=104.0):
+            assert cache.get("a") == "https://a.com"
+        with patch("cache.time.monotonic", return_value=105.0):
+            assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_invalidate(self):
+        cache = URLCache(max_size=10)
+        cache.set("a", "https://a.com")
+        cache.invalidate("a")
+        cache.invalidate("missing")
+        assert cache.get("a") is None
+
+    def test_zero_size_disables_cache(self):
+        cache = URLCache(max_size=0)
+        cache.set("a", "https://a.com")
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_stats(self):
+        cache = URLCache(max_size=1)
+        cache.set("a", "https://a.com")
+        cache.set("b", "https://b.com")
+        cache.get("b")
+        cache.get("a")
+        stats = cache.stats()
+        assert stats["size"] == 1
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["evictions"] == 1
+        assert stats["hit_ratio"] == 0.5
+
+    def test_set_skipped_after_concurrent_invalidation(self):
+        cache = URLCache(max_size=10)
+        version = cache.version
+        # A write invalidates the code while the lookup is in flight
+        cache.invalidate("a")
+        cache.set("a", "https://stale.com", version=version)
+        assert cache.get("a") is None
+        cache.set("a", "https://fresh.com", version=cache.version)
+        assert cache.get("a") == "https://fresh.com"
@@ -0,0 +1,95 @@
+"""URL normalization and digests for deduplicated creation
+
+URLs that differ only where no server can tell them apart (the case of the
+scheme, host and percent escapes, a default port, an empty path) normalize
+to the same string. Backends index a 64-bit digest of it, which keeps the
+index small however long the URLs are; candidates are still compared in
+full, so a digest collision never merges different URLs.
+"""
+
+import hashlib
+import re
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+ESCAPE = re.compile(r"%[0-9a-f]{2}", re.IGNORECASE)
+
+
+def normalize_url(url):
+    """The normalized form of ``url``; unparseable URLs are returned as they are"""
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc
+    if parts.hostname is not None:
+        host = f"[{parts.hostname}]" if ":" in parts.hostname else parts.hostname
+        if port is not None and port != DEFAULT_PORTS.get(scheme):
+            host = f"{host}:{port}"
+        userinfo, at, _ = netloc.rpartition("@")
+        netloc = userinfo + at + host
+    path = parts.path or ("/" if netloc else "")
+    path, query, fragment = (
+        ESCAPE.sub(lambda match: match.group().upper(), part) for part in (path, parts.query, parts.fragment)
+    )
+    return urlunsplit((scheme, netloc, path, query, fragment))
+
+
+def url_digest(url):
+    """Signed 64-bit digest of the normalized URL, to fit an SQLite INTEGER"""
+    digest = hashlib.blake2b(normalize_url(url).encode("utf-8", "surrogatepass"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class DigestIndex:
+    """In-memory url_digest -> codes map, for backends without a database index
+
+    A digest maps to its one code, or to a tuple once several codes share it,
+    so the common case costs a single dict entry.
+    """
+
+    def __init__(self, entries=()):
+        self._codes = {}
+        for code, url in entries:
+            self.add(code, url)
+
+    def __len__(self):
+        return len(self._codes)
+
+    def add(self, code, url):
+        digest = url_digest(url)
+        codes = self._codes.get(digest)
+        if codes is None:
+            self._codes[digest] = code
+        elif isinstance(codes, str):
+            self._codes[digest] = (codes, code)
+        else:
+            self._codes[digest] = (*codes, code)
+
+    def discard(self, code, url):
+        digest = url_digest(url)
+        codes = self._codes.get(digest)
+        if codes == code:
+            del self._codes[digest]
+        elif isinstance(codes, tuple):
+            rest = tuple(other for other in codes if other != code)
+            self._codes[digest] = rest[0] if len(rest) == 1 else rest
+
+    def replace(self, code, old_url, new_url):
+        """Move ``code`` from ``old_url`` to ``new_url``; either may be None"""
+        if old_url == new_url:
+            return
+        if old_url is not None:
+            self.discard(code, old_url)
+        if new_url is not None:
+            self.add(code, new_url)
+
+    def candidates(self, url):
+        """Codes whose URL may normalize like ``url``, in code order"""
+        codes = self._codes.get(url_digest(url))
+        if codes is None:
+            return []
+        return [codes] if isinstance(codes, str) else sorted(codes)
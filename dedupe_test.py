@@ -0,0 +1,38 @@
+from dedupe import DigestIndex, normalize_url, url_digest
+
+
+class TestNormalizeURL:
+    """Tests for URL normalization and digests"""
+
+    def test_equivalent_urls_normalize_alike(self):
+        for url in ("HTTPS://Example.COM", "https://example.com:443", "https://example.com/"):
+            assert normalize_url(url) == "https://example.com/"
+        assert normalize_url("http://[::1]:80/a%2fb?q=%7e#x%3a") == "http://[::1]/a%2Fb?q=%7E#x%3A"
+        assert normalize_url("https://User:Pw@Ex.com:8443/Path") == "https://User:Pw@ex.com:8443/Path"
+
+    def test_distinct_urls_stay_distinct(self):
+        urls = ("https://example.com/", "http://example.com/", "https://example.com/A", "https://example.com/?a")
+        assert len({normalize_url(url) for url in urls}) == len(urls)
+        assert normalize_url("https://a.com:99999/") == "https://a.com:99999/"
+        assert normalize_url("mailto:x@y.com") == "mailto:x@y.com"
+
+    def test_digest(self):
+        assert url_digest("HTTPS://Example.com") == url_digest("https://example.com/")
+        assert url_digest("https://example.com/") != url_digest("https://example.com/a")
+        assert -(2**63) <= url_digest("https://\ud800.com") < 2**63
+
+
+class TestDigestIndex:
+    """Tests for the in-memory digest -> codes map"""
+
+    def test_candidates_follow_changes(self):
+        index = DigestIndex([("b", "https://a.com"), ("a", "https://A.com/"), ("c", "https://c.com")])
+        assert index.candidates("https://a.com:443") == ["a", "b"]
+        index.replace("a", "https://A.com/", "https://c.com")
+        assert index.candidates("https://a.com") == ["b"]
+        assert index.candidates("https://c.com") == ["a", "c"]
+        index.replace("b", "https://a.com", None)
+        index.discard("c", "https://c.com")
+        assert index.candidates("https://a.com") == []
+        assert index.candidates("https://c.com") == ["a"]
+        assert len(index) == 1
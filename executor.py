@@ -0,0 +1,47 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DBOverloaded(Exception):
+    """Raised when too many database calls are already queued"""
+
+
+class DBExecutor:
+    """Runs blocking sqlite3 calls off the event loop
+
+    Reads go to a small thread pool. Writes go to a single dedicated thread, so
+    SQLite writers never contend with each other, and a slow write (a lock wait
+    or a WAL checkpoint) only delays other writes, not reads. The number of
+    queued calls is bounded: once ``max_pending`` calls are in flight new ones
+    fail fast with DBOverloaded instead of piling up.
+    """
+
+    def __init__(self, readers=4, max_pending=1024):
+        self.readers = readers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._read = ThreadPoolExecutor(readers, thread_name_prefix="db-read")
+        self._write = ThreadPoolExecutor(1, thread_name_prefix="db-write")
+
+    async def _submit(self, executor, fn, args, kwargs):
+        if self.pending >= self.max_pending:
+            raise DBOverloaded(f"{self.pending} database calls already queued")
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    async def run_read(self, fn, *args, **kwargs):
+        """Run a read-only call on the reader pool"""
+        return await self._submit(self._read, fn, args, kwargs)
+
+    async def run_write(self, fn, *args, **kwargs):
+        """Run a mutating call on the single writer thread"""
+        return await self._submit(self._write, fn, args, kwargs)
+
+    def shutdown(self):
+        self._read.shutdown(wait=True)
+        self._write.shutdown(wait=True)
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import pytest
+
+from executor import DBExecutor, DBOverloaded
+
+
+class TestDBExecutor:
+    """Tests for the database thread executor"""
+
+    def test_calls_run_off_the_event_loop_thread(self):
+        executor = DBExecutor(readers=2)
+
+        async def scenario():
+            return await executor.run_read(threading.get_ident)
+
+        assert asyncio.run(scenario()) != threading.get_ident()
+        executor.shutdown()
+
+    def test_writes_share_one_thread(self):
+        executor = DBExecutor(readers=2)
+
+        async def scenario():
+            return await asyncio.gather(
+                *(executor.run_write(threading.get_ident) for _ in range(5))
+            )
+
+        assert len(set(asyncio.run(scenario()))) == 1
+        executor.shutdown()
+
+    def test_reads_proceed_while_a_write_is_blocked(self):
+        executor = DBExecutor(readers=2)
+        release = threading.Event()
+
+        async def scenario():
+            write = asyncio.ensure_future(executor.run_write(release.wait, 5))
+            read = await asyncio.wait_for(executor.run_read(lambda: "read"), 1)
+            assert not write.done()
+            release.set()
+            await write
+            return read
+
+        assert asyncio.run(scenario()) == "read"
+        executor.shutdown()
+
+    def test_rejects_calls_beyond_max_pending(self):
+        executor = DBExecutor(readers=1, max_pending=1)
+        release = threading.Event()
+
+        async def scenario():
+            blocked = asyncio.ensure_future(executor.run_read(release.wait, 5))
+            await asyncio.sleep(0)
+            with pytest.raises(DBOverloaded):
+                await executor.run_read(lambda: None)
+            release.set()
+            await blocked
+            assert executor.pending == 0
+
+        asyncio.run(scenario())
+        executor.shutdown()
+
+    def test_exceptions_propagate(self):
+        executor = DBExecutor()
+
+        def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            asyncio.run(executor.run_write(fail))
+        assert executor.pending == 0
+        executor.shutdown()
@@ -0,0 +1,109 @@
+"""Stream the urls table as NDJSON or CSV, optionally gzip-compressed
+
+Usable as a library (see ``iter_export``) and as a command line tool:
+
+    python export.py --format csv --gzip --output urls.csv.gz
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+
+from pool import connect
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Bookkeeping that means nothing outside this database
+INTERNAL_COLUMNS = {"search_id", "url_digest"}
+
+
+def iter_rows(conn, chunk_size=1000):
+    """Yield the column names, then lists of up to ``chunk_size`` rows
+
+    A single cursor walks the table in primary key order and rows are pulled
+    with fetchmany, so only one chunk is ever held in memory. Columns come from
+    the table itself, so anything added to the schema is exported as well,
+    except ``INTERNAL_COLUMNS``.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(urls)") if row[1] not in INTERNAL_COLUMNS]
+    cursor = conn.execute(f"SELECT {', '.join(columns)} FROM urls ORDER BY code")
+    yield columns
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+def iter_ndjson(rows):
+    columns = next(rows)
+    for chunk in rows:
+        yield "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in chunk).encode()
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(next(rows))
+    for chunk in rows:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when the table is empty
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of byte chunks into a single gzip member"""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode_rows(rows, fmt="ndjson", compress=False):
+    """Encode column names followed by chunks of rows (as from ``iter_rows``) as ``fmt``"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt!r}")
+    chunks = iter_ndjson(rows) if fmt == "ndjson" else iter_csv(rows)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def iter_export(conn, fmt="ndjson", compress=False, chunk_size=1000):
+    """Yield the urls table encoded as ``fmt``, gzip-compressed if requested"""
+    return encode_rows(iter_rows(conn, chunk_size), fmt, compress)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the urls table")
+    parser.add_argument("--database", default="urls.db")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("--gzip", action="store_true", help="gzip-compress the output")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--output", help="output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    conn = connect(args.database, readonly=True)
+    try:
+        chunks = iter_export(conn, args.format, args.gzip, args.chunk_size)
+        if args.output:
+            with open(args.output, "wb") as out:
+                out.writelines(chunks)
+        else:
+            sys.stdout.buffer.writelines(chunks)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
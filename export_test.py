@@ -0,0 +1,70 @@
+import csv
+import gzip
+import io
+import json
+import sqlite3
+
+import pytest
+
+from export import iter_export, main
+
+
+@pytest.fixture
+def conn():
+    """In-memory database with the urls schema"""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE urls (code TEXT PRIMARY KEY, url TEXT NOT NULL)")
+    conn.executemany(
+        "INSERT INTO urls (code, url) VALUES (?, ?)",
+        [("b", "https://b.com"), ("a", "https://a.com/?x=1,2"), ("c", "https://c.com")],
+    )
+    yield conn
+    conn.close()
+
+
+class TestExport:
+    """Tests for streaming table exports"""
+
+    def test_ndjson_in_code_order(self, conn):
+        data = b"".join(iter_export(conn, "ndjson", chunk_size=2)).decode()
+        records = [json.loads(line) for line in data.splitlines()]
+        assert records == [
+            {"code": "a", "url": "https://a.com/?x=1,2"},
+            {"code": "b", "url": "https://b.com"},
+            {"code": "c", "url": "https://c.com"},
+        ]
+
+    def test_csv_has_header_and_quotes_values(self, conn):
+        data = b"".join(iter_export(conn, "csv", chunk_size=2)).decode()
+        rows = list(csv.reader(io.StringIO(data)))
+        assert rows[0] == ["code", "url"]
+        assert rows[1] == ["a", "https://a.com/?x=1,2"]
+        assert len(rows) == 4
+
+    def test_csv_empty_table_has_header(self, conn):
+        conn.execute("DELETE FROM urls")
+        data = b"".join(iter_export(conn, "csv")).decode()
+        assert data.strip() == "code,url"
+
+    def test_gzip(self, conn):
+        data = gzip.decompress(b"".join(iter_export(conn, "ndjson", compress=True)))
+        assert len(data.splitlines()) == 3
+
+    def test_unknown_format(self, conn):
+        with pytest.raises(ValueError):
+            iter_export(conn, "xml")
+
+    def test_cli_writes_file(self, tmp_path):
+        database = tmp_path / "urls.db"
+        conn = sqlite3.connect(database)
+        conn.execute("CREATE TABLE urls (code TEXT PRIMARY KEY, url TEXT NOT NULL)")
+        conn.execute("INSERT INTO urls VALUES ('a', 'https://a.com')")
+        conn.commit()
+        conn.close()
+
+        output = tmp_path / "urls.csv.gz"
+        main(["--database", str(database), "--format", "csv", "--gzip", "--output", str(output)])
+        assert gzip.decompress(output.read_bytes()).decode().splitlines() == [
+            "code,url",
+            "a,https://a.com",
+        ]
@@ -0,0 +1,57 @@
+from functools import lru_cache
+from urllib.parse import quote
+
+
+@lru_cache(maxsize=65536)
+def redirect_headers(redirect):
+    """Pre-encoded headers for a ``policy.Redirect``, matching RedirectResponse"""
+    location = quote(redirect.url, safe=":/%#?=@[]!$&'()*+,;")
+    headers = [(b"location", location.encode("latin-1")), (b"content-length", b"0")]
+    cache_control = redirect.cache_control()
+    if cache_control is not None:
+        headers.append((b"cache-control", cache_control.encode("latin-1")))
+    return headers
+
+
+class FastRedirectApp:
+    """Raw ASGI app that answers cache-hit redirects ahead of FastAPI
+
+    ``GET /{code}`` requests whose code is in the redirect cache are answered
+    here with pre-encoded header bytes, skipping routing, dependency resolution
+    and response object construction. Everything else, including cache misses,
+    falls through to the wrapped app. The cache is filled by resolve and by
+    startup warmup, which leaves out codes that name one of the app's own
+    routes, so a hit always corresponds to a request the wrapped app would
+    have redirected.
+
+    ``poll``, if given, is called before each lookup so invalidations published
+    by other worker processes reach the cache first. ``on_hit(code, headers)``,
+    if given, is called for every redirect answered here.
+    """
+
+    def __init__(self, app, cache, poll=None, on_hit=None):
+        self.app = app
+        self.cache = cache
+        self.poll = poll
+        self.on_hit = on_hit
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "GET":
+            code = scope["path"][1:]
+            if code and "/" not in code:
+                if self.poll is not None:
+                    self.poll()
+                redirect = self.cache.get(code, count_miss=False)
+                if redirect is not None:
+                    if self.on_hit is not None:
+                        self.on_hit(code, scope["headers"])
+                    await send(
+                        {
+                            "type": "http.response.start",
+                            "status": redirect.status,
+                            "headers": redirect_headers(redirect),
+                        }
+                    )
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+        await self.app(scope, receive, send)
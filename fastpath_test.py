@@ -0,0 +1,60 @@
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse
+
+from cache import URLCache
+from fastpath import FastRedirectApp, redirect_headers
+from policy import Redirect
+
+
+async def fallback_app(scope, receive, send):
+    """Stand-in for the FastAPI app that records it was reached"""
+    response = PlainTextResponse("fallback")
+    await response(scope, receive, send)
+
+
+class TestFastRedirectApp:
+    """Tests for the raw ASGI redirect fast path"""
+
+    def test_cache_hit_answered_directly(self):
+        cache = URLCache()
+        cache.set("abc", Redirect("https://example.com/path?q=1"))
+        client = TestClient(FastRedirectApp(fallback_app, cache))
+        response = client.get("/abc", follow_redirects=False)
+        assert response.status_code == 302
+        assert response.headers["location"] == "https://example.com/path?q=1"
+        assert response.content == b""
+
+    def test_cache_miss_falls_through(self):
+        cache = URLCache()
+        client = TestClient(FastRedirectApp(fallback_app, cache))
+        response = client.get("/abc", follow_redirects=False)
+        assert response.text == "fallback"
+        # The fall-through lookup is left for the wrapped app to count
+        assert cache.misses == 0
+
+    def test_other_requests_fall_through(self):
+        cache = URLCache()
+        cache.set("abc", Redirect("https://example.com"))
+        client = TestClient(FastRedirectApp(fallback_app, cache))
+        assert client.post("/abc").text == "fallback"
+        assert client.get("/abc/more").text == "fallback"
+        assert client.get("/").text == "fallback"
+
+    def test_headers_match_redirect_response(self):
+        from fastapi.responses import RedirectResponse
+
+        url = "https://example.com/a b?x=ü"
+        expected = RedirectResponse(url, status_code=302).raw_headers
+        assert sorted(redirect_headers(Redirect(url))) == sorted(expected)
+        expected = RedirectResponse(
+            url, status_code=308, headers={"cache-control": "public, max-age=60, immutable"}
+        ).raw_headers
+        assert sorted(redirect_headers(Redirect(url, 308, 60, True))) == sorted(expected)
+
+    def test_policy_sets_status_and_cache_control(self):
+        cache = URLCache()
+        cache.set("abc", Redirect("https://example.com", 301, 3600))
+        client = TestClient(FastRedirectApp(fallback_app, cache))
+        response = client.get("/abc", follow_redirects=False)
+        assert response.status_code == 301
+        assert response.headers["cache-control"] == "public, max-age=3600"
@@ -0,0 +1,57 @@
+import threading
+
+ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+
+def base62_encode(value):
+    """Encode a non-negative integer with digits, then upper and lower case letters"""
+    if value < 0:
+        raise ValueError("Cannot encode a negative number")
+    if value == 0:
+        return ALPHABET[0]
+    digits = []
+    while value:
+        value, remainder = divmod(value, 62)
+        digits.append(ALPHABET[remainder])
+    return "".join(reversed(digits))
+
+
+class BlockAllocator:
+    """Hands out unique integers from blocks leased from a shared counter
+
+    ``lease(size)`` must atomically reserve ``size`` values from the shared
+    counter and return the first one. Each process leases its own blocks, so
+    allocation is an in-memory increment and only every ``block_size``-th call
+    needs a refill. Values left in a block when the process exits are skipped.
+    """
+
+    def __init__(self, lease, block_size=1000):
+        self.lease = lease
+        self.block_size = block_size
+        self.leases = 0
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Return the next value, or None when the current block is used up"""
+        with self._lock:
+            if self._next >= self._end:
+                return None
+            value = self._next
+            self._next += 1
+            return value
+
+    def refill(self):
+        """Lease a new block if the current one is used up (blocking)"""
+        with self._lock:
+            if self._next < self._end:
+                return
+            start = self.lease(self.block_size)
+            self._next, self._end = start, start + self.block_size
+            self.leases += 1
+
+    def reset(self):
+        """Forget the current block, e.g. after switching databases"""
+        with self._lock:
+            self._next = self._end = 0
@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from ids import BlockAllocator, base62_encode
+
+
+class TestBase62:
+    """Tests for base62 code encoding"""
+
+    def test_known_values(self):
+        assert base62_encode(0) == "0"
+        assert base62_encode(61) == "z"
+        assert base62_encode(62) == "10"
+        assert base62_encode(62**3) == "1000"
+
+    def test_rejects_negative(self):
+        with pytest.raises(ValueError):
+            base62_encode(-1)
+
+
+class TestBlockAllocator:
+    """Tests for the block-leasing ID allocator"""
+
+    def make_counter(self):
+        counter = {"next": 100}
+        lock = threading.Lock()
+
+        def lease(size):
+            with lock:
+                start = counter["next"]
+                counter["next"] += size
+                return start
+
+        return lease
+
+    def test_take_requires_refill(self):
+        allocator = BlockAllocator(self.make_counter(), block_size=3)
+        assert allocator.take() is None
+        allocator.refill()
+        assert [allocator.take() for _ in range(4)] == [100, 101, 102, None]
+        allocator.refill()
+        assert allocator.take() == 103
+        assert allocator.leases == 2
+
+    def test_refill_is_noop_while_block_remains(self):
+        allocator = BlockAllocator(self.make_counter(), block_size=3)
+        allocator.refill()
+        allocator.refill()
+        assert allocator.leases == 1
+
+    def test_processes_never_share_values(self):
+        lease = self.make_counter()
+        workers = [BlockAllocator(lease, block_size=5) for _ in range(3)]
+        values = []
+        for _ in range(20):
+            for worker in workers:
+                value = worker.take()
+                if value is None:
+                    worker.refill()
+                    value = worker.take()
+                values.append(value)
+        assert len(values) == len(set(values))
+
+    def test_reset_drops_current_block(self):
+        allocator = BlockAllocator(self.make_counter(), block_size=3)
+        allocator.refill()
+        allocator.reset()
+        assert allocator.take() is None
@@ -0,0 +1,583 @@
+import array
+import bisect
+import fcntl
+import itertools
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from contextlib import contextmanager
+
+from dedupe import DigestIndex
+from policy import Redirect, decode_redirect, encode_redirect
+from storage import CodeExists, Storage, matching_code
+
+# Log file: a header, then records appended one after another. Each record is
+# crc32 of the rest, op, code length, URL length, code bytes and URL bytes.
+# The URL bytes carry the redirect policy too (see ``policy.encode_redirect``).
+LOG_MAGIC = b"ULOG"
+LOG_HEADER = struct.Struct("<4sH8s")  # magic, version, log id
+RECORD = struct.Struct("<IBHI")  # crc32, op, code length, url length
+
+# Index file: a header, fixed-size entries sorted by code (for scans), an
+# open-addressing hash table of entry numbers (for lookups), then the code bytes
+INDEX_MAGIC = b"ULIX"
+INDEX_HEADER = struct.Struct("<4sH8sQQQ")  # magic, version, log id, count, log end, slots
+INDEX_ENTRY = struct.Struct("<QHQI")  # code offset, code length, url offset, url length
+INDEX_SLOT = struct.Struct("<I")  # entry number + 1, or 0 when empty
+
+VERSION = 1
+OP_PUT = 1
+OP_DELETE = 2
+
+
+class LogStoreError(Exception):
+    """Raised for a log or index file that can't be used"""
+
+
+def encode_record(op, code, url=b""):
+    payload = struct.pack("<BHI", op, len(code), len(url)) + code + url
+    return struct.pack("<I", zlib.crc32(payload)) + payload
+
+
+def iter_records(data, position):
+    """Yield (op, code, url, end) for each intact record in ``data`` from ``position``
+
+    Stops at the first record that is cut short or fails its checksum, which is
+    what a crash in the middle of an append leaves behind.
+    """
+    size = len(data)
+    while position + RECORD.size <= size:
+        crc, op, code_length, url_length = RECORD.unpack_from(data, position)
+        code_start = position + RECORD.size
+        end = code_start + code_length + url_length
+        if end > size or zlib.crc32(data[position + 4:end]) != crc:
+            return
+        yield op, bytes(data[code_start:code_start + code_length]), bytes(data[code_start + code_length:end]), end
+        position = end
+
+
+def write_index(path, entries, log_id, log_end):
+    """Atomically write an index of sorted (code bytes, url offset, url length) entries"""
+    # At most half full, so probes stay short
+    slots = 1 << max(1, (2 * len(entries)).bit_length())
+    table = array.array("I", bytes(4 * slots))
+    for number, (code, _, _) in enumerate(entries):
+        slot = zlib.crc32(code) & (slots - 1)
+        while table[slot]:
+            slot = (slot + 1) & (slots - 1)
+        table[slot] = number + 1
+    if sys.byteorder != "little":
+        table.byteswap()
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, VERSION, log_id, len(entries), log_end, slots))
+        code_offset = INDEX_HEADER.size + INDEX_ENTRY.size * len(entries) + INDEX_SLOT.size * slots
+        for code, url_offset, url_length in entries:
+            f.write(INDEX_ENTRY.pack(code_offset, len(code), url_offset, url_length))
+            code_offset += len(code)
+        f.write(table.tobytes())
+        for code, _, _ in entries:
+            f.write(code)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def map_file(path, length=0):
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ)
+
+
+class LogIndex:
+    """Read-only, memory-mapped index of code -> URL position in the log"""
+
+    def __init__(self, path):
+        try:
+            self._map = map_file(path)
+        except ValueError:
+            raise LogStoreError(f"{path} is empty") from None
+        if len(self._map) < INDEX_HEADER.size:
+            raise LogStoreError(f"{path} is truncated")
+        magic, version, self.log_id, self.count, self.log_end, self.slots = INDEX_HEADER.unpack_from(self._map)
+        if magic != INDEX_MAGIC or version != VERSION:
+            raise LogStoreError(f"{path} is not a version {VERSION} index")
+        self._table = INDEX_HEADER.size + self.count * INDEX_ENTRY.size
+        if len(self._map) < self._table + self.slots * INDEX_SLOT.size:
+            raise LogStoreError(f"{path} is truncated")
+
+    def entry(self, position):
+        code_offset, code_length, url_offset, url_length = INDEX_ENTRY.unpack_from(
+            self._map, INDEX_HEADER.size + position * INDEX_ENTRY.size
+        )
+        return self._map[code_offset:code_offset + code_length], url_offset, url_length
+
+    def code(self, position):
+        return self.entry(position)[0]
+
+    def bisect_right(self, code):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if code < self.code(middle):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def find(self, code):
+        """Return (url offset, url length) for ``code`` bytes, or None"""
+        data = self._map
+        mask = self.slots - 1
+        slot = zlib.crc32(code) & mask
+        while True:
+            (number,) = INDEX_SLOT.unpack_from(data, self._table + slot * INDEX_SLOT.size)
+            if not number:
+                return None
+            code_offset, code_length, url_offset, url_length = INDEX_ENTRY.unpack_from(
+                data, INDEX_HEADER.size + (number - 1) * INDEX_ENTRY.size
+            )
+            if data[code_offset:code_offset + code_length] == code:
+                return url_offset, url_length
+            slot = (slot + 1) & mask
+
+    def close(self):
+        self._map.close()
+
+
+class LogState:
+    """One generation of the store: an index, the log it points into, and later changes
+
+    ``delta`` maps codes changed since the index was written to their
+    Redirect, or None once deleted; ``keys`` holds the same codes sorted for
+    scans.
+    """
+
+    def __init__(self, index, log, delta, keys):
+        self.index = index
+        self.log = log
+        self.delta = delta
+        self.keys = keys
+
+
+def merge_entries(state, delta, keys, after=None):
+    """Yield live (code, Redirect) pairs in code order, changes in ``delta`` overriding the index"""
+    index = state.index
+    i = 0 if after is None else bisect.bisect_right(keys, after)
+    position = 0 if after is None else index.bisect_right(after.encode())
+    while True:
+        changed = keys[i] if i < len(keys) else None
+        code = index.code(position).decode() if position < index.count else None
+        if changed is None and code is None:
+            return
+        if code is None or (changed is not None and changed <= code):
+            i += 1
+            if changed == code:
+                position += 1
+            redirect = delta[changed]
+            if redirect is not None:
+                yield changed, redirect
+        else:
+            _, url_offset, url_length = index.entry(position)
+            position += 1
+            yield code, decode_redirect(state.log[url_offset:url_offset + url_length])
+
+
+class LogBatch:
+    """Writes collected under the store's write lock and appended in one go"""
+
+    def __init__(self, store):
+        self.store = store
+        self.pending = {}
+        self.records = []
+        self.live = 0
+
+    def _current(self, code):
+        if code in self.pending:
+            return self.pending[code]
+        return self.store.get_redirect(code)
+
+    def _write(self, code, redirect):
+        self.pending[code] = redirect
+        self.records.append(encode_record(OP_PUT, code.encode(), encode_redirect(redirect)))
+
+    def put(self, code, url, status=302, max_age=None, immutable=False):
+        if self._current(code) is not None:
+            raise CodeExists(code)
+        self._write(code, Redirect(url, status, max_age, immutable))
+        self.live += 1
+
+    def put_many(self, entries):
+        created = []
+        for code, *target in entries:
+            try:
+                self.put(code, *target)
+            except CodeExists:
+                created.append(False)
+            else:
+                created.append(True)
+        return created
+
+    def update(self, code, url, policy=None):
+        redirect = self._current(code)
+        if redirect is None:
+            return False
+        self._write(code, redirect._replace(url=url) if policy is None else Redirect(url, *policy))
+        return True
+
+    def delete(self, code):
+        if self._current(code) is None:
+            return False
+        self.pending[code] = None
+        self.records.append(encode_record(OP_DELETE, code.encode()))
+        self.live -= 1
+        return True
+
+
+class LogStorage(Storage):
+    """Append-only log of code -> URL records with a memory-mapped sorted index
+
+    Every write is appended to ``data.log``; nothing is rewritten in place.
+    ``index.bin`` maps codes to URL positions in the log and is memory-mapped,
+    as is the log itself, so a lookup is a hash probe in the mapped index
+    followed by a slice of the mapped log, with no locks, connections or SQL.
+    The index also keeps entries in code order for scans.
+    Changes made since the index was written live in an in-memory overlay.
+    A url_digest index for ``find_code`` is built in memory on first use and
+    kept up to date by every write from then on.
+
+    Once the overlay passes ``max_delta`` codes, a background thread compacts:
+    it writes a new log holding only live entries, in code order, and a new
+    index, copies over anything appended meanwhile, and swaps both in. Writers
+    are only blocked for that final copy and swap; readers never are.
+
+    A record that was cut short by a crash is dropped when the store is
+    opened. Writes reach the OS on every call but are only fsynced with
+    ``sync=True``. A single process owns the store: ``init`` takes an
+    exclusive lock on ``lock`` in the directory and fails if another process
+    holds it. Click analytics stay in memory.
+    """
+
+    def __init__(self, directory, max_delta=100_000, sync=False):
+        super().__init__()
+        self.directory = directory
+        self.log_path = os.path.join(directory, "data.log")
+        self.index_path = os.path.join(directory, "index.bin")
+        self.counter_path = os.path.join(directory, "counter")
+        self.lock_path = os.path.join(directory, "lock")
+        self.max_delta = max_delta
+        self.sync = sync
+        self.compactions = 0
+        self._fd = None
+        self._lock_fd = None
+        self._log_id = None
+        self._size = 0
+        self._live = 0
+        self._state = None
+        self._digests = None
+        # Changes made while the digest index is being built, replayed onto it
+        self._digest_backlog = None
+        self._digest_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compactor = None
+
+    def init(self):
+        if self._fd is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._acquire_lock()
+        try:
+            self._open()
+        except BaseException:
+            self._release_lock()
+            raise
+
+    def _acquire_lock(self):
+        """Hold the directory lock, so a second process fails instead of forking the store
+
+        Another process's writes would never reach this one's index or
+        overlay, and its compaction would unlink the log this one appends to.
+        """
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            raise LogStoreError(f"{self.directory} is in use by another process") from None
+        self._lock_fd = fd
+
+    def _release_lock(self):
+        if self._lock_fd is not None:
+            # Closing the descriptor drops the lock
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _open(self):
+        if not os.path.exists(self.log_path):
+            with open(self.log_path, "wb") as f:
+                f.write(LOG_HEADER.pack(LOG_MAGIC, VERSION, os.urandom(8)))
+                f.flush()
+                os.fsync(f.fileno())
+        with open(self.log_path, "rb") as f:
+            header = f.read(LOG_HEADER.size)
+            if len(header) < LOG_HEADER.size:
+                raise LogStoreError(f"{self.log_path} is truncated")
+            magic, version, log_id = LOG_HEADER.unpack(header)
+            if magic != LOG_MAGIC or version != VERSION:
+                raise LogStoreError(f"{self.log_path} is not a version {VERSION} log")
+            log_size = os.fstat(f.fileno()).st_size
+            index = self._open_index(log_id, log_size)
+            # Only records appended after the index was written need replaying
+            f.seek(index.log_end)
+            tail = f.read()
+
+        delta = {}
+        end = 0
+        for op, code, url, end in iter_records(tail, 0):
+            delta[code.decode()] = decode_redirect(url) if op == OP_PUT else None
+        end += index.log_end
+        if end < log_size:
+            os.truncate(self.log_path, end)
+
+        self._fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND)
+        self._log_id = log_id
+        self._size = end
+        self._state = LogState(index, map_file(self.log_path, index.log_end), delta, sorted(delta))
+        self._live = index.count
+        for code, redirect in delta.items():
+            in_index = index.find(code.encode()) is not None
+            self._live += (redirect is not None) - in_index
+        if os.path.exists(self.counter_path):
+            with open(self.counter_path) as f:
+                self._next_code = int(f.read())
+        self._maybe_compact()
+
+    def _open_index(self, log_id, log_size):
+        """Open the index if it belongs to this log, else start over from an empty one
+
+        With an empty index the whole log is replayed into the overlay and the
+        next compaction writes a proper index.
+        """
+        try:
+            index = LogIndex(self.index_path)
+            if index.log_id == log_id and index.log_end <= log_size:
+                return index
+            index.close()
+        except (FileNotFoundError, LogStoreError):
+            pass
+        write_index(self.index_path, [], log_id, LOG_HEADER.size)
+        return LogIndex(self.index_path)
+
+    def close(self):
+        if self._compactor is not None:
+            self._compactor.join()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._release_lock()
+
+    def get_redirect(self, code):
+        state = self._state
+        delta = state.delta
+        if code in delta:
+            return delta[code]
+        found = state.index.find(code.encode())
+        if found is None:
+            return None
+        url_offset, url_length = found
+        return decode_redirect(state.log[url_offset:url_offset + url_length])
+
+    def scan(self, after=None, limit=100):
+        with self._write_lock:
+            state = self._state
+            entries = merge_entries(state, state.delta, state.keys, after)
+            return [(code, redirect.url) for code, redirect in itertools.islice(entries, limit)]
+
+    def iter_redirects(self, chunk_size=1000):
+        with self._write_lock:
+            state = self._state
+            delta = dict(state.delta)
+            keys = list(state.keys)
+        yield from merge_entries(state, delta, keys)
+
+    def iter_entries(self, chunk_size=1000):
+        for code, redirect in self.iter_redirects(chunk_size):
+            yield code, redirect.url
+
+    def _digest_index(self):
+        """The url_digest index, built on first use without holding up writers"""
+        with self._digest_lock:
+            if self._digests is None:
+                with self._write_lock:
+                    state = self._state
+                    delta = dict(state.delta)
+                    keys = list(state.keys)
+                    self._digest_backlog = backlog = []
+                try:
+                    entries = merge_entries(state, delta, keys)
+                    digests = DigestIndex((code, existing.url) for code, existing in entries)
+                    with self._write_lock:
+                        for change in backlog:
+                            digests.replace(*change)
+                        self._digests = digests
+                finally:
+                    self._digest_backlog = None
+        return self._digests
+
+    def find_code(self, redirect):
+        digests = self._digest_index()
+        with self._write_lock:
+            codes = digests.candidates(redirect.url)
+        return matching_code(((code, self.get_redirect(code)) for code in codes), redirect)
+
+    def count(self):
+        return self._live
+
+    def version(self):
+        # Every write grows the log, and compaction starts a new one
+        with self._write_lock:
+            return f"{self._log_id.hex()}-{self._size}"
+
+    @contextmanager
+    def _batch(self):
+        with self._write_lock:
+            batch = LogBatch(self)
+            yield batch
+            if batch.records:
+                self._append(batch)
+        self._maybe_compact()
+
+    def _append(self, batch):
+        data = memoryview(b"".join(batch.records))
+        size = len(data)
+        while data:
+            data = data[os.write(self._fd, data):]
+        if self.sync:
+            os.fsync(self._fd)
+        self._size += size
+        self._live += batch.live
+        state = self._state
+        for code, redirect in batch.pending.items():
+            if self._digests is not None or self._digest_backlog is not None:
+                old = self.get_redirect(code)
+                change = (code, old and old.url, redirect and redirect.url)
+                if self._digests is not None:
+                    self._digests.replace(*change)
+                else:
+                    self._digest_backlog.append(change)
+            if code not in state.delta:
+                bisect.insort(state.keys, code)
+            state.delta[code] = redirect
+
+    def put(self, code, url, status=302, max_age=None, immutable=False):
+        with self._batch() as batch:
+            batch.put(code, url, status, max_age, immutable)
+
+    def put_many(self, entries):
+        with self._batch() as batch:
+            return batch.put_many(entries)
+
+    def update(self, code, url, policy=None):
+        with self._batch() as batch:
+            return batch.update(code, url, policy)
+
+    def delete(self, code):
+        with self._batch() as batch:
+            return batch.delete(code)
+
+    def write_batch(self, ops):
+        results = []
+        with self._batch() as batch:
+            for name, args in ops:
+                target = batch if hasattr(batch, name) else self
+                try:
+                    results.append((getattr(target, name)(*args), None))
+                except CodeExists as exc:
+                    results.append((None, exc))
+        return results
+
+    def lease_codes(self, size, start):
+        with self._lock:
+            first = start if self._next_code is None else self._next_code
+            self._next_code = first + size
+            tmp_path = self.counter_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(str(self._next_code))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.counter_path)
+            return first
+
+    def _maybe_compact(self):
+        if len(self._state.delta) <= self.max_delta:
+            return
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, name="logstore-compact", daemon=True)
+        self._compactor.start()
+
+    def compact(self):
+        """Rewrite the log with only live entries and write a fresh index (blocking)"""
+        with self._compact_lock:
+            with self._write_lock:
+                state = self._state
+                start_size = self._size
+                delta = dict(state.delta)
+                keys = list(state.keys)
+
+            log_id = os.urandom(8)
+            tmp_log = self.log_path + ".compact"
+            entries = []
+            with open(tmp_log, "wb") as out:
+                out.write(LOG_HEADER.pack(LOG_MAGIC, VERSION, log_id))
+                position = LOG_HEADER.size
+                for code, redirect in merge_entries(state, delta, keys):
+                    code, url = code.encode(), encode_redirect(redirect)
+                    record = encode_record(OP_PUT, code, url)
+                    out.write(record)
+                    entries.append((code, position + RECORD.size + len(code), len(url)))
+                    position += len(record)
+                out.flush()
+                os.fsync(out.fileno())
+            tmp_index = self.index_path + ".compact"
+            write_index(tmp_index, entries, log_id, position)
+
+            with self._write_lock:
+                # Bring over whatever was appended while the new log was written
+                with open(self.log_path, "rb") as f:
+                    f.seek(start_size)
+                    tail = f.read(self._size - start_size)
+                with open(tmp_log, "ab") as out:
+                    out.write(tail)
+                    out.flush()
+                    os.fsync(out.fileno())
+                new_delta = {}
+                for op, code, url, _ in iter_records(tail, 0):
+                    new_delta[code.decode()] = decode_redirect(url) if op == OP_PUT else None
+                # The log id ties the index to its log, so a crash between
+                # these two renames is caught on open
+                os.replace(tmp_log, self.log_path)
+                os.replace(tmp_index, self.index_path)
+                os.close(self._fd)
+                self._fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND)
+                self._log_id = log_id
+                self._size = position + len(tail)
+                # Readers may still hold the previous maps; they are released
+                # once the last reference goes away
+                index = LogIndex(self.index_path)
+                self._state = LogState(index, map_file(self.log_path, index.log_end), new_delta, sorted(new_delta))
+                self.compactions += 1
+
+    def stats(self):
+        state = self._state
+        return {
+            "entries": self._live,
+            "indexed": state.index.count,
+            "overlay": len(state.delta),
+            "log_bytes": self._size,
+            "compactions": self.compactions,
+        }
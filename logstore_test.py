@@ -0,0 +1,214 @@
+import os
+import threading
+
+import pytest
+
+import logstore
+from logstore import LogStorage, LogStoreError
+from policy import Redirect
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / "logstore")
+
+
+def open_store(directory, **kwargs):
+    store = LogStorage(directory, **kwargs)
+    store.init()
+    return store
+
+
+class TestLogStorage:
+    """Tests for the append-only log store beyond the shared conformance suite"""
+
+    def test_reopen_replays_log(self, directory):
+        store = open_store(directory)
+        store.put("a", "https://a.com")
+        store.put("b", "https://b.com")
+        store.update("a", "https://new.com")
+        store.delete("b")
+        store.close()
+
+        store = open_store(directory)
+        assert store.get("a") == "https://new.com"
+        assert store.get("b") is None
+        assert store.count() == 1
+        store.close()
+
+    def test_compaction_keeps_entries_and_shrinks_log(self, directory):
+        store = open_store(directory)
+        for i in range(100):
+            store.put(f"c{i:03}", "https://old.com")
+        for i in range(100):
+            store.update(f"c{i:03}", f"https://new.com/{i}")
+        for i in range(50):
+            store.delete(f"c{i:03}")
+        before = store.stats()["log_bytes"]
+
+        store.compact()
+        stats = store.stats()
+        assert stats["log_bytes"] < before / 2
+        assert stats["indexed"] == 50
+        assert stats["overlay"] == 0
+        assert store.get("c000") is None
+        assert store.get("c099") == "https://new.com/99"
+        assert [code for code, _ in store.scan(after="c097")] == ["c098", "c099"]
+        store.close()
+
+        store = open_store(directory)
+        assert store.count() == 50
+        assert store.get("c050") == "https://new.com/50"
+        store.close()
+
+    def test_policy_survives_reopen_and_compaction(self, directory):
+        store = open_store(directory)
+        store.put("a", "https://a.com", 301, 600, True)
+        store.put("b", "https://b.com")
+        store.update("b", "https://b.com", (307, None, False))
+        store.close()
+
+        store = open_store(directory)
+        assert store.get_redirect("a") == Redirect("https://a.com", 301, 600, True)
+        store.compact()
+        assert store.get_redirect("b") == Redirect("https://b.com", 307)
+        assert store.scan() == [("a", "https://a.com"), ("b", "https://b.com")]
+        store.close()
+
+        store = open_store(directory)
+        assert store.get_redirect("a") == Redirect("https://a.com", 301, 600, True)
+        assert store.get_redirect("b") == Redirect("https://b.com", 307)
+        store.close()
+
+    def test_compaction_runs_in_background(self, directory):
+        store = open_store(directory, max_delta=10)
+        for i in range(50):
+            store.put(f"c{i}", f"https://example.com/{i}")
+        store.close()
+        assert store.compactions >= 1
+
+        store = open_store(directory)
+        assert store.count() == 50
+        assert all(store.get(f"c{i}") == f"https://example.com/{i}" for i in range(50))
+        store.close()
+
+    def test_writes_during_compaction_are_kept(self, directory):
+        store = open_store(directory)
+        for i in range(2000):
+            store.put(f"c{i}", "https://example.com")
+        compactor = threading.Thread(target=store.compact)
+        compactor.start()
+        for i in range(200):
+            store.put(f"late{i}", "https://late.com")
+            store.delete(f"c{i}")
+        compactor.join()
+
+        assert store.count() == 2000
+        assert store.get("late199") == "https://late.com"
+        assert store.get("c0") is None
+        store.close()
+        store = open_store(directory)
+        assert store.count() == 2000
+        assert store.get("late0") == "https://late.com"
+        assert store.get("c199") is None
+        store.close()
+
+    def test_torn_record_is_dropped(self, directory):
+        store = open_store(directory)
+        store.put("a", "https://a.com")
+        store.put("b", "https://b.com")
+        store.close()
+        # Cut the last record short, as a crash mid-append would
+        log_path = os.path.join(directory, "data.log")
+        os.truncate(log_path, os.path.getsize(log_path) - 3)
+
+        store = open_store(directory)
+        assert store.get("a") == "https://a.com"
+        assert store.get("b") is None
+        store.put("c", "https://c.com")
+        store.close()
+        store = open_store(directory)
+        assert store.get("c") == "https://c.com"
+        store.close()
+
+    def test_torn_record_after_index_is_dropped(self, directory):
+        store = open_store(directory)
+        store.put("a", "https://a.com")
+        store.compact()
+        store.put("b", "https://b.com")
+        store.put("c", "https://c.com")
+        store.close()
+        log_path = os.path.join(directory, "data.log")
+        os.truncate(log_path, os.path.getsize(log_path) - 3)
+
+        store = open_store(directory)
+        assert store.stats()["indexed"] == 1
+        assert [code for code, _ in store.scan()] == ["a", "b"]
+        store.put("d", "https://d.com")
+        store.close()
+        store = open_store(directory)
+        assert [code for code, _ in store.scan()] == ["a", "b", "d"]
+        store.close()
+
+    def test_index_from_another_log_is_ignored(self, directory, tmp_path):
+        store = open_store(directory)
+        store.put("a", "https://a.com")
+        store.compact()
+        store.close()
+        other = open_store(str(tmp_path / "other"))
+        other.put("z", "https://z.com")
+        other.compact()
+        other.close()
+        os.replace(tmp_path / "other" / "index.bin", os.path.join(directory, "index.bin"))
+
+        store = open_store(directory)
+        assert store.get("a") == "https://a.com"
+        assert store.get("z") is None
+        store.close()
+
+    def test_code_counter_survives_restart(self, directory):
+        store = open_store(directory)
+        assert store.lease_codes(100, start=1000) == 1000
+        store.close()
+        store = open_store(directory)
+        assert store.lease_codes(100, start=1000) == 1100
+        store.close()
+
+    def test_second_owner_is_refused(self, directory):
+        store = open_store(directory)
+        store.put("x", "https://x.com")
+        with pytest.raises(LogStoreError, match="in use"):
+            open_store(directory)
+        store.close()
+        store = open_store(directory)
+        assert store.get("x") == "https://x.com"
+        store.close()
+
+    def test_find_code_uses_digest_index(self, directory, monkeypatch):
+        store = open_store(directory, max_delta=1)
+        store.put("a", "https://a.com")
+        assert store.find_code(Redirect("https://A.com/")) == "a"
+        monkeypatch.setattr(store, "iter_redirects", None)
+        store.write_batch([("put", ("b", "https://b.com")), ("update", ("a", "https://c.com"))])
+        store.compact()
+        assert store.find_code(Redirect("https://a.com")) is None
+        assert store.find_code(Redirect("https://b.com")) == "b"
+        assert store.find_code(Redirect("https://c.com")) == "a"
+        store.close()
+
+    def test_writes_during_digest_index_build_are_replayed(self, directory, monkeypatch):
+        store = open_store(directory)
+        store.put("a", "https://a.com")
+        merge = logstore.merge_entries
+
+        def merge_while_writing(*args):
+            yield from merge(*args)
+            store.update("a", "https://b.com")
+            store.put("c", "https://c.com")
+
+        monkeypatch.setattr(logstore, "merge_entries", merge_while_writing)
+        assert store.find_code(Redirect("https://a.com")) is None
+        assert store.find_code(Redirect("https://b.com")) == "a"
+        assert store.find_code(Redirect("https://c.com")) == "c"
+        store.close()
+
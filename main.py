@@ -1,49 +1,614 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from fastapi.responses import RedirectResponse, HTMLResponse
-import sqlite3
+import asyncio
+import base64
+import binascii
+import html
+import json
+import logging
+import os
+import signal
+import time
 from contextlib import contextmanager
+from typing import Literal
+from urllib.parse import urlencode
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import (
+    HTMLResponse,
+    JSONResponse,
+    PlainTextResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
+from pydantic import BaseModel, Field, ValidationError
+
+from analytics import ClickRecorder
+from batching import WriteBatcher
+from bloom import CountingBloomFilter
+from cache import URLCache
+from executor import DBExecutor, DBOverloaded
+from export import FORMATS as EXPORT_FORMATS
+from export import encode_rows
+from fastpath import FastRedirectApp
+from ids import BlockAllocator, base62_encode
+from logstore import LogStorage
+from metrics import Registry, RequestMetrics
+from policy import Redirect
+from pool import StorageProfile
+from profiler import SamplingProfiler, format_collapsed
+from replica import ReplicaStorage
+from shared import OP_CREATE, OP_DELETE, OP_RESET, OP_UPDATE, SharedCache
+from storage import (
+    SEARCH_MIN_LENGTH,
+    CodeExists,
+    MemoryStorage,
+    SqliteStorage,
+    StorageReadOnly,
+    listing_key,
+)
+from warmup import load_hot_codes, save_hot_codes, warm_order
 
 app = FastAPI()
 
-# Database setup
+logger = logging.getLogger(__name__)
+
+# Instrumentation, served at /metrics
+metrics = Registry()
+app.add_middleware(RequestMetrics, registry=metrics)
+fast_path_hits = metrics.counter("fast_path_redirects_total", "Redirects answered by the fast path")
+
+# Storage setup: "sqlite" (the default), "log" for the append-only log store,
+# "replica" for read-only redirect nodes serving a snapshot file, or "memory"
+# for cache-only and test deployments, which keeps nothing across restarts
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sqlite")
+# Backends owned by one process, refused when more than one worker is configured
+SINGLE_PROCESS_BACKENDS = ("log", "memory")
+# Worker processes, as set by run.sh (or uvicorn's WEB_CONCURRENCY)
+WORKERS = int(os.environ.get("WORKERS", os.environ.get("WEB_CONCURRENCY", "1")))
+LOG_STORE_DIR = os.environ.get("LOG_STORE_DIR", "urls.logstore")
+LOG_STORE_MAX_DELTA = int(os.environ.get("LOG_STORE_MAX_DELTA", "100000"))
+LOG_STORE_SYNC = os.environ.get("LOG_STORE_SYNC", "0") == "1"
+REPLICA_SNAPSHOT = os.environ.get("REPLICA_SNAPSHOT", "urls.snapshot")
+# How often a replica checks whether its snapshot file was replaced; SIGHUP
+# checks straight away
+REPLICA_RELOAD_INTERVAL = float(os.environ.get("REPLICA_RELOAD_INTERVAL", "5"))
 DATABASE = "urls.db"
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_READ_POOL_SIZE = int(os.environ.get("DB_READ_POOL_SIZE", "8"))
+# Trigram index behind GET /search; costs some write throughput
+SEARCH_INDEX = os.environ.get("SEARCH_INDEX", "1") == "1"
+
+STORAGE_PROFILE = StorageProfile(
+    journal_mode=os.environ.get("SQLITE_JOURNAL_MODE", "wal"),
+    synchronous=os.environ.get("SQLITE_SYNCHRONOUS", "normal"),
+    mmap_size=int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    cache_size=int(os.environ.get("SQLITE_CACHE_SIZE", str(-64 * 1024))),
+    busy_timeout=int(os.environ.get("SQLITE_BUSY_TIMEOUT", "5000")),
+)
+
+DB_READERS = int(os.environ.get("DB_READERS", "4"))
+DB_MAX_PENDING = int(os.environ.get("DB_MAX_PENDING", "1024"))
+
+storage = None
+_replica_task = None
+
+# Blocking storage calls run here so they never stall the event loop
+db_executor = DBExecutor(readers=DB_READERS, max_pending=DB_MAX_PENDING)
+
+# Group commit: coalesce concurrent writes into one transaction
+GROUP_COMMIT = os.environ.get("GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get("GROUP_COMMIT_MAX_BATCH", "256"))
+GROUP_COMMIT_DELAY = float(os.environ.get("GROUP_COMMIT_DELAY_MS", "2")) / 1000
+
+# Redirect cache setup
+CACHE_MAX_SIZE = int(os.environ.get("URL_CACHE_SIZE", "10000"))
+CACHE_TTL = float(os.environ["URL_CACHE_TTL"]) if os.environ.get("URL_CACHE_TTL") else None
+
+url_cache = URLCache(max_size=CACHE_MAX_SIZE, ttl=CACHE_TTL)
+
+# Cache warmup: after startup, preload the WARMUP_CODES most clicked codes
+# (from WARMUP_FILE if it exists, else the last WARMUP_WINDOW_MINUTES of click
+# analytics) before /ready reports the worker ready. The list is saved back to
+# WARMUP_FILE on shutdown.
+WARMUP_CODES = int(os.environ.get("WARMUP_CODES", "1000"))
+WARMUP_FILE = os.environ.get("WARMUP_FILE")
+WARMUP_WINDOW_MINUTES = int(os.environ.get("WARMUP_WINDOW_MINUTES", "1440"))
+WARMUP_BATCH_SIZE = 500
+
+warmup_status = {"state": "pending", "codes": 0, "loaded": 0, "seconds": None}
+_warmup_task = None
+
+# Multi-worker shared read cache, enabled by pointing SHARED_CACHE_DIR at a
+# directory every worker can reach (ignored by the replica backend)
+SHARED_CACHE_DIR = os.environ.get("SHARED_CACHE_DIR")
+SHARED_CACHE_REBUILD_BACKOFF = 5.0
+
+shared_cache = None
+_shared_rebuild_task = None
+_shared_next_rebuild = 0.0
+
+
+def code_filter_wanted(mode):
+    """Whether CODE_FILTER_ENABLED=``mode`` turns the code filter on
+
+    "auto" relies on the shared cache, which carries every worker's writes to
+    every other. Without it a lone process can't tell itself apart from one
+    gunicorn worker of several, or from one of two instances on one database.
+    """
+    return mode == "1" or (mode == "auto" and bool(SHARED_CACHE_DIR))
+
+
+# Negative-lookup filter: lets unknown codes be answered without touching
+# SQLite. A code it never saw created is reported missing, so "auto" (the
+# default) only enables it with SHARED_CACHE_DIR set. Set it to "1" only when
+# this process makes every write to the database.
+CODE_FILTER_MODE = os.environ.get("CODE_FILTER_ENABLED", "auto")
+CODE_FILTER_ENABLED = code_filter_wanted(CODE_FILTER_MODE)
+CODE_FILTER_ERROR_RATE = float(os.environ.get("CODE_FILTER_ERROR_RATE", "0.01"))
+CODE_FILTER_MIN_CAPACITY = int(os.environ.get("CODE_FILTER_MIN_CAPACITY", "100000"))
+
+# None until built at startup; lookups then go straight to the database
+code_filter = None
+code_filter_stats = {"rejections": 0, "false_positives": 0}
+# Changes seen while a rebuild is scanning the table, replayed onto the result
+_code_filter_backlog = None
+_code_filter_task = None
+
+# Click analytics setup
+ANALYTICS_ENABLED = os.environ.get("ANALYTICS_ENABLED", "1") == "1"
+ANALYTICS_BUFFER_SIZE = int(os.environ.get("ANALYTICS_BUFFER_SIZE", "65536"))
+ANALYTICS_FLUSH_INTERVAL = float(os.environ.get("ANALYTICS_FLUSH_INTERVAL", "1"))
+# Per-minute clicks older than this, and referrer counters without a click
+# for this long, are dropped on each flush; 0 keeps them forever
+ANALYTICS_RETENTION_MINUTES = int(os.environ.get("ANALYTICS_RETENTION_MINUTES", str(7 * 24 * 60)))
+
+click_recorder = ClickRecorder(capacity=ANALYTICS_BUFFER_SIZE)
+_analytics_task = None
+
+# Sampling profiler, off unless enabled; triggered by POST /admin/profile or
+# by sending SIGUSR1 to a worker (once to start, again to stop)
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_DIR = os.environ.get("PROFILE_DIR", ".")
+PROFILE_MAX_SECONDS = 60
+
+profiler = SamplingProfiler(interval=PROFILE_INTERVAL)
+
+# Code generation setup
+CODE_BLOCK_SIZE = int(os.environ.get("CODE_BLOCK_SIZE", "1000"))
+# Start at 62**3 so generated codes are at least four characters long and stay
+# clear of short hand-picked codes
+CODE_COUNTER_START = 62**3
+CODE_GENERATION_ATTEMPTS = 10
+
+# Bulk import setup
+BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", "1000"))
+
+# Management page setup
+MANAGE_PAGE_SIZE = int(os.environ.get("MANAGE_PAGE_SIZE", "100"))
+MANAGE_MAX_PAGE_SIZE = 1000
+
+
+def open_storage():
+    """Create the configured storage backend"""
+    if STORAGE_BACKEND in SINGLE_PROCESS_BACKENDS and WORKERS > 1:
+        raise ValueError(f"The {STORAGE_BACKEND} backend can't be shared by {WORKERS} workers; use WORKERS=1")
+    if STORAGE_BACKEND == "memory":
+        return MemoryStorage()
+    if STORAGE_BACKEND == "log":
+        return LogStorage(LOG_STORE_DIR, max_delta=LOG_STORE_MAX_DELTA, sync=LOG_STORE_SYNC)
+    if STORAGE_BACKEND == "replica":
+        return ReplicaStorage(REPLICA_SNAPSHOT)
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteStorage(
+            DATABASE,
+            profile=STORAGE_PROFILE,
+            pool_size=DB_POOL_SIZE,
+            read_pool_size=DB_READ_POOL_SIZE,
+            metrics=metrics,
+            search_index=SEARCH_INDEX,
+        )
+    raise ValueError(f"Unknown storage backend: {STORAGE_BACKEND!r}")
 
 
 def init_db():
-    """Initialize the database with the urls table"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS urls (
-            code TEXT PRIMARY KEY,
-            url TEXT NOT NULL
+    """Open the storage backend for the current DATABASE and create its tables"""
+    global storage, code_filter
+    if storage is not None:
+        storage.close()
+    storage = open_storage()
+    storage.init()
+    # Cached entries, the code filter, leased code blocks and buffered clicks
+    # may belong to a previous database
+    code_filter = None
+    code_filter_stats.update(rejections=0, false_positives=0)
+    url_cache.clear()
+    warmup_status.update(state="pending", codes=0, loaded=0, seconds=None)
+    code_allocator.reset()
+    click_recorder.reset()
+
+
+def lease_code_block(size):
+    """Reserve ``size`` values of the shared code counter, returning the first"""
+    return storage.lease_codes(size, CODE_COUNTER_START)
+
+
+code_allocator = BlockAllocator(lease_code_block, block_size=CODE_BLOCK_SIZE)
+
+
+async def generate_code():
+    """Return a fresh base62 code, touching the database only to lease a new block
+
+    Values that encode to a reserved code (see ``RESERVED_CODES``) are skipped.
+    """
+    while True:
+        value = code_allocator.take()
+        if value is None:
+            await db_executor.run_write(code_allocator.refill)
+        elif (code := base62_encode(value)) not in RESERVED_CODES:
+            return code
+
+
+def invalidate_code(code, op=OP_UPDATE):
+    """Drop any cached state for a code after it is created, updated or deleted"""
+    url_cache.invalidate(code)
+    if shared_cache is not None:
+        # Our own change comes back through the log on the next poll, which
+        # is where the code filter picks it up
+        shared_cache.publish(op, code)
+    else:
+        track_code(op, code)
+
+
+def on_shared_invalidation(op, code):
+    """Apply a change published by any worker to this worker's local state"""
+    if op == OP_RESET:
+        url_cache.invalidate_all()
+    else:
+        url_cache.invalidate(code)
+    track_code(op, code)
+
+
+def track_code(op, code):
+    """Keep the code filter in step with a committed create or delete"""
+    global code_filter
+    if _code_filter_backlog is not None:
+        _code_filter_backlog.append((op, code))
+    if code_filter is None:
+        return
+    if op == OP_CREATE:
+        code_filter.add(code)
+        if len(code_filter) > code_filter.capacity:
+            schedule_code_filter_rebuild()
+    elif op == OP_DELETE:
+        code_filter.remove(code)
+    elif op == OP_RESET:
+        # Changes were lost; the filter may now miss codes that exist
+        code_filter = None
+        schedule_code_filter_rebuild()
+
+
+def build_code_filter():
+    """Build a filter holding every stored code (blocking)"""
+    # Leave room to grow before the filter has to be rebuilt
+    new_filter = CountingBloomFilter(
+        max(CODE_FILTER_MIN_CAPACITY, 2 * storage.count()),
+        error_rate=CODE_FILTER_ERROR_RATE,
+    )
+    for code, _ in storage.iter_entries():
+        new_filter.add(code)
+    return new_filter
+
+
+async def rebuild_code_filter():
+    """Scan the table into a fresh filter and swap it in
+
+    Creates that land while the scan runs are replayed onto the new filter.
+    Deletes are not: the scan may not have seen the code, and removing an item
+    that was never added could hide a code that does exist. A stale entry only
+    costs one database lookup.
+    """
+    global code_filter, _code_filter_backlog
+    if shared_cache is not None:
+        shared_cache.poll()
+    _code_filter_backlog = backlog = []
+    try:
+        new_filter = await db_executor.run_read(build_code_filter)
+        if shared_cache is not None:
+            shared_cache.poll()
+    finally:
+        _code_filter_backlog = None
+    for op, code in backlog:
+        if op == OP_CREATE:
+            new_filter.add(code)
+        elif op == OP_RESET:
+            return False
+    code_filter = new_filter
+    return True
+
+
+async def _rebuild_code_filter():
+    global _code_filter_task
+    try:
+        await rebuild_code_filter()
+    except Exception:
+        logger.exception("Failed to rebuild the code filter")
+    finally:
+        _code_filter_task = None
+
+
+def schedule_code_filter_rebuild():
+    global _code_filter_task
+    if CODE_FILTER_ENABLED and _code_filter_task is None:
+        _code_filter_task = asyncio.ensure_future(_rebuild_code_filter())
+
+
+def code_filter_report():
+    """Filter size and accuracy: the expected false positive rate at the current
+    fill, and the observed share of unknown codes the filter let through"""
+    report = {"enabled": code_filter is not None, **code_filter_stats}
+    misses = code_filter_stats["rejections"] + code_filter_stats["false_positives"]
+    report["observed_false_positive_rate"] = code_filter_stats["false_positives"] / misses if misses else 0.0
+    if code_filter is not None:
+        report.update(
+            entries=len(code_filter),
+            capacity=code_filter.capacity,
+            hash_count=code_filter.hash_count,
+            memory_bytes=code_filter.memory_bytes,
+            expected_false_positive_rate=code_filter.expected_false_positive_rate(),
         )
-    """)
-    conn.commit()
-    conn.close()
+    return report
 
 
-@contextmanager
-def get_db():
-    """Context manager for database connections"""
-    conn = sqlite3.connect(DATABASE)
+def rebuild_shared_cache():
+    return shared_cache.rebuild(storage.iter_redirects)
+
+
+async def _rebuild_shared_cache():
+    global _shared_rebuild_task
     try:
+        await db_executor.run_read(rebuild_shared_cache)
+    finally:
+        _shared_rebuild_task = None
+
+
+def sync_shared_cache():
+    """Apply invalidations from other workers and rebuild the snapshot when due"""
+    global _shared_rebuild_task, _shared_next_rebuild
+    if shared_cache is None:
+        return
+    shared_cache.poll()
+    if (
+        shared_cache.needs_rebuild()
+        and _shared_rebuild_task is None
+        and time.monotonic() >= _shared_next_rebuild
+    ):
+        _shared_next_rebuild = time.monotonic() + SHARED_CACHE_REBUILD_BACKOFF
+        _shared_rebuild_task = asyncio.ensure_future(_rebuild_shared_cache())
+
+
+@contextmanager
+def get_db(readonly=False):
+    """Context manager for pooled database connections (SQLite backend only)
+
+    Pass ``readonly=True`` on read paths to use the read-only connection role,
+    which never takes a write lock and so never contends with writers.
+    """
+    with storage.connection(readonly) as conn:
         yield conn
+
+
+async def flush_write_batch(ops):
+    return await db_executor.run_write(storage.write_batch, ops)
+
+
+write_batcher = WriteBatcher(
+    flush_write_batch,
+    max_batch=GROUP_COMMIT_MAX_BATCH,
+    max_delay=GROUP_COMMIT_DELAY,
+)
+
+
+async def write(op, *args):
+    """Apply the storage write ``op`` (``"put"``, ``"update"``, ...) once committed
+
+    With GROUP_COMMIT enabled, concurrent writes share one transaction (and one
+    fsync); otherwise each write commits on its own. Either way the call only
+    returns after the commit, so callers may invalidate caches and acknowledge
+    the client straight away.
+    """
+    if GROUP_COMMIT:
+        return await write_batcher.submit(op, *args)
+    return await db_executor.run_write(getattr(storage, op), *args)
+
+
+async def flush_clicks():
+    """Write the click counters aggregated since the last flush in one batch"""
+    minute_counts, referrer_counts = click_recorder.take_counts()
+    if not minute_counts:
+        return
+    before = None
+    if ANALYTICS_RETENTION_MINUTES > 0:
+        before = int(time.time() // 60 - ANALYTICS_RETENTION_MINUTES + 1) * 60
+    try:
+        await write("store_clicks", minute_counts, referrer_counts, before)
+    except Exception:
+        click_recorder.restore_counts(minute_counts, referrer_counts)
+        raise
+
+
+async def flush_clicks_periodically():
+    while True:
+        await asyncio.sleep(ANALYTICS_FLUSH_INTERVAL)
+        try:
+            await flush_clicks()
+        except Exception:
+            logger.exception("Failed to flush click analytics, will retry")
+
+
+def reload_replica():
+    """Swap in a replaced replica snapshot and drop everything derived from the old one"""
+    if not isinstance(storage, ReplicaStorage) or not storage.reload():
+        return False
+    url_cache.invalidate_all()
+    # The code filter may be missing codes the new snapshot has
+    track_code(OP_RESET, None)
+    logger.warning("Loaded replica snapshot %s (%d entries)", storage.path, storage.count())
+    return True
+
+
+async def reload_replica_periodically():
+    while True:
+        await asyncio.sleep(REPLICA_RELOAD_INTERVAL)
+        try:
+            reload_replica()
+        except Exception:
+            logger.exception("Failed to load the replica snapshot, keeping the current one")
+
+
+def recent_top_codes(limit):
+    since = int(time.time() // 60 - WARMUP_WINDOW_MINUTES + 1) * 60
+    return storage.top_codes(since, limit)
+
+
+def hot_codes(limit):
+    """Codes to preload, hottest first: from WARMUP_FILE if usable, else recent clicks (blocking)
+
+    Reserved codes are left out: the fast path would answer them from the
+    cache instead of the route they name.
+    """
+    codes = None
+    if WARMUP_FILE:
+        codes = load_hot_codes(WARMUP_FILE)
+    if codes is None:
+        codes = [entry["code"] for entry in recent_top_codes(limit)]
+    return [code for code in codes if code not in RESERVED_CODES][:limit]
+
+
+async def warm_up():
+    """Preload the hottest codes into the redirect cache, then mark the worker ready
+
+    A failed warmup only costs latency, so the worker reports ready either way.
+    """
+    start = time.perf_counter()
+    warmup_status.update(state="running", codes=0, loaded=0)
+    try:
+        limit = min(WARMUP_CODES, url_cache.max_size)
+        codes = await db_executor.run_read(hot_codes, limit) if limit > 0 else []
+        warmup_status["codes"] = len(codes)
+        for chunk in warm_order(codes, WARMUP_BATCH_SIZE):
+            version = url_cache.version
+            found = await db_executor.run_read(storage.get_redirects, chunk)
+            for code in chunk:
+                redirect = found.get(code)
+                if redirect is not None:
+                    url_cache.set(code, redirect, version=version)
+                    warmup_status["loaded"] += 1
+        warmup_status["state"] = "done"
+    except Exception:
+        logger.exception("Cache warmup failed, serving with a cold cache")
+        warmup_status["state"] = "failed"
     finally:
-        conn.close()
+        warmup_status["seconds"] = time.perf_counter() - start
+
+
+def save_warmup_file():
+    """Persist the currently hottest codes for the next startup (blocking)"""
+    ranked = recent_top_codes(WARMUP_CODES)
+    if ranked:
+        save_hot_codes(WARMUP_FILE, ranked)
+
+
+def toggle_profiler():
+    """SIGUSR1 handler: start sampling, or stop and write the collapsed stacks to PROFILE_DIR"""
+    if not profiler.running:
+        profiler.start()
+        logger.warning("Profiling started")
+        return
+    counts = profiler.stop()
+    path = os.path.join(PROFILE_DIR, f"profile-{os.getpid()}-{int(time.time())}.folded")
+    with open(path, "w") as f:
+        f.write(format_collapsed(counts))
+    logger.warning("Profile of %d samples written to %s", profiler.samples, path)
+
+
+@app.exception_handler(DBOverloaded)
+async def db_overloaded_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": "Database busy, try again"})
+
+
+@app.exception_handler(StorageReadOnly)
+async def storage_read_only_handler(request, exc):
+    return JSONResponse(status_code=405, content={"detail": str(exc)})
 
 
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
+    global shared_cache
     init_db()
+    # A replica's snapshot is already one memory map shared by every worker;
+    # a second copy in the shared cache would go stale on each reload
+    if SHARED_CACHE_DIR and shared_cache is None and not isinstance(storage, ReplicaStorage):
+        shared_cache = SharedCache(SHARED_CACHE_DIR, on_invalidate=on_shared_invalidation)
+        await db_executor.run_read(shared_cache.attach, storage.iter_redirects)
+    if code_filter is None:
+        # Lookups go to storage until the filter is built
+        schedule_code_filter_rebuild()
+    global _analytics_task, _warmup_task
+    if ANALYTICS_ENABLED and _analytics_task is None:
+        _analytics_task = asyncio.create_task(flush_clicks_periodically())
+    # Requests are served while the cache warms; /ready says when it's done
+    _warmup_task = asyncio.create_task(warm_up())
+    if PROFILING_ENABLED:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, toggle_profiler)
+    global _replica_task
+    if isinstance(storage, ReplicaStorage) and _replica_task is None:
+        _replica_task = asyncio.create_task(reload_replica_periodically())
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_replica)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    global _analytics_task, _replica_task, _warmup_task
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+        _warmup_task = None
+    if _replica_task is not None:
+        _replica_task.cancel()
+        _replica_task = None
+    if _analytics_task is not None:
+        _analytics_task.cancel()
+        _analytics_task = None
+        await flush_clicks()
+    if WARMUP_FILE and WARMUP_CODES > 0:
+        try:
+            await db_executor.run_read(save_warmup_file)
+        except Exception:
+            logger.exception("Failed to save the warmup file")
+
+
+class RedirectPolicy(BaseModel):
+    """How a code redirects: the status, and how long browsers and CDNs may cache it"""
+
+    status: Literal[301, 302, 307, 308] = 302
+    # Seconds; left out to send no Cache-Control header
+    max_age: int | None = Field(None, ge=0, lt=2**31)
+    # Adds "immutable" (and a one-year max-age unless one is given)
+    immutable: bool = False
+
+    def fields(self):
+        return self.status, self.max_age, self.immutable
 
 
 # Pydantic model for creating URL entries
-class URLCreate(BaseModel):
-    code: str
+class URLCreate(RedirectPolicy):
+    # Left out to have the server generate one
+    code: str | None = None
     url: str
+    # Return an existing code with an equivalent URL and the same policy, if
+    # there is one, instead of generating a new one
+    dedupe: bool = False
 
 
 @app.get("/")
@@ -51,45 +616,102 @@ async def read_root():
     return {"message": "Welcome to the FastAPI application!"}
 
 
-@app.get("/manage", response_class=HTMLResponse)
-async def manage_page():
-    """Display management page for creating and editing entries"""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT code, url FROM urls ORDER BY code")
-        entries = cursor.fetchall()
-
-    entries_html = ""
-    for code, url in entries:
-        entries_html += f"""
-        <tr>
-            <td><input type="text" value="{code}" readonly style="border:none; background:transparent;"></td>
-            <td><input type="text" id="url-{code}" value="{url}" style="width:400px;"></td>
-            <td>
-                <button onclick="updateEntry('{code}')">Update</button>
-                <button onclick="deleteEntry('{code}')">Delete</button>
-            </td>
-        </tr>
-        """
-
-    html_content = f"""
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the startup cache warmup has finished"""
+    is_ready = warmup_status["state"] in ("done", "failed")
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "warmup": warmup_status},
+    )
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Report redirect cache counters"""
+    stats = url_cache.stats()
+    stats["clicks"] = click_recorder.stats()
+    stats["filter"] = code_filter_report()
+    if GROUP_COMMIT:
+        stats["group_commit"] = write_batcher.stats()
+    if shared_cache is not None:
+        stats["shared"] = shared_cache.stats()
+    if isinstance(storage, (SqliteStorage, LogStorage, ReplicaStorage)):
+        stats[STORAGE_BACKEND] = storage.stats()
+    return stats
+
+
+metrics.callback("url_cache_hits_total", "Redirect cache hits", lambda: url_cache.hits, kind="counter")
+metrics.callback("url_cache_misses_total", "Redirect cache misses", lambda: url_cache.misses, kind="counter")
+metrics.callback("url_cache_hit_ratio", "Share of redirect cache lookups that hit", lambda: url_cache.stats()["hit_ratio"])
+metrics.callback("url_cache_entries", "Entries in the redirect cache", lambda: len(url_cache))
+metrics.callback(
+    "code_filter_rejections_total",
+    "Unknown codes answered by the code filter",
+    lambda: code_filter_stats["rejections"],
+    kind="counter",
+)
+metrics.callback(
+    "code_filter_false_positives_total",
+    "Unknown codes the code filter let through to the database",
+    lambda: code_filter_stats["false_positives"],
+    kind="counter",
+)
+metrics.callback(
+    "code_filter_memory_bytes",
+    "Memory held by the code filter, 0 while it is disabled",
+    lambda: code_filter.memory_bytes if code_filter is not None else 0,
+)
+metrics.callback(
+    "code_filter_expected_false_positive_rate",
+    "False positive rate the code filter expects at its current fill, 0 while it is disabled",
+    lambda: code_filter.expected_false_positive_rate() if code_filter is not None else 0.0,
+)
+metrics.callback("db_calls_pending", "Database calls queued or running", lambda: db_executor.pending)
+
+
+@app.post("/admin/profile")
+async def profile(seconds: float = Query(5.0, gt=0, le=PROFILE_MAX_SECONDS)):
+    """Sample every thread for ``seconds`` and return collapsed stacks for a flamegraph"""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if profiler.running:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        counts = profiler.stop()
+    return PlainTextResponse(
+        format_collapsed(counts),
+        headers={"Content-Disposition": 'attachment; filename="profile.folded"'},
+    )
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Expose metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type=metrics.content_type)
+
+
+MANAGE_PAGE_HEAD = """
     <!DOCTYPE html>
     <html>
     <head>
         <title>URL Shortener - Manage</title>
         <style>
-            body {{ font-family: Arial, sans-serif; max-width: 800px; margin: 50px auto; padding: 20px; }}
-            h1 {{ color: #333; }}
-            .form-group {{ margin: 15px 0; }}
-            label {{ display: inline-block; width: 80px; font-weight: bold; }}
-            input {{ padding: 8px; margin: 5px; }}
-            button {{ padding: 8px 15px; background: #007bff; color: white; border: none; cursor: pointer; }}
-            button:hover {{ background: #0056b3; }}
-            table {{ width: 100%; border-collapse: collapse; margin-top: 30px; }}
-            th, td {{ padding: 10px; text-align: left; border-bottom: 1px solid #ddd; }}
-            th {{ background: #f4f4f4; }}
-            .success {{ color: green; }}
-            .error {{ color: red; }}
+            body { font-family: Arial, sans-serif; max-width: 800px; margin: 50px auto; padding: 20px; }
+            h1 { color: #333; }
+            .form-group { margin: 15px 0; }
+            label { display: inline-block; width: 80px; font-weight: bold; }
+            input { padding: 8px; margin: 5px; }
+            button { padding: 8px 15px; background: #007bff; color: white; border: none; cursor: pointer; }
+            button:hover { background: #0056b3; }
+            table { width: 100%; border-collapse: collapse; margin-top: 30px; }
+            th, td { padding: 10px; text-align: left; border-bottom: 1px solid #ddd; }
+            th { background: #f4f4f4; }
+            .success { color: green; }
+            .error { color: red; }
         </style>
     </head>
     <body>
@@ -99,7 +721,7 @@ async def manage_page():
         <form id="createForm">
             <div class="form-group">
                 <label>Code:</label>
-                <input type="text" id="code" required>
+                <input type="text" id="code" placeholder="leave blank to generate">
             </div>
             <div class="form-group">
                 <label>URL:</label>
@@ -116,129 +738,523 @@ async def manage_page():
                 <th>URL</th>
                 <th>Actions</th>
             </tr>
-            {entries_html}
-        </table>
-        
+"""
+
+MANAGE_PAGE_TAIL = """
         <script>
-            document.getElementById('createForm').addEventListener('submit', async (e) => {{
+            document.getElementById('createForm').addEventListener('submit', async (e) => {
                 e.preventDefault();
                 const code = document.getElementById('code').value;
                 const url = document.getElementById('url').value;
                 
-                const response = await fetch('/shorten', {{
+                const response = await fetch('/shorten', {
                     method: 'POST',
-                    headers: {{ 'Content-Type': 'application/json' }},
-                    body: JSON.stringify({{ code, url }})
-                }});
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify(code ? { code, url } : { url })
+                });
                 
                 const data = await response.json();
                 const messageDiv = document.getElementById('message');
                 
-                if (response.ok) {{
+                if (response.ok) {
                     messageDiv.innerHTML = '<p class="success">Entry created successfully!</p>';
+                    messageDiv.querySelector('p').textContent += ` Code: ${data.code}`;
                     setTimeout(() => location.reload(), 1000);
-                }} else {{
-                    messageDiv.innerHTML = `<p class="error">${{data.detail}}</p>`;
-                }}
-            }});
+                } else {
+                    messageDiv.innerHTML = `<p class="error">${data.detail}</p>`;
+                }
+            });
             
-            async function updateEntry(code) {{
-                const url = document.getElementById(`url-${{code}}`).value;
+            async function updateEntry(code) {
+                const url = document.getElementById(`url-${code}`).value;
                 
-                const response = await fetch(`/update/${{code}}`, {{
+                const response = await fetch(`/update/${code}`, {
                     method: 'PUT',
-                    headers: {{ 'Content-Type': 'application/json' }},
-                    body: JSON.stringify({{ url }})
-                }});
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ url })
+                });
                 
-                if (response.ok) {{
+                if (response.ok) {
                     alert('Entry updated successfully!');
-                }} else {{
+                } else {
                     alert('Failed to update entry');
-                }}
-            }}
+                }
+            }
             
-            async function deleteEntry(code) {{
-                if (!confirm(`Delete entry for code: ${{code}}?`)) return;
+            async function deleteEntry(code) {
+                if (!confirm(`Delete entry for code: ${code}?`)) return;
                 
-                const response = await fetch(`/delete/${{code}}`, {{
+                const response = await fetch(`/delete/${code}`, {
                     method: 'DELETE'
-                }});
+                });
                 
-                if (response.ok) {{
+                if (response.ok) {
                     location.reload();
-                }} else {{
+                } else {
                     alert('Failed to delete entry');
-                }}
-            }}
+                }
+            }
         </script>
     </body>
     </html>
+"""
+
+
+def render_entry(code, url):
+    """Render one table row of the management page"""
+    code_attr = html.escape(code)
+    code_js = html.escape(json.dumps(code))
+    return f"""
+            <tr>
+                <td><input type="text" value="{code_attr}" readonly style="border:none; background:transparent;"></td>
+                <td><input type="text" id="url-{code_attr}" value="{html.escape(url)}" style="width:400px;"></td>
+                <td>
+                    <button onclick="updateEntry({code_js})">Update</button>
+                    <button onclick="deleteEntry({code_js})">Delete</button>
+                </td>
+            </tr>
+            """
+
+
+def render_manage_page(entries, limit, next_after):
+    """Yield the management page in chunks, one table row at a time"""
+    yield MANAGE_PAGE_HEAD
+    for code, url in entries:
+        yield render_entry(code, url)
+    yield "        </table>\n"
+    if next_after is not None:
+        next_href = html.escape(f"/manage?{urlencode({'after': next_after, 'limit': limit})}")
+        yield f'        <p><a href="{next_href}">Next page</a></p>\n'
+    yield MANAGE_PAGE_TAIL
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value lists ``etag`` (weak comparison, as for GET)"""
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+async def listing_etag(request):
+    """Return (ETag, 304 response or None) for a listing built from the whole table
+
+    The ETag is the table version, read before the listing so a write that
+    lands in between can only make it look older than the content, never
+    newer. When the client already has this version it gets a 304 without
+    a single row being read.
     """
-    return HTMLResponse(content=html_content)
+    version = await db_executor.run_read(storage.version)
+    if version is None:
+        return None, None
+    etag = f'"{version}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return etag, Response(status_code=304, headers=listing_headers(etag))
+    return etag, None
+
+
+def listing_headers(etag):
+    # no-cache: browsers may keep the listing but must revalidate it each time
+    return {"ETag": etag, "Cache-Control": "no-cache"} if etag is not None else {}
+
+
+@app.get("/analytics/top")
+async def analytics_top(minutes: int = Query(60, ge=1), limit: int = Query(10, ge=1, le=1000)):
+    """Most clicked codes over the last ``minutes`` minutes"""
+    since = int(time.time() // 60 - minutes + 1) * 60
+    codes = await db_executor.run_read(storage.top_codes, since, limit)
+    return {"since": since, "codes": codes}
+
+
+@app.get("/analytics/codes/{code}")
+async def analytics_code(code: str, minutes: int = Query(60, ge=1)):
+    """Per-minute clicks and top referrers for one code"""
+    since = int(time.time() // 60 - minutes + 1) * 60
+    return await db_executor.run_read(storage.code_series, code, since)
+
+
+@app.get("/manage", response_class=HTMLResponse)
+async def manage_page(
+    request: Request,
+    after: str | None = None,
+    limit: int = Query(MANAGE_PAGE_SIZE, ge=1, le=MANAGE_MAX_PAGE_SIZE),
+):
+    """Display management page for creating and editing entries
+
+    Entries are paginated by code: ``after`` is the last code of the previous
+    page, so each page is an index range scan no matter how large the table is.
+    Unchanged pages are answered with 304 (see ``listing_etag``).
+    """
+    etag, not_modified = await listing_etag(request)
+    if not_modified is not None:
+        return not_modified
+    entries = await db_executor.run_read(storage.scan, after, limit + 1)
+    next_after = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_after = entries[-1][0]
+    return StreamingResponse(
+        render_manage_page(entries, limit, next_after), media_type="text/html", headers=listing_headers(etag)
+    )
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, length):
+    """Inverse of ``encode_cursor``; raises 400 unless it is a key of ``length`` strings"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        key = None
+    if not isinstance(key, list) or len(key) != length or not all(isinstance(part, str) for part in key):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+
+def entry_json(code, redirect):
+    return {
+        "code": code,
+        "url": redirect.url,
+        "status": redirect.status,
+        "max_age": redirect.max_age,
+        "immutable": redirect.immutable,
+    }
+
+
+@app.get("/entries")
+async def list_entries(
+    request: Request,
+    after: str | None = None,
+    limit: int = Query(MANAGE_PAGE_SIZE, ge=1, le=MANAGE_MAX_PAGE_SIZE),
+    prefix: str | None = None,
+    host: str | None = None,
+):
+    """List entries as JSON, a page at a time
+
+    ``prefix`` keeps codes starting with it and ``host`` keeps URLs whose host
+    name starts with it. Pages follow code order, or host then code order when
+    filtering by host, and each is one index range scan. ``next`` is an opaque
+    cursor to pass back as ``after``, or null on the last page.
+    """
+    host_prefix = host.lower() if host is not None else None
+    key = decode_cursor(after, 1 if host_prefix is None else 2) if after is not None else None
+    etag, not_modified = await listing_etag(request)
+    if not_modified is not None:
+        return not_modified
+    entries = await db_executor.run_read(storage.list_entries, key, limit + 1, prefix, host_prefix)
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        code, redirect = entries[-1]
+        next_cursor = encode_cursor(listing_key(code, redirect, host_prefix is not None))
+    return JSONResponse(
+        {"entries": [entry_json(code, redirect) for code, redirect in entries], "next": next_cursor},
+        headers=listing_headers(etag),
+    )
+
+
+@app.get("/search")
+async def search_entries(
+    request: Request,
+    q: str = Query(min_length=SEARCH_MIN_LENGTH),
+    limit: int = Query(MANAGE_PAGE_SIZE, ge=1, le=MANAGE_MAX_PAGE_SIZE),
+):
+    """Find entries whose URL contains ``q``, ignoring case
+
+    On SQLite this is a lookup in the trigram index, so it takes about as
+    long on a large table as on a small one. Results come in no particular
+    order; ``truncated`` says there were more than ``limit``.
+    """
+    etag, not_modified = await listing_etag(request)
+    if not_modified is not None:
+        return not_modified
+    entries = await db_executor.run_read(storage.search, q, limit + 1)
+    return JSONResponse(
+        {
+            "entries": [entry_json(code, redirect) for code, redirect in entries[:limit]],
+            "truncated": len(entries) > limit,
+        },
+        headers=listing_headers(etag),
+    )
+
+
+def stream_export(fmt, compress):
+    """Stream an export straight from the storage backend's row iterator"""
+    rows = storage.iter_rows()
+    try:
+        yield from encode_rows(rows, fmt, compress)
+    finally:
+        rows.close()
+
+
+@app.get("/export")
+async def export_urls(request: Request, format: str = "ndjson", gzip: bool = False):
+    """Export every entry as NDJSON or CSV, optionally gzip-compressed"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    etag, not_modified = await listing_etag(request)
+    if not_modified is not None:
+        return not_modified
+    filename = f"urls.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        stream_export(format, gzip),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', **listing_headers(etag)},
+    )
+
+
+async def insert_generated_url(url, policy):
+    """Insert ``url`` under a generated code and return the code
+
+    Generated codes never repeat, but a client may have picked the same code by
+    hand; in that case the next generated code is used.
+    """
+    for _ in range(CODE_GENERATION_ATTEMPTS):
+        code = await generate_code()
+        try:
+            await write("put", code, url, *policy)
+            return code
+        except CodeExists:
+            continue
+    raise HTTPException(status_code=503, detail="Could not allocate a free code")
 
 
 @app.post("/shorten")
 async def create_short_url(url_data: URLCreate):
-    """Create a new short URL entry"""
-    with get_db() as conn:
-        cursor = conn.cursor()
+    """Create a new short URL entry, generating the code if none is given
+
+    With ``dedupe`` an existing entry for an equivalent URL (see
+    ``dedupe.normalize_url``) with the same policy is returned instead, with
+    ``created`` false. Two requests racing for the same new URL may still
+    both create one.
+    """
+    code = url_data.code
+    policy = url_data.fields()
+    created = True
+    if code in RESERVED_CODES:
+        raise HTTPException(status_code=400, detail="Code is reserved")
+    if url_data.dedupe:
+        if code is not None:
+            raise HTTPException(status_code=400, detail="dedupe only applies to generated codes")
+        code = await db_executor.run_read(storage.find_code, Redirect(url_data.url, *policy))
+        created = code is None
+    if code is None:
+        code = await insert_generated_url(url_data.url, policy)
+    elif created:
         try:
-            cursor.execute(
-                "INSERT INTO urls (code, url) VALUES (?, ?)",
-                (url_data.code, url_data.url),
-            )
-            conn.commit()
-            return {
-                "code": url_data.code,
-                "url": url_data.url,
-                "message": "Short URL created successfully",
-            }
-        except sqlite3.IntegrityError:
+            await write("put", code, url_data.url, *policy)
+        except CodeExists:
             raise HTTPException(status_code=400, detail="Code already exists")
+    if created:
+        invalidate_code(code, OP_CREATE)
+    return {
+        "code": code,
+        "url": url_data.url,
+        "status": url_data.status,
+        "max_age": url_data.max_age,
+        "immutable": url_data.immutable,
+        "created": created,
+        "message": "Short URL created successfully" if created else "Existing short URL returned",
+    }
+
+
+async def iter_bulk_records(request):
+    """Yield decoded records from a JSON array body or a streamed NDJSON body
+
+    NDJSON lines that are not valid JSON are yielded as the exception instead
+    of aborting the whole import.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" not in content_type and "jsonl" not in content_type:
+        try:
+            records = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array")
+        for record in records:
+            yield record
+        return
+
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as exc:
+                    yield exc
+    if buffer.strip():
+        try:
+            yield json.loads(buffer)
+        except ValueError as exc:
+            yield exc
+
+
+@app.post("/shorten/bulk")
+async def create_short_urls_bulk(request: Request):
+    """Create many short URL entries from a JSON array or NDJSON stream
+
+    Records are inserted in batched transactions. A conflicting or invalid
+    record does not abort the import; it is reported in ``results`` with its
+    position in the input. Records that are not listed were created.
+    """
+    created = 0
+    results = []
+    batch = []
+    positions = []
+
+    async def flush():
+        nonlocal created
+        outcome = await write("put_many", batch)
+        for index, (code, *_), inserted in zip(positions, batch, outcome):
+            if inserted:
+                created += 1
+                invalidate_code(code, OP_CREATE)
+            else:
+                results.append(
+                    {"index": index, "code": code, "status": "conflict", "detail": "Code already exists"}
+                )
+        batch.clear()
+        positions.clear()
+
+    received = 0
+    async for record in iter_bulk_records(request):
+        index = received
+        received += 1
+        if isinstance(record, Exception):
+            results.append({"index": index, "status": "invalid", "detail": "Invalid JSON"})
+            continue
+        try:
+            url_data = URLCreate.model_validate(record)
+        except ValidationError as exc:
+            detail = exc.errors(include_url=False, include_context=False)
+            results.append({"index": index, "status": "invalid", "detail": detail})
+            continue
+        if url_data.dedupe:
+            results.append({"index": index, "status": "invalid", "detail": "dedupe is not supported in bulk imports"})
+            continue
+        if url_data.code in RESERVED_CODES:
+            results.append({"index": index, "code": url_data.code, "status": "invalid", "detail": "Code is reserved"})
+            continue
+        code = url_data.code if url_data.code is not None else await generate_code()
+        batch.append((code, url_data.url, *url_data.fields()))
+        positions.append(index)
+        if len(batch) >= BULK_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    results.sort(key=lambda result: result["index"])
+    return {
+        "received": received,
+        "created": created,
+        "conflicts": sum(1 for result in results if result["status"] == "conflict"),
+        "invalid": sum(1 for result in results if result["status"] == "invalid"),
+        "results": results,
+    }
 
 
 @app.put("/update/{code}")
 async def update_url(code: str, url_data: dict):
-    """Update an existing URL entry"""
+    """Update an existing URL entry
+
+    If the body has any of ``status``, ``max_age`` and ``immutable`` the
+    redirect policy is replaced as well, with defaults for the fields left out.
+    """
     try:
         new_url = url_data["url"]
     except KeyError:
         raise HTTPException(status_code=500, detail="Missing 'url' field in request body")
+    if not isinstance(new_url, str):
+        raise HTTPException(status_code=422, detail="'url' must be a string")
+    policy = None
+    if url_data.keys() & RedirectPolicy.model_fields.keys():
+        try:
+            policy = RedirectPolicy.model_validate(url_data)
+        except ValidationError as exc:
+            raise HTTPException(status_code=422, detail=exc.errors(include_url=False, include_context=False))
 
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE urls SET url = ? WHERE code = ?", (new_url, code)
-        )
-        conn.commit()
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Code not found")
-        return {"message": "URL updated successfully"}
+    # One write, so the URL and policy are committed together
+    if not await write("update", code, new_url, policy.fields() if policy is not None else None):
+        raise HTTPException(status_code=404, detail="Code not found")
+    invalidate_code(code, OP_UPDATE)
+    return {"message": "URL updated successfully"}
 
 
 @app.delete("/delete/{code}")
 async def delete_url(code: str):
     """Delete a URL entry"""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM urls WHERE code = ?", (code,))
-        conn.commit()
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Code not found")
-        return {"message": "Entry deleted successfully"}
+    if not await write("delete", code):
+        raise HTTPException(status_code=404, detail="Code not found")
+    invalidate_code(code, OP_DELETE)
+    return {"message": "Entry deleted successfully"}
 
 
-@app.get("/{code}")
-async def resolve(code: str):
-    """Resolve a short code to its URL and redirect"""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT url FROM urls WHERE code = ?", (code,))
-        result = cursor.fetchone()
+async def lookup_redirect(code):
+    """Find the Redirect for a code: local cache, code filter, shared snapshot, then storage"""
+    sync_shared_cache()
+    redirect = url_cache.get(code)
+    if redirect is not None:
+        return redirect
+
+    current_filter = code_filter
+    if current_filter is not None and code not in current_filter:
+        code_filter_stats["rejections"] += 1
+        return None
 
-        if result:
-            return RedirectResponse(result[0], status_code=302)
+    version = url_cache.version
+    if shared_cache is not None:
+        redirect = shared_cache.get_redirect(code)
+        if redirect is not None:
+            url_cache.set(code, redirect, version=version)
+            return redirect
 
+    redirect = await db_executor.run_read(storage.get_redirect, code)
+    if redirect is not None:
+        url_cache.set(code, redirect, version=version)
+    elif current_filter is not None:
+        code_filter_stats["false_positives"] += 1
+    return redirect
+
+
+@app.get("/{code}")
+async def resolve(code: str, request: Request):
+    """Resolve a short code to its URL and redirect with the code's status and caching headers"""
+    redirect = await lookup_redirect(code)
+    if redirect is None:
         # Redirect to management page if code not found
         return RedirectResponse("/manage", status_code=302)
+
+    if ANALYTICS_ENABLED:
+        click_recorder.record(code, request.headers.get("referer"))
+    cache_control = redirect.cache_control()
+    return RedirectResponse(
+        redirect.url,
+        status_code=redirect.status,
+        headers={"cache-control": cache_control} if cache_control else None,
+    )
+
+
+def record_fast_path_click(code, headers):
+    fast_path_hits.inc()
+    if ANALYTICS_ENABLED:
+        for name, value in headers:
+            if name == b"referer":
+                click_recorder.record(code, value.decode("latin-1"))
+                return
+        click_recorder.record(code)
+
+
+# Codes that would be served by one of the app's own routes instead of /{code}
+RESERVED_CODES = frozenset(
+    route.path[1:] for route in app.routes if route.path.count("/") == 1 and "{" not in route.path
+) - {""}
+
+# Raw ASGI entry point that serves cache-hit redirects before FastAPI sees them
+fast_app = FastRedirectApp(app, url_cache, poll=sync_shared_cache, on_hit=record_fast_path_click)
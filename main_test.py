@@ -1,3 +1,5 @@
+import gzip
+import json
 import pytest
 import sqlite3
 import tempfile
@@ -17,6 +19,10 @@ def test_db():
     yield db_path
     os.close(db_fd)
     os.unlink(db_path)
+    # WAL mode leaves its side files next to the database
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.unlink(db_path + suffix)
 
 
 @pytest.fixture
@@ -93,6 +99,58 @@ class TestCreateShortURL:
         # Should succeed as empty string is valid, but might want to add validation
         assert response.status_code == 200 or response.status_code == 422
     
+    def test_create_short_url_generates_code(self, client):
+        response = client.post("/shorten", json={"url": "https://example.com"})
+        assert response.status_code == 200
+        code = response.json()["code"]
+        assert len(code) >= 4
+        resolve_response = client.get(f"/{code}", follow_redirects=False)
+        assert resolve_response.headers["location"] == "https://example.com"
+
+    def test_generated_codes_are_unique(self, client):
+        codes = {
+            client.post("/shorten", json={"url": f"https://example.com/{i}"}).json()["code"]
+            for i in range(50)
+        }
+        assert len(codes) == 50
+
+    def test_generated_codes_lease_blocks(self, client, monkeypatch):
+        import main
+
+        monkeypatch.setattr(main.code_allocator, "block_size", 10)
+        leases = main.code_allocator.leases
+        for i in range(25):
+            client.post("/shorten", json={"url": f"https://example.com/{i}"})
+        assert main.code_allocator.leases - leases == 3
+
+    def test_generated_code_skips_hand_picked_code(self, client):
+        from ids import base62_encode
+        from main import CODE_COUNTER_START
+
+        taken = base62_encode(CODE_COUNTER_START)
+        client.post("/shorten", json={"code": taken, "url": "https://picked.com"})
+        response = client.post("/shorten", json={"url": "https://generated.com"})
+        assert response.status_code == 200
+        assert response.json()["code"] == base62_encode(CODE_COUNTER_START + 1)
+
+    def test_generated_code_skips_reserved_codes(self, client, monkeypatch):
+        import main
+        from ids import ALPHABET
+
+        docs = 0
+        for char in "docs":
+            docs = docs * 62 + ALPHABET.index(char)
+        monkeypatch.setattr(main.code_allocator, "lease", lambda size: docs)
+        main.code_allocator.reset()
+        response = client.post("/shorten", json={"url": "https://generated.com"})
+        assert response.json()["code"] == "doct"
+        assert client.get("/docs").headers["content-type"].startswith("text/html")
+
+    def test_create_short_url_reserved_code(self, client):
+        response = client.post("/shorten", json={"code": "manage", "url": "https://example.com"})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Code is reserved"
+
     def test_create_short_url_special_characters(self, client):
         response = client.post(
             "/shorten",
@@ -101,6 +159,122 @@ class TestCreateShortURL:
         assert response.status_code == 200
 
 
+class TestBulkCreate:
+    """Tests for the bulk import endpoint"""
+
+    def test_bulk_create_json_array(self, client):
+        response = client.post(
+            "/shorten/bulk",
+            json=[
+                {"code": "a", "url": "https://a.com"},
+                {"code": "b", "url": "https://b.com"},
+            ],
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["received"] == 2
+        assert data["created"] == 2
+        assert data["results"] == []
+        assert client.get("/b", follow_redirects=False).headers["location"] == "https://b.com"
+
+    def test_bulk_create_ndjson_reports_conflicts(self, populated_client):
+        body = (
+            '{"code": "new1", "url": "https://new1.com"}\n'
+            '{"code": "test1", "url": "https://dup.com"}\n'
+            '{"code": "new1", "url": "https://again.com"}\n'
+            "not json\n"
+            '{"code": "missing-url"}\n'
+            '{"code": "new2", "url": "https://new2.com"}'
+        )
+        response = populated_client.post(
+            "/shorten/bulk",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["received"] == 6
+        assert data["created"] == 2
+        assert data["conflicts"] == 2
+        assert data["invalid"] == 2
+        assert [(r["index"], r["status"]) for r in data["results"]] == [
+            (1, "conflict"),
+            (2, "conflict"),
+            (3, "invalid"),
+            (4, "invalid"),
+        ]
+        # The existing entry was left untouched
+        resolve_response = populated_client.get("/test1", follow_redirects=False)
+        assert resolve_response.headers["location"] == "https://example.com"
+        assert populated_client.get("/new1", follow_redirects=False).headers["location"] == "https://new1.com"
+
+    def test_bulk_create_spans_batches(self, client, monkeypatch):
+        monkeypatch.setattr("main.BULK_BATCH_SIZE", 2)
+        records = [{"code": f"c{i}", "url": f"https://{i}.com"} for i in range(5)]
+        records.append({"code": "c0", "url": "https://dup.com"})
+        data = client.post("/shorten/bulk", json=records).json()
+        assert data["created"] == 5
+        assert data["results"][0]["index"] == 5
+
+    def test_bulk_create_generates_missing_codes(self, client):
+        data = client.post("/shorten/bulk", json=[{"url": "https://a.com"}, {"url": "https://b.com"}]).json()
+        assert data["created"] == 2
+
+    def test_bulk_create_rejects_non_array(self, client):
+        response = client.post("/shorten/bulk", json={"code": "a", "url": "https://a.com"})
+        assert response.status_code == 400
+
+
+class TestGroupCommit:
+    """Tests for the write-behind group commit mode"""
+
+    @pytest.fixture
+    def group_client(self, populated_client, monkeypatch):
+        monkeypatch.setattr("main.GROUP_COMMIT", True)
+        yield populated_client
+
+    def test_crud_through_group_commit(self, group_client):
+        import main
+
+        ops = main.write_batcher.ops
+        response = group_client.post("/shorten", json={"code": "grouped", "url": "https://g.com"})
+        assert response.status_code == 200
+        # Acknowledged writes are committed and visible straight away
+        assert group_client.get("/grouped", follow_redirects=False).headers["location"] == "https://g.com"
+
+        assert group_client.post("/shorten", json={"code": "grouped", "url": "https://x.com"}).status_code == 400
+        assert group_client.put("/update/grouped", json={"url": "https://new.com"}).status_code == 200
+        assert group_client.get("/grouped", follow_redirects=False).headers["location"] == "https://new.com"
+        assert group_client.put("/update/missing", json={"url": "https://new.com"}).status_code == 404
+        assert group_client.delete("/delete/grouped").status_code == 200
+        assert main.write_batcher.ops - ops == 5
+        stats = group_client.get("/cache/stats").json()["group_commit"]
+        assert stats["ops"] == main.write_batcher.ops
+        assert stats["pending"] == 0
+
+
+class TestExport:
+    """Tests for the export endpoint"""
+
+    def test_export_ndjson(self, populated_client):
+        response = populated_client.get("/export")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        codes = [json.loads(line)["code"] for line in response.text.splitlines()]
+        assert codes == ["github", "test1", "test2"]
+
+    def test_export_csv_gzip(self, populated_client):
+        response = populated_client.get("/export?format=csv&gzip=true")
+        assert response.status_code == 200
+        assert 'filename="urls.csv.gz"' in response.headers["content-disposition"]
+        lines = gzip.decompress(response.content).decode().splitlines()
+        assert lines[0] == "code,url,status,max_age,immutable,host"
+        assert len(lines) == 4
+
+    def test_export_unknown_format(self, client):
+        assert client.get("/export?format=xml").status_code == 400
+
+
 class TestUpdateURL:
     """Tests for updating URLs"""
     
@@ -125,6 +299,12 @@ class TestUpdateURL:
         assert response.status_code == 404
         assert response.json()["detail"] == "Code not found"
     
+    def test_update_with_non_string_url(self, populated_client):
+        for url in (123, ["https://a.com"], None):
+            response = populated_client.put("/update/test1", json={"url": url})
+            assert response.status_code == 422
+        assert populated_client.get("/test1", follow_redirects=False).headers["location"] == "https://example.com"
+
     def test_update_with_invalid_data(self, populated_client):
         response = populated_client.put("/update/test1", json={})
         # Should fail due to missing 'url' key
@@ -179,6 +359,167 @@ class TestResolveURL:
         assert response.status_code in [200, 302]
 
 
+class TestResolveCache:
+    """Tests for the redirect cache in front of resolve"""
+
+    def test_resolve_served_from_cache(self, populated_client, test_db):
+        populated_client.get("/test1", follow_redirects=False)
+
+        # Change the row behind the cache's back; the cached URL is still served
+        conn = sqlite3.connect(test_db)
+        conn.execute("UPDATE urls SET url = 'https://stale.com' WHERE code = 'test1'")
+        conn.commit()
+        conn.close()
+
+        response = populated_client.get("/test1", follow_redirects=False)
+        assert response.headers["location"] == "https://example.com"
+        assert populated_client.get("/cache/stats").json()["hits"] == 1
+
+    def test_update_invalidates_cache(self, populated_client):
+        populated_client.get("/test1", follow_redirects=False)
+        populated_client.put("/update/test1", json={"url": "https://new.com"})
+        response = populated_client.get("/test1", follow_redirects=False)
+        assert response.headers["location"] == "https://new.com"
+
+    def test_delete_invalidates_cache(self, populated_client):
+        populated_client.get("/test1", follow_redirects=False)
+        populated_client.delete("/delete/test1")
+        response = populated_client.get("/test1", follow_redirects=False)
+        assert response.headers["location"] == "/manage"
+
+    def test_cache_stats(self, populated_client):
+        populated_client.get("/test1", follow_redirects=False)
+        populated_client.get("/test1", follow_redirects=False)
+        stats = populated_client.get("/cache/stats").json()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["size"] == 1
+
+
+class TestFastPath:
+    """Tests for serving redirects through the raw ASGI fast path"""
+
+    def test_fast_app_serves_full_api(self, populated_client):
+        from main import fast_app
+
+        fast_client = TestClient(fast_app)
+        # Miss: resolved by FastAPI, which fills the cache
+        response = fast_client.get("/test1", follow_redirects=False)
+        assert response.headers["location"] == "https://example.com"
+        # Hit: answered by the fast path
+        response = fast_client.get("/test1", follow_redirects=False)
+        assert response.status_code == 302
+        assert response.headers["location"] == "https://example.com"
+        assert fast_client.get("/cache/stats").json()["hits"] == 1
+
+        fast_client.put("/update/test1", json={"url": "https://new.com"})
+        response = fast_client.get("/test1", follow_redirects=False)
+        assert response.headers["location"] == "https://new.com"
+
+
+class TestSharedCache:
+    """Tests for the multi-worker shared read cache"""
+
+    @pytest.fixture
+    def shared_client(self, populated_client, tmp_path, monkeypatch):
+        import main
+        from shared import SharedCache
+
+        cache = SharedCache(tmp_path, on_invalidate=main.on_shared_invalidation)
+        cache.rebuild(main.storage.iter_entries)
+        cache.load()
+        monkeypatch.setattr("main.shared_cache", cache)
+        yield populated_client
+        cache.close()
+
+    def test_resolve_served_from_snapshot(self, shared_client, test_db):
+        # Remove the row from the database: only the snapshot can answer
+        conn = sqlite3.connect(test_db)
+        conn.execute("DELETE FROM urls WHERE code = 'test2'")
+        conn.commit()
+        conn.close()
+
+        response = shared_client.get("/test2", follow_redirects=False)
+        assert response.headers["location"] == "https://google.com"
+        assert shared_client.get("/cache/stats").json()["shared"]["hits"] == 1
+
+    def test_update_from_another_worker_invalidates(self, shared_client, test_db, tmp_path):
+        from shared import OP_UPDATE, SharedCache
+
+        shared_client.get("/test1", follow_redirects=False)
+        # Another worker updates the row and publishes the change
+        conn = sqlite3.connect(test_db)
+        conn.execute("UPDATE urls SET url = 'https://other.com' WHERE code = 'test1'")
+        conn.commit()
+        conn.close()
+        other_worker = SharedCache(tmp_path)
+        other_worker.publish(OP_UPDATE, "test1")
+        other_worker.close()
+
+        response = shared_client.get("/test1", follow_redirects=False)
+        assert response.headers["location"] == "https://other.com"
+
+    def test_local_writes_are_published(self, shared_client, tmp_path):
+        shared_client.put("/update/test1", json={"url": "https://new.com"})
+        shared_client.delete("/delete/test2")
+        shared_client.post("/shorten", json={"code": "fresh", "url": "https://fresh.com"})
+
+        from shared import OP_CREATE, OP_DELETE, OP_UPDATE, InvalidationLog
+
+        log = InvalidationLog(tmp_path / "invalidations.log")
+        assert [(op, code) for _, op, code in log.read_since(0)[1]] == [
+            (OP_UPDATE, "test1"),
+            (OP_DELETE, "test2"),
+            (OP_CREATE, "fresh"),
+        ]
+        log.close()
+        response = shared_client.get("/test1", follow_redirects=False)
+        assert response.headers["location"] == "https://new.com"
+        response = shared_client.get("/test2", follow_redirects=False)
+        assert response.headers["location"] == "/manage"
+
+
+class TestAnalytics:
+    """Tests for click analytics on the redirect path"""
+
+    def flush(self):
+        import asyncio
+
+        from main import flush_clicks
+
+        asyncio.run(flush_clicks())
+
+    def test_clicks_are_counted(self, populated_client):
+        populated_client.get("/test1", follow_redirects=False, headers={"Referer": "https://news.com/a"})
+        populated_client.get("/test1", follow_redirects=False)
+        populated_client.get("/test2", follow_redirects=False)
+        populated_client.get("/nonexistent", follow_redirects=False)
+        self.flush()
+
+        top = populated_client.get("/analytics/top").json()["codes"]
+        assert top == [{"code": "test1", "clicks": 2}, {"code": "test2", "clicks": 1}]
+
+        data = populated_client.get("/analytics/codes/test1").json()
+        assert sum(point["clicks"] for point in data["series"]) == 2
+        assert {"referrer": "news.com", "clicks": 1} in data["referrers"]
+
+    def test_fast_path_clicks_are_counted(self, populated_client):
+        from main import fast_app
+
+        fast_client = TestClient(fast_app)
+        for _ in range(3):
+            fast_client.get("/github", follow_redirects=False, headers={"Referer": "https://a.com/"})
+        self.flush()
+        data = populated_client.get("/analytics/codes/github").json()
+        assert data["referrers"] == [{"referrer": "a.com", "clicks": 3}]
+
+    def test_disabled(self, populated_client, monkeypatch):
+        monkeypatch.setattr("main.ANALYTICS_ENABLED", False)
+        populated_client.get("/test1", follow_redirects=False)
+        self.flush()
+        assert populated_client.get("/analytics/top").json()["codes"] == []
+
+
 class TestManagePage:
     """Tests for the management page"""
     
@@ -207,6 +548,30 @@ class TestManagePage:
         assert "createForm" in response.text
         assert "Create New Entry" in response.text
 
+    def test_manage_page_paginates_by_code(self, populated_client):
+        # Codes in order: github, test1, test2
+        response = populated_client.get("/manage?limit=2")
+        assert response.status_code == 200
+        assert "github" in response.text
+        assert "test1" in response.text
+        assert "test2" not in response.text
+        assert "/manage?after=test1&amp;limit=2" in response.text
+
+        response = populated_client.get("/manage?after=test1&limit=2")
+        assert "test2" in response.text
+        assert "github" not in response.text
+        assert "Next page" not in response.text
+
+    def test_manage_page_rejects_invalid_limit(self, client):
+        assert client.get("/manage?limit=0").status_code == 422
+        assert client.get("/manage?limit=100000").status_code == 422
+
+    def test_manage_page_escapes_entries(self, client):
+        client.post("/shorten", json={"code": "xss", "url": "https://a.com/\"><script>"})
+        response = client.get("/manage")
+        assert '"><script>' not in response.text
+        assert "&quot;&gt;&lt;script&gt;" in response.text
+
 
 class TestDatabaseOperations:
     """Tests for database operations"""
@@ -238,6 +603,48 @@ class TestDatabaseOperations:
         # Connection should be closed after exiting context
         # This is implicit in the context manager behavior
 
+    def test_cache_stats_report_storage(self, populated_client, tmp_path, monkeypatch):
+        import main
+
+        stats = populated_client.get("/cache/stats").json()["sqlite"]
+        assert stats["read_pool"]["readonly"] is True
+        assert stats["write_pool"]["open"] >= 1
+
+        monkeypatch.setattr("main.STORAGE_BACKEND", "log")
+        monkeypatch.setattr("main.LOG_STORE_DIR", str(tmp_path / "logstore"))
+        main.init_db()
+        populated_client.post("/shorten", json={"code": "logged", "url": "https://log.com"})
+        assert populated_client.get("/cache/stats").json()["log"]["entries"] == 1
+        main.storage.close()
+
+    def test_single_process_backends_refuse_several_workers(self, monkeypatch):
+        import main
+
+        monkeypatch.setattr("main.WORKERS", 4)
+        for backend in ("log", "memory"):
+            monkeypatch.setattr("main.STORAGE_BACKEND", backend)
+            with pytest.raises(ValueError, match="WORKERS=1"):
+                main.open_storage()
+
+    def test_database_uses_wal_journal(self, test_db, monkeypatch):
+        monkeypatch.setattr("main.DATABASE", test_db)
+        from main import init_db
+
+        init_db()
+
+        conn = sqlite3.connect(test_db)
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        conn.close()
+
+    def test_readonly_role_rejects_writes(self, test_db, monkeypatch):
+        monkeypatch.setattr("main.DATABASE", test_db)
+        from main import get_db, init_db
+
+        init_db()
+
+        with get_db(readonly=True) as conn, pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO urls (code, url) VALUES ('x', 'y')")
+
 
 class TestEdgeCases:
     """Tests for edge cases and special scenarios"""
@@ -335,4 +742,507 @@ class TestIntegrationScenarios:
         # Verify management page updated
         response2 = client.get("/manage")
         assert "api1" not in response2.text
-        assert "api2" in response2.text
\ No newline at end of file
+        assert "api2" in response2.text
+
+class TestCodeFilter:
+    """Tests for answering unknown codes from the negative-lookup filter"""
+
+    @pytest.fixture
+    def filtered_client(self, populated_client):
+        import asyncio
+
+        from main import rebuild_code_filter
+
+        asyncio.run(rebuild_code_filter())
+        yield populated_client
+
+    def test_unknown_code_skips_database(self, filtered_client):
+        import main
+
+        with patch.object(main.storage, "get_redirect", return_value=None) as get_redirect:
+            response = filtered_client.get("/nonexistent", follow_redirects=False)
+        assert response.headers["location"] == "/manage"
+        get_redirect.assert_not_called()
+        assert filtered_client.get("/cache/stats").json()["filter"]["rejections"] == 1
+
+    def test_existing_codes_still_resolve(self, filtered_client):
+        response = filtered_client.get("/github", follow_redirects=False)
+        assert response.headers["location"] == "https://github.com"
+
+    def test_created_code_is_added(self, filtered_client):
+        filtered_client.post("/shorten", json={"code": "fresh", "url": "https://fresh.com"})
+        code = filtered_client.post("/shorten", json={"url": "https://generated.com"}).json()["code"]
+        filtered_client.post("/shorten/bulk", json=[{"code": "bulk1", "url": "https://bulk.com"}])
+
+        for path in ("/fresh", f"/{code}", "/bulk1"):
+            assert filtered_client.get(path, follow_redirects=False).headers["location"] != "/manage"
+
+    def test_deleted_code_is_removed(self, filtered_client):
+        import main
+
+        filtered_client.get("/test1", follow_redirects=False)
+        filtered_client.delete("/delete/test1")
+        with patch.object(main.storage, "get_redirect", return_value=None) as get_redirect:
+            response = filtered_client.get("/test1", follow_redirects=False)
+        assert response.headers["location"] == "/manage"
+        get_redirect.assert_not_called()
+
+    def test_size_and_accuracy_metrics(self, filtered_client, monkeypatch):
+        import main
+
+        text = filtered_client.get("/metrics").text
+        assert f"code_filter_memory_bytes {main.code_filter.memory_bytes}\n" in text
+        rate = text.split("code_filter_expected_false_positive_rate ")[-1].split("\n")[0]
+        assert 0 <= float(rate) < 0.01
+        monkeypatch.setattr("main.code_filter", None)
+        text = filtered_client.get("/metrics").text
+        assert "code_filter_memory_bytes 0\n" in text
+        assert "code_filter_expected_false_positive_rate 0\n" in text
+
+    def test_stats_report_size_and_accuracy(self, filtered_client):
+        stats = filtered_client.get("/cache/stats").json()["filter"]
+        assert stats["enabled"] is True
+        assert stats["entries"] == 3
+        assert stats["memory_bytes"] > 0
+        assert 0 <= stats["expected_false_positive_rate"] < 0.01
+        assert stats["observed_false_positive_rate"] == 0.0
+
+    def test_disabled_until_built(self, populated_client):
+        response = populated_client.get("/nonexistent", follow_redirects=False)
+        assert response.headers["location"] == "/manage"
+        assert populated_client.get("/cache/stats").json()["filter"]["enabled"] is False
+
+    def test_auto_mode_needs_the_shared_cache(self, monkeypatch):
+        import main
+
+        monkeypatch.setattr("main.SHARED_CACHE_DIR", None)
+        assert not main.code_filter_wanted("auto")
+        assert main.code_filter_wanted("1")
+        monkeypatch.setattr("main.SHARED_CACHE_DIR", "shared")
+        assert main.code_filter_wanted("auto")
+        assert not main.code_filter_wanted("0")
+
+    def test_startup_builds_filter_in_background(self, populated_client, monkeypatch):
+        import asyncio
+
+        import main
+
+        monkeypatch.setattr("main.CODE_FILTER_ENABLED", True)
+        monkeypatch.setattr("main.WARMUP_CODES", 0)
+
+        async def start():
+            await main.startup_event()
+            assert main.code_filter is None
+            await main._code_filter_task
+            assert "github" in main.code_filter
+            await main.shutdown_event()
+
+        asyncio.run(start())
+
+    def test_code_created_by_another_worker_is_added(self, filtered_client, tmp_path, test_db, monkeypatch):
+        import main
+        from shared import OP_CREATE, SharedCache
+
+        cache = SharedCache(tmp_path, on_invalidate=main.on_shared_invalidation)
+        monkeypatch.setattr("main.shared_cache", cache)
+        conn = sqlite3.connect(test_db)
+        conn.execute("INSERT INTO urls (code, url) VALUES ('elsewhere', 'https://elsewhere.com')")
+        conn.commit()
+        conn.close()
+        other_worker = SharedCache(tmp_path)
+        other_worker.publish(OP_CREATE, "elsewhere")
+        other_worker.close()
+
+        response = filtered_client.get("/elsewhere", follow_redirects=False)
+        assert response.headers["location"] == "https://elsewhere.com"
+        cache.close()
+
+
+class TestMetrics:
+    """Tests for the Prometheus metrics endpoint"""
+
+    def test_route_latency_is_labelled_by_template(self, populated_client):
+        populated_client.get("/test1", follow_redirects=False)
+        populated_client.get("/test1", follow_redirects=False)
+        response = populated_client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        text = response.text
+        assert 'http_requests_total{method="GET",route="/{code}",status="302"}' in text
+        assert 'http_request_duration_seconds_count{method="GET",route="/{code}"}' in text
+        assert "/test1" not in text
+
+    def test_database_and_cache_metrics(self, populated_client):
+        populated_client.get("/test1", follow_redirects=False)
+        populated_client.get("/test1", follow_redirects=False)
+        text = populated_client.get("/metrics").text
+        assert 'db_connection_wait_seconds_count{role="read"}' in text
+        assert 'db_query_seconds_count{role="write"}' in text
+        assert "url_cache_hits_total 1\n" in text
+        assert "url_cache_hit_ratio 0.5\n" in text
+
+    def test_in_flight_gauge_counts_current_request(self, client):
+        # The scrape itself is the only request in flight
+        assert "http_requests_in_flight 1\n" in client.get("/metrics").text
+
+
+class TestProfiler:
+    """Tests for the admin profiling endpoint"""
+
+    def test_disabled_by_default(self, client):
+        assert client.post("/admin/profile?seconds=0.01").status_code == 404
+
+    def test_returns_collapsed_stacks(self, client, monkeypatch):
+        monkeypatch.setattr("main.PROFILING_ENABLED", True)
+        monkeypatch.setattr("main.profiler.interval", 0.001)
+        response = client.post("/admin/profile?seconds=0.05")
+        assert response.status_code == 200
+        assert "profile.folded" in response.headers["content-disposition"]
+        lines = response.text.splitlines()
+        assert lines
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            assert stack and int(count) > 0
+
+    def test_rejects_long_profiles(self, client, monkeypatch):
+        monkeypatch.setattr("main.PROFILING_ENABLED", True)
+        assert client.post("/admin/profile?seconds=3600").status_code == 422
+
+
+class TestReplica:
+    """Tests for serving redirects from a read-only snapshot"""
+
+    @pytest.fixture
+    def replica_client(self, populated_client, tmp_path, monkeypatch):
+        import main
+        from replica import build_replica_snapshot
+
+        path = tmp_path / "urls.snapshot"
+        build_replica_snapshot(main.storage, path)
+        monkeypatch.setattr("main.STORAGE_BACKEND", "replica")
+        monkeypatch.setattr("main.REPLICA_SNAPSHOT", path)
+        main.init_db()
+        yield populated_client
+
+    def test_resolves_from_snapshot(self, replica_client):
+        response = replica_client.get("/github", follow_redirects=False)
+        assert response.headers["location"] == "https://github.com"
+        response = replica_client.get("/nonexistent", follow_redirects=False)
+        assert response.headers["location"] == "/manage"
+        assert replica_client.get("/cache/stats").json()["replica"]["entries"] == 3
+
+    def test_writes_are_rejected(self, replica_client):
+        assert replica_client.post("/shorten", json={"code": "new", "url": "https://new.com"}).status_code == 405
+        assert replica_client.post("/shorten", json={"url": "https://new.com"}).status_code == 405
+        response = replica_client.post("/shorten", json={"url": "https://example.com", "dedupe": True})
+        assert response.status_code == 405
+        assert replica_client.put("/update/test1", json={"url": "https://new.com"}).status_code == 405
+        assert replica_client.delete("/delete/test1").status_code == 405
+        response = replica_client.get("/test1", follow_redirects=False)
+        assert response.headers["location"] == "https://example.com"
+
+    def test_reload_picks_up_replaced_snapshot(self, replica_client, tmp_path):
+        import main
+        from snapshot import write_snapshot
+
+        replica_client.get("/test1", follow_redirects=False)
+        write_snapshot(tmp_path / "urls.snapshot", [("test1", "https://moved.com")])
+        assert main.reload_replica() is True
+        assert main.reload_replica() is False
+        response = replica_client.get("/test1", follow_redirects=False)
+        assert response.headers["location"] == "https://moved.com"
+        response = replica_client.get("/github", follow_redirects=False)
+        assert response.headers["location"] == "/manage"
+
+
+    def test_reload_with_shared_cache_configured(self, replica_client, tmp_path, monkeypatch):
+        import asyncio
+
+        import main
+        from snapshot import write_snapshot
+
+        monkeypatch.setattr("main.SHARED_CACHE_DIR", str(tmp_path / "shared"))
+        monkeypatch.setattr("main.CODE_FILTER_ENABLED", True)
+        monkeypatch.setattr("main.WARMUP_CODES", 0)
+
+        async def run():
+            await main.startup_event()
+            assert main.shared_cache is None
+            await main._code_filter_task
+            assert (await main.lookup_redirect("test1")).url == "https://example.com"
+            write_snapshot(tmp_path / "urls.snapshot", [("test1", "https://moved.com")])
+            assert main.reload_replica() is True
+            assert (await main.lookup_redirect("test1")).url == "https://moved.com"
+            assert await main.lookup_redirect("github") is None
+            await main.shutdown_event()
+
+        asyncio.run(run())
+
+
+class TestWarmup:
+    """Tests for startup cache warmup and the readiness probe"""
+
+    def test_not_ready_until_warmed(self, client):
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["warmup"]["state"] == "pending"
+
+    def test_preloads_hottest_codes_from_file(self, populated_client, tmp_path, monkeypatch):
+        import asyncio
+
+        import main
+        from warmup import save_hot_codes
+
+        path = tmp_path / "hot.json"
+        save_hot_codes(path, [{"code": "github", "clicks": 5}, {"code": "gone", "clicks": 2}])
+        monkeypatch.setattr("main.WARMUP_FILE", str(path))
+        main.url_cache.clear()
+        asyncio.run(main.warm_up())
+
+        response = populated_client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["warmup"]["codes"] == 2
+        assert response.json()["warmup"]["loaded"] == 1
+        with patch.object(main.storage, "get_redirect", return_value=None) as get_redirect:
+            response = populated_client.get("/github", follow_redirects=False)
+        assert response.headers["location"] == "https://github.com"
+        get_redirect.assert_not_called()
+
+    def test_skips_codes_named_after_routes(self, populated_client, tmp_path, monkeypatch):
+        import asyncio
+
+        import main
+        from warmup import save_hot_codes
+
+        # Stored before reserved codes were refused
+        main.storage.put("manage", "https://legacy.com")
+        path = tmp_path / "hot.json"
+        save_hot_codes(path, [{"code": "manage", "clicks": 5}, {"code": "github", "clicks": 2}])
+        monkeypatch.setattr("main.WARMUP_FILE", str(path))
+        main.url_cache.clear()
+        asyncio.run(main.warm_up())
+
+        assert main.warmup_status["codes"] == 1
+        assert main.url_cache.get("manage") is None
+        response = TestClient(main.fast_app).get("/manage", follow_redirects=False)
+        assert response.status_code == 200
+        assert "URL Shortener Management" in response.text
+
+    def test_falls_back_to_click_analytics(self, populated_client, monkeypatch):
+        import asyncio
+
+        import main
+
+        for _ in range(3):
+            populated_client.get("/test2", follow_redirects=False)
+        populated_client.get("/test1", follow_redirects=False)
+        asyncio.run(main.flush_clicks())
+        monkeypatch.setattr("main.WARMUP_CODES", 1)
+        main.url_cache.clear()
+        asyncio.run(main.warm_up())
+
+        assert main.warmup_status["loaded"] == 1
+        assert main.url_cache.get("test2").url == "https://google.com"
+        assert main.url_cache.get("test1") is None
+
+    def test_hot_codes_saved_on_shutdown(self, populated_client, tmp_path, monkeypatch):
+        import asyncio
+
+        import main
+        from warmup import load_hot_codes
+
+        path = tmp_path / "hot.json"
+        monkeypatch.setattr("main.WARMUP_FILE", str(path))
+        populated_client.get("/github", follow_redirects=False)
+        asyncio.run(main.flush_clicks())
+        asyncio.run(main.shutdown_event())
+        assert load_hot_codes(path) == ["github"]
+
+
+class TestRedirectPolicy:
+    """Tests for per-code redirect status and caching headers"""
+
+    def test_default_is_uncached_302(self, populated_client):
+        response = populated_client.get("/test1", follow_redirects=False)
+        assert response.status_code == 302
+        assert "cache-control" not in response.headers
+
+    def test_permanent_cached_redirect(self, client):
+        response = client.post(
+            "/shorten", json={"code": "perm", "url": "https://perm.com", "status": 301, "max_age": 86400}
+        )
+        assert response.json()["status"] == 301
+        for _ in range(2):
+            # Answered from storage, then from the redirect cache
+            response = client.get("/perm", follow_redirects=False)
+            assert response.status_code == 301
+            assert response.headers["cache-control"] == "public, max-age=86400"
+
+    def test_immutable_generated_code(self, client):
+        code = client.post("/shorten", json={"url": "https://a.com", "status": 308, "immutable": True}).json()["code"]
+        response = client.get(f"/{code}", follow_redirects=False)
+        assert response.status_code == 308
+        assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+
+    def test_invalid_policy_is_rejected(self, client):
+        assert client.post("/shorten", json={"url": "https://a.com", "status": 303}).status_code == 422
+        assert client.post("/shorten", json={"url": "https://a.com", "max_age": -1}).status_code == 422
+
+    def test_update_changes_policy(self, populated_client):
+        populated_client.get("/test1", follow_redirects=False)
+        response = populated_client.put("/update/test1", json={"url": "https://new.com", "status": 307, "max_age": 5})
+        assert response.status_code == 200
+        response = populated_client.get("/test1", follow_redirects=False)
+        assert response.status_code == 307
+        assert response.headers["location"] == "https://new.com"
+        assert response.headers["cache-control"] == "public, max-age=5"
+        # A plain URL update keeps the policy
+        populated_client.put("/update/test1", json={"url": "https://newer.com"})
+        assert populated_client.get("/test1", follow_redirects=False).status_code == 307
+
+    def test_update_with_invalid_policy_changes_nothing(self, populated_client):
+        response = populated_client.put("/update/test1", json={"url": "https://new.com", "status": 200})
+        assert response.status_code == 422
+        assert populated_client.get("/test1", follow_redirects=False).headers["location"] == "https://example.com"
+
+    def test_update_with_policy_is_one_write(self, populated_client):
+        import main
+
+        populated_client.get("/test1", follow_redirects=False)
+        with patch.object(main.storage, "update", wraps=main.storage.update) as update:
+            response = populated_client.put("/update/test1", json={"url": "https://new.com", "status": 301})
+        assert response.status_code == 200
+        update.assert_called_once_with("test1", "https://new.com", (301, None, False))
+        response = populated_client.get("/test1", follow_redirects=False)
+        assert (response.status_code, response.headers["location"]) == (301, "https://new.com")
+
+    def test_bulk_create_with_policy(self, client):
+        client.post("/shorten/bulk", json=[{"code": "b1", "url": "https://b.com", "status": 301}])
+        assert client.get("/b1", follow_redirects=False).status_code == 301
+
+
+class TestConditionalListing:
+    """Tests for ETags and 304 responses on listings"""
+
+    def test_unchanged_manage_page_is_not_modified(self, populated_client):
+        import main
+
+        response = populated_client.get("/manage")
+        etag = response.headers["etag"]
+        assert response.headers["cache-control"] == "no-cache"
+        with patch.object(main.storage, "scan") as scan:
+            response = populated_client.get("/manage", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+        scan.assert_not_called()
+
+    def test_writes_change_the_etag(self, populated_client):
+        etags = [populated_client.get("/manage").headers["etag"]]
+        populated_client.post("/shorten", json={"code": "new", "url": "https://new.com"})
+        etags.append(populated_client.get("/manage").headers["etag"])
+        populated_client.put("/update/new", json={"url": "https://newer.com"})
+        etags.append(populated_client.get("/manage").headers["etag"])
+        populated_client.delete("/delete/new")
+        etags.append(populated_client.get("/manage").headers["etag"])
+        assert len(set(etags)) == 4
+        response = populated_client.get("/manage", headers={"If-None-Match": etags[0]})
+        assert response.status_code == 200
+        assert "test1" in response.text
+
+    def test_if_none_match_lists_and_weak_tags(self, populated_client):
+        etag = populated_client.get("/export").headers["etag"]
+        for header in (f'"stale", W/{etag}', "*"):
+            assert populated_client.get("/export", headers={"If-None-Match": header}).status_code == 304
+        assert populated_client.get("/export", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+class TestEntriesAPI:
+    """Tests for the paginated JSON listing"""
+
+    def test_pages_follow_cursor(self, populated_client):
+        response = populated_client.get("/entries", params={"limit": 2})
+        assert response.status_code == 200
+        assert response.headers["etag"]
+        page = response.json()
+        assert [entry["code"] for entry in page["entries"]] == ["github", "test1"]
+        assert page["entries"][0] == {
+            "code": "github",
+            "url": "https://github.com",
+            "status": 302,
+            "max_age": None,
+            "immutable": False,
+        }
+        page = populated_client.get("/entries", params={"limit": 2, "after": page["next"]}).json()
+        assert page == {"entries": [page["entries"][0]], "next": None}
+        assert page["entries"][0]["code"] == "test2"
+
+    def test_filters(self, populated_client):
+        populated_client.post("/shorten", json={"code": "test3", "url": "https://docs.GitHub.com/x"})
+        page = populated_client.get("/entries", params={"prefix": "test"}).json()
+        assert [entry["code"] for entry in page["entries"]] == ["test1", "test2", "test3"]
+        page = populated_client.get("/entries", params={"host": "GitHub", "limit": 1}).json()
+        assert [entry["code"] for entry in page["entries"]] == ["github"]
+        assert page["next"] is None
+        page = populated_client.get("/entries", params={"host": "", "limit": 2}).json()
+        assert [entry["code"] for entry in page["entries"]] == ["test3", "test1"]
+        page = populated_client.get("/entries", params={"host": "", "after": page["next"]}).json()
+        assert [entry["code"] for entry in page["entries"]] == ["github", "test2"]
+
+    def test_rejects_bad_cursor(self, populated_client):
+        code_cursor = populated_client.get("/entries", params={"limit": 1}).json()["next"]
+        for params in ({"after": "!!"}, {"after": "e30"}, {"after": code_cursor, "host": "x"}):
+            assert populated_client.get("/entries", params=params).status_code == 400
+
+
+class TestSearch:
+    """Tests for searching URLs"""
+
+    def test_finds_urls_containing_text(self, populated_client):
+        populated_client.post("/shorten", json={"code": "promo", "url": "https://example.com/Promo?x=1"})
+        response = populated_client.get("/search", params={"q": "EXAMPLE.com"})
+        assert response.status_code == 200
+        assert response.headers["etag"]
+        page = response.json()
+        assert sorted(entry["code"] for entry in page["entries"]) == ["promo", "test1"]
+        assert page["truncated"] is False
+        page = populated_client.get("/search", params={"q": "example.com/promo"}).json()
+        assert page["entries"] == [
+            {
+                "code": "promo",
+                "url": "https://example.com/Promo?x=1",
+                "status": 302,
+                "max_age": None,
+                "immutable": False,
+            }
+        ]
+
+    def test_limit_and_short_queries(self, populated_client):
+        page = populated_client.get("/search", params={"q": "https", "limit": 2}).json()
+        assert len(page["entries"]) == 2
+        assert page["truncated"] is True
+        assert populated_client.get("/search", params={"q": "ex"}).status_code == 422
+
+
+
+class TestDedupe:
+    """Tests for deduplicated creation"""
+
+    def test_returns_existing_code_for_equivalent_url(self, client):
+        first = client.post("/shorten", json={"url": "https://Example.com:443", "dedupe": True}).json()
+        assert first["created"] is True
+        second = client.post("/shorten", json={"url": "https://example.com/", "dedupe": True}).json()
+        assert second["code"] == first["code"]
+        assert second["created"] is False
+        assert second["message"] == "Existing short URL returned"
+        other_policy = client.post("/shorten", json={"url": "https://example.com/", "status": 301, "dedupe": True})
+        assert other_policy.json()["code"] != first["code"]
+        without = client.post("/shorten", json={"url": "https://example.com/"}).json()
+        assert without["created"] is True
+        assert without["code"] != first["code"]
+
+    def test_rejected_with_explicit_code_or_in_bulk(self, client):
+        response = client.post("/shorten", json={"code": "mine", "url": "https://a.com", "dedupe": True})
+        assert response.status_code == 400
+        response = client.post("/shorten/bulk", json=[{"url": "https://a.com", "dedupe": True}])
+        assert response.json()["invalid"] == 1
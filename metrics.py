@@ -0,0 +1,249 @@
+import bisect
+import math
+import threading
+import time
+
+# Seconds; redirects served from memory land in the first few buckets
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+class ShardedMetric:
+    """Base for metrics whose values live in one dict per writing thread
+
+    A thread only ever writes its own shard, so recording a value takes no
+    lock. The lock is only taken the first time a thread records anything and
+    when the values are collected.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _copies(self):
+        with self._lock:
+            shards = list(self._shards)
+        # dict.copy() is atomic under the GIL, so a writer can't break it
+        return [shard.copy() for shard in shards]
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(ShardedMetric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def values(self):
+        totals = {}
+        for shard in self._copies():
+            for labels, value in shard.items():
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def value(self, *labels):
+        return self.values().get(labels, 0)
+
+    def render(self):
+        lines = self.header()
+        for labels, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{format_labels(self.labels, labels)} {format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """A counter that may also go down, e.g. requests in flight"""
+
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(ShardedMetric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        shard = self._shard()
+        entry = shard.get(labels)
+        if entry is None:
+            # One count per bucket, one for +Inf, then the running sum
+            entry = shard[labels] = [0] * (len(self.buckets) + 2)
+        entry[bisect.bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def values(self):
+        """Return {labels: (per-bucket counts including +Inf, sum)}"""
+        totals = {}
+        for shard in self._copies():
+            for labels, entry in shard.items():
+                entry = list(entry)
+                total = totals.get(labels)
+                if total is None:
+                    totals[labels] = entry
+                else:
+                    totals[labels] = [a + b for a, b in zip(total, entry)]
+        return {labels: (entry[:-1], entry[-1]) for labels, entry in totals.items()}
+
+    def render(self):
+        lines = self.header()
+        bounds = self.buckets + (math.inf,)
+        for labels, (counts, total) in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                label_text = format_labels(self.labels, labels, [("le", format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+            label_text = format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{label_text} {format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Callback:
+    """A metric read from existing state when collected, e.g. cache counters
+
+    ``read()`` returns a number, or a dict of label value tuples to numbers.
+    """
+
+    def __init__(self, name, documentation, read, kind="gauge", labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.kind = kind
+        self.labels = tuple(labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        values = self.read()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, labels)} {format_value(value)}")
+        return lines
+
+
+class Registry:
+    """Named collection of metrics rendered in the Prometheus text format
+
+    Asking for a metric that already exists returns it, so modules and
+    middleware can share one by name.
+    """
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._get_or_create(name, lambda: Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._get_or_create(name, lambda: Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(name, lambda: Histogram(name, documentation, labels, buckets))
+
+    def callback(self, name, documentation, read, kind="gauge", labels=()):
+        return self._get_or_create(name, lambda: Callback(name, documentation, read, kind, labels))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetrics:
+    """ASGI middleware recording per-route request counts, latency and requests in flight
+
+    Routes are labelled with their path template (``/{code}``, not the code
+    itself) so the number of series stays bounded; requests that match no
+    route share one label. Latency covers the whole response, including a
+    streamed body.
+    """
+
+    def __init__(self, app, registry):
+        self.app = app
+        self.requests = registry.counter(
+            "http_requests_total", "HTTP requests handled", ("method", "route", "status")
+        )
+        self.latency = registry.histogram(
+            "http_request_duration_seconds", "Time to handle an HTTP request", ("method", "route")
+        )
+        self.in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being handled")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.in_flight.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            self.requests.inc(method, route, str(status))
+            self.latency.observe(elapsed, method, route)
@@ -0,0 +1,77 @@
+import threading
+
+from metrics import Counter, Histogram, Registry
+
+
+class TestCounter:
+    """Tests for lock-free sharded counters"""
+
+    def test_sums_across_threads(self):
+        counter = Counter("events_total", "Events", ("kind",))
+
+        def work():
+            for _ in range(1000):
+                counter.inc("a")
+            counter.inc("b", amount=5)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert counter.value("a") == 8000
+        assert counter.value("b") == 40
+
+    def test_render(self):
+        counter = Counter("events_total", "Events", ("kind",))
+        counter.inc('say "hi"\n')
+        assert counter.render() == [
+            "# HELP events_total Events",
+            "# TYPE events_total counter",
+            'events_total{kind="say \\"hi\\"\\n"} 1',
+        ]
+
+
+class TestHistogram:
+    """Tests for sharded latency histograms"""
+
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, "/x")
+        assert histogram.render()[2:] == [
+            'latency_seconds_bucket{route="/x",le="0.1"} 2',
+            'latency_seconds_bucket{route="/x",le="1"} 3',
+            'latency_seconds_bucket{route="/x",le="+Inf"} 4',
+            'latency_seconds_sum{route="/x"} 2.65',
+            'latency_seconds_count{route="/x"} 4',
+        ]
+
+    def test_merges_threads(self):
+        histogram = Histogram("latency_seconds", "Latency", buckets=(1.0,))
+        threads = [threading.Thread(target=histogram.observe, args=(0.5,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counts, total = histogram.values()[()]
+        assert counts == [4, 0]
+        assert total == 2.0
+
+
+class TestRegistry:
+    """Tests for the metric registry"""
+
+    def test_same_name_returns_same_metric(self):
+        registry = Registry()
+        assert registry.counter("a_total", "A") is registry.counter("a_total", "A")
+
+    def test_render_includes_callbacks(self):
+        registry = Registry()
+        registry.gauge("in_flight", "In flight").inc()
+        registry.callback("ratio", "Ratio", lambda: 0.25)
+        registry.callback("by_role", "By role", lambda: {("read",): 2}, labels=("role",))
+        text = registry.render()
+        assert "in_flight 1\n" in text
+        assert "ratio 0.25\n" in text
+        assert 'by_role{role="read"} 2\n' in text
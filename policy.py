@@ -0,0 +1,62 @@
+"""Per-code redirect policy: the status code and how long downstream caches may keep it
+
+Stored next to the URL by every backend. The SQLite backend has a column per
+field; the log store and snapshot files keep the URL bytes and prefix them
+with a packed policy only when it differs from the default, so existing files
+stay valid and plain 302s cost nothing extra.
+"""
+
+import struct
+from typing import NamedTuple
+
+# Used for immutable redirects that don't set their own max-age
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# NUL marker, then status, max-age (-1 for none) and the immutable flag
+POLICY = struct.Struct("<xHiB")
+
+
+class Redirect(NamedTuple):
+    """Where a code redirects to, and how
+
+    With no ``max_age`` no Cache-Control header is sent, which is how every
+    redirect behaved before policies existed.
+    """
+
+    url: str
+    status: int = 302
+    max_age: int | None = None
+    immutable: bool = False
+
+    @property
+    def policy(self):
+        return self.status, self.max_age, self.immutable
+
+    def cache_control(self):
+        """The Cache-Control header value, or None to send none"""
+        if self.immutable:
+            max_age = IMMUTABLE_MAX_AGE if self.max_age is None else self.max_age
+            return f"public, max-age={max_age}, immutable"
+        if self.max_age is not None:
+            return f"public, max-age={self.max_age}"
+        return None
+
+
+DEFAULT_POLICY = Redirect("").policy
+
+
+def encode_redirect(redirect):
+    """Pack a redirect into bytes: the URL alone when the policy is the default"""
+    url = redirect.url.encode()
+    if redirect.policy == DEFAULT_POLICY and not url.startswith(b"\0"):
+        return url
+    max_age = -1 if redirect.max_age is None else redirect.max_age
+    return POLICY.pack(redirect.status, max_age, redirect.immutable) + url
+
+
+def decode_redirect(data):
+    """Inverse of ``encode_redirect``"""
+    if data[:1] != b"\0":
+        return Redirect(data.decode())
+    status, max_age, immutable = POLICY.unpack_from(data)
+    return Redirect(data[POLICY.size:].decode(), status, None if max_age < 0 else max_age, bool(immutable))
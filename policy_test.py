@@ -0,0 +1,26 @@
+from policy import Redirect, decode_redirect, encode_redirect
+
+
+class TestRedirect:
+    """Tests for redirect policies and their packed form"""
+
+    def test_cache_control(self):
+        assert Redirect("https://a.com").cache_control() is None
+        assert Redirect("https://a.com", max_age=0).cache_control() == "public, max-age=0"
+        assert Redirect("https://a.com", 301, 3600).cache_control() == "public, max-age=3600"
+        assert Redirect("https://a.com", 308, 60, True).cache_control() == "public, max-age=60, immutable"
+        assert Redirect("https://a.com", 308, immutable=True).cache_control() == "public, max-age=31536000, immutable"
+
+    def test_default_policy_packs_to_the_bare_url(self):
+        assert encode_redirect(Redirect("https://café.fr")) == "https://café.fr".encode()
+        assert decode_redirect("https://café.fr".encode()) == Redirect("https://café.fr")
+
+    def test_round_trip(self):
+        for redirect in (
+            Redirect("https://a.com", 301),
+            Redirect("https://a.com", 307, 0, False),
+            Redirect("https://a.com", 308, None, True),
+            Redirect("\0starts with nul"),
+            Redirect(""),
+        ):
+            assert decode_redirect(encode_redirect(redirect)) == redirect
@@ -0,0 +1,180 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+
+@dataclass
+class StorageProfile:
+    """PRAGMAs applied to every connection opened against the database"""
+
+    journal_mode: str = "wal"
+    synchronous: str = "normal"
+    mmap_size: int = 256 * 1024 * 1024
+    # Negative values are KiB, positive values are pages
+    cache_size: int = -64 * 1024
+    busy_timeout: int = 5000
+
+    def __post_init__(self):
+        for name in ("journal_mode", "synchronous"):
+            if not getattr(self, name).isalpha():
+                raise ValueError(f"Invalid {name}: {getattr(self, name)!r}")
+
+    def apply(self, conn, readonly=False):
+        # The journal mode is stored in the database file and needs write access
+        if not readonly:
+            conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        if readonly:
+            conn.execute("PRAGMA query_only = ON")
+
+
+def connect(database, readonly=False, profile=None, **kwargs):
+    """Open a connection with the storage profile applied
+
+    Read-only connections open the file with ``mode=ro`` so they can never take
+    a write lock; under WAL they read a snapshot without blocking the writer.
+    """
+    if readonly:
+        uri = Path(database).absolute().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, **kwargs)
+    else:
+        conn = sqlite3.connect(database, **kwargs)
+    if profile is not None:
+        profile.apply(conn, readonly=readonly)
+    return conn
+
+
+class ConnectionPool:
+    """Fixed-size pool of persistent SQLite connections
+
+    Idle connections are handed out last-in first-out so the most recently used
+    (warmest) connection is reused first. Each connection keeps its own prepared
+    statement cache, so repeated queries skip re-parsing the SQL.
+    """
+
+    def __init__(
+        self,
+        database,
+        size=8,
+        timeout=5.0,
+        cached_statements=256,
+        health_check_interval=30.0,
+        profile=None,
+        readonly=False,
+    ):
+        self.database = database
+        self.profile = profile
+        self.readonly = readonly
+        self.size = size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.health_check_interval = health_check_interval
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def _connect(self):
+        return connect(
+            self.database,
+            readonly=self.readonly,
+            profile=self.profile,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+
+    def _is_healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        """Check a connection out of the pool, opening one if below capacity"""
+        if self._closed:
+            raise PoolTimeout("Connection pool is closed")
+        try:
+            conn, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            try:
+                conn, last_used = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise PoolTimeout(
+                    f"No database connection available after {self.timeout}s"
+                ) from None
+
+        if time.monotonic() - last_used > self.health_check_interval and not self._is_healthy(conn):
+            self._discard(conn)
+            return self.acquire()
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back any open transaction"""
+        if self._closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and back in"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Close every idle connection; checked-out ones close on release"""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        return {
+            "readonly": self.readonly,
+            "size": self.size,
+            "open": self._created,
+            "idle": self._idle.qsize(),
+        }
@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+from pool import ConnectionPool, PoolTimeout, StorageProfile, connect
+
+
+@pytest.fixture
+def db_path():
+    """Create a temporary database file"""
+    db_fd, path = tempfile.mkstemp()
+    yield path
+    os.close(db_fd)
+    os.unlink(path)
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+class TestConnectionPool:
+    """Tests for the SQLite connection pool"""
+
+    def test_reuses_connection(self, db_path):
+        pool = ConnectionPool(db_path, size=2)
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+        assert first is second
+        assert pool.stats()["open"] == 1
+        pool.close()
+
+    def test_respects_size_and_times_out(self, db_path):
+        pool = ConnectionPool(db_path, size=1, timeout=0.05)
+        conn = pool.acquire()
+        with pytest.raises(PoolTimeout):
+            pool.acquire()
+        pool.release(conn)
+        assert pool.acquire() is conn
+        pool.close()
+
+    def test_release_rolls_back_open_transaction(self, db_path):
+        pool = ConnectionPool(db_path, size=1)
+        with pool.connection() as conn:
+            conn.execute("CREATE TABLE t (x INTEGER)")
+            conn.commit()
+            conn.execute("INSERT INTO t VALUES (1)")
+            assert conn.in_transaction
+        with pool.connection() as conn:
+            assert not conn.in_transaction
+            assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+        pool.close()
+
+    def test_unhealthy_connection_is_replaced(self, db_path):
+        pool = ConnectionPool(db_path, size=1, health_check_interval=0)
+        with pool.connection() as conn:
+            pass
+        # Simulate a broken connection sitting idle in the pool
+        conn.close()
+        with pool.connection() as replacement:
+            assert replacement is not conn
+            assert replacement.execute("SELECT 1").fetchone() == (1,)
+        assert pool.stats()["open"] == 1
+        pool.close()
+
+    def test_close_closes_idle_connections(self, db_path):
+        pool = ConnectionPool(db_path, size=1)
+        with pool.connection() as conn:
+            pass
+        pool.close()
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+        with pytest.raises(PoolTimeout):
+            pool.acquire()
+
+
+class TestStorageProfile:
+    """Tests for connection PRAGMAs and the read-only role"""
+
+    def test_profile_applied_to_pooled_connections(self, db_path):
+        profile = StorageProfile(mmap_size=1024 * 1024, cache_size=-2048, busy_timeout=1234)
+        pool = ConnectionPool(db_path, size=1, profile=profile)
+        with pool.connection() as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            # NORMAL
+            assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+            assert conn.execute("PRAGMA cache_size").fetchone()[0] == -2048
+            assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+        pool.close()
+
+    def test_rejects_invalid_pragma_values(self):
+        with pytest.raises(ValueError):
+            StorageProfile(journal_mode="wal; DROP TABLE urls")
+
+    def test_readonly_connection_cannot_write(self, db_path):
+        conn = connect(db_path, profile=StorageProfile())
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+        conn.close()
+
+        pool = ConnectionPool(db_path, size=1, profile=StorageProfile(), readonly=True)
+        with pool.connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("INSERT INTO t VALUES (1)")
+        pool.close()
+
+    def test_reader_not_blocked_by_open_write_transaction(self, db_path):
+        writer = connect(db_path, profile=StorageProfile())
+        writer.execute("CREATE TABLE t (x INTEGER)")
+        writer.commit()
+        writer.execute("INSERT INTO t VALUES (1)")
+        assert writer.in_transaction
+
+        reader = connect(db_path, readonly=True, profile=StorageProfile(busy_timeout=0))
+        # The reader sees the last committed snapshot instead of waiting
+        assert reader.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+        writer.commit()
+        assert reader.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
+        reader.close()
+        writer.close()
@@ -0,0 +1,73 @@
+import collections
+import os
+import sys
+import threading
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame, thread_name):
+    """Turn a frame into one collapsed-stack line, outermost call first"""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+def format_collapsed(counts):
+    """Render stack counts in the collapsed format read by flamegraph.pl and speedscope"""
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+class SamplingProfiler:
+    """Samples the stack of every thread at a fixed interval
+
+    Nothing is installed in the profiled code: a background thread reads
+    ``sys._current_frames()`` while running, and when stopped there is no
+    thread and no overhead at all. Each sample is one collapsed stack rooted
+    at the thread name, so the event loop and database threads can be told
+    apart in the flamegraph.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self.counts = collections.Counter()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError("Profiler is already running")
+        self.samples = 0
+        self.counts = collections.Counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and return the collected stack counts"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return self.counts
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self.counts[collapse_stack(frame, names.get(thread_id, str(thread_id)))] += 1
+            self.samples += 1
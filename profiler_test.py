@@ -0,0 +1,44 @@
+import threading
+import time
+
+from profiler import SamplingProfiler, format_collapsed
+
+
+def busy_wait(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestSamplingProfiler:
+    """Tests for the sampling stack profiler"""
+
+    def test_collects_collapsed_stacks(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_wait, args=(stop,), name="busy")
+        worker.start()
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        time.sleep(0.1)
+        counts = profiler.stop()
+        stop.set()
+        worker.join()
+
+        assert profiler.samples > 0
+        busy = [stack for stack in counts if stack.startswith("busy;")]
+        assert busy
+        assert any("busy_wait (profiler_test.py:" in stack for stack in busy)
+        assert not any(stack.startswith("profiler;") for stack in counts)
+
+    def test_stopped_profiler_has_no_thread(self):
+        profiler = SamplingProfiler()
+        assert not profiler.running
+        profiler.start()
+        assert profiler.running
+        profiler.stop()
+        assert not profiler.running
+        assert "profiler" not in [thread.name for thread in threading.enumerate()]
+
+    def test_format_collapsed(self):
+        profiler = SamplingProfiler()
+        profiler.counts.update({"main;a;b": 3, "main;a": 1})
+        assert format_collapsed(profiler.counts) == "main;a;b 3\nmain;a 1\n"
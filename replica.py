@@ -0,0 +1,116 @@
+"""Read-only storage for redirect replicas, served from a snapshot file
+
+Edge nodes that only redirect load a snapshot of the urls table (see
+``snapshot``) instead of opening the database. Lookups are a binary search
+over the memory-mapped file, so each entry costs its code and URL bytes plus a
+16-byte index slot, and every worker process on the node shares one copy in
+the page cache.
+
+To publish a new version, write it next to the old one and rename it into
+place (``write_snapshot`` and ``python replica.py`` both do). ``reload``
+notices the new inode, maps the new file and swaps it in with a single
+assignment: a lookup already running keeps the map it started with, and the
+old map is released once nothing references it.
+
+    python replica.py urls.db urls.snapshot
+"""
+
+import argparse
+import os
+import threading
+
+from snapshot import Snapshot, write_snapshot
+from storage import SqliteStorage, Storage, StorageReadOnly
+
+
+def build_replica_snapshot(store, path):
+    """Write every entry of ``store``, with its redirect policy, to a snapshot file at ``path``, atomically"""
+    entries = store.iter_redirects()
+    try:
+        write_snapshot(path, entries)
+    finally:
+        entries.close()
+
+
+class ReplicaStorage(Storage):
+    """Serves reads from a snapshot file; every write raises StorageReadOnly
+
+    Click analytics stay in memory on each replica.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.reloads = 0
+        self._snapshot = None
+        self._reload_lock = threading.Lock()
+
+    def init(self):
+        if self._snapshot is None:
+            self._snapshot = Snapshot(self.path)
+
+    def close(self):
+        # Not unmapped here: a lookup may still be reading it on another thread
+        self._snapshot = None
+
+    def reload(self):
+        """Swap in the snapshot file if it was replaced; returns True if it was"""
+        with self._reload_lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return False
+            if self._snapshot is not None and (stat.st_dev, stat.st_ino) == self._snapshot.inode:
+                return False
+            self._snapshot = Snapshot(self.path)
+            self.reloads += 1
+            return True
+
+    def get(self, code):
+        return self._snapshot.get(code)
+
+    def get_redirect(self, code):
+        return self._snapshot.get_redirect(code)
+
+    def scan(self, after=None, limit=100):
+        return self._snapshot.scan(after, limit)
+
+    def iter_entries(self, chunk_size=1000):
+        # Keep iterating the snapshot we started with, even across a reload
+        yield from self._snapshot
+
+    def iter_redirects(self, chunk_size=1000):
+        yield from self._snapshot.iter_redirects()
+
+    def count(self):
+        return len(self._snapshot)
+
+    def version(self):
+        snapshot = self._snapshot
+        return f"{snapshot.inode[1]:x}-{snapshot.mtime_ns:x}"
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {"path": str(self.path), "entries": len(snapshot), "reloads": self.reloads}
+
+    def _read_only(self, *args):
+        raise StorageReadOnly("This server is a read-only replica")
+
+    # find_code only serves deduplicated creation, which a replica can't do
+    put = put_many = update = delete = lease_codes = find_code = _read_only
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a replica snapshot of a SQLite urls database")
+    parser.add_argument("database", help="SQLite database to read")
+    parser.add_argument("output", help="snapshot file to write, replaced atomically")
+    args = parser.parse_args()
+    store = SqliteStorage(args.database)
+    try:
+        build_replica_snapshot(store, args.output)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import pytest
+
+from replica import ReplicaStorage, build_replica_snapshot
+from snapshot import SnapshotError, write_snapshot
+from storage import MemoryStorage, StorageReadOnly
+
+
+@pytest.fixture
+def replica(tmp_path):
+    path = tmp_path / "urls.snapshot"
+    write_snapshot(path, [("a", "https://a.com"), ("b", "https://b.com")])
+    replica = ReplicaStorage(path)
+    replica.init()
+    yield replica
+    replica.close()
+
+
+class TestReplicaStorage:
+    """Tests for the snapshot-backed read-only storage"""
+
+    def test_reads(self, replica):
+        assert replica.get("a") == "https://a.com"
+        assert replica.get("c") is None
+        assert replica.scan("a") == [("b", "https://b.com")]
+        assert list(replica.iter_entries()) == [("a", "https://a.com"), ("b", "https://b.com")]
+        assert replica.count() == 2
+
+    def test_writes_raise(self, replica):
+        for call in (
+            lambda: replica.put("c", "https://c.com"),
+            lambda: replica.put_many([("c", "https://c.com")]),
+            lambda: replica.update("a", "https://other.com"),
+            lambda: replica.delete("a"),
+            lambda: replica.lease_codes(10, 0),
+        ):
+            with pytest.raises(StorageReadOnly):
+                call()
+        assert replica.get("a") == "https://a.com"
+
+    def test_write_batch_reports_each_op(self, replica):
+        results = replica.write_batch([("put", ("c", "https://c.com")), ("store_clicks", ({("a", 0): 1}, {}))])
+        assert isinstance(results[0][1], StorageReadOnly)
+        assert results[1] == (None, None)
+
+    def test_reload_swaps_replaced_file(self, replica, tmp_path):
+        assert replica.reload() is False
+        version = replica.version()
+        entries = replica.iter_entries()
+        assert next(entries) == ("a", "https://a.com")
+        write_snapshot(tmp_path / "urls.snapshot", [("c", "https://c.com")])
+        assert replica.reload() is True
+        assert replica.get("a") is None
+        assert replica.get("c") == "https://c.com"
+        assert replica.stats()["reloads"] == 1
+        assert replica.version() != version
+        # An iteration that started before the swap finishes on the old snapshot
+        assert list(entries) == [("b", "https://b.com")]
+
+    def test_missing_snapshot(self, tmp_path):
+        replica = ReplicaStorage(tmp_path / "missing.snapshot")
+        with pytest.raises(FileNotFoundError):
+            replica.init()
+        assert replica.reload() is False
+
+    def test_rejects_other_files(self, tmp_path):
+        path = tmp_path / "urls.snapshot"
+        path.write_bytes(b"definitely not a snapshot file")
+        with pytest.raises(SnapshotError):
+            ReplicaStorage(path).init()
+
+    def test_build_from_storage(self, tmp_path):
+        source = MemoryStorage()
+        source.put_many([("b", "https://b.com"), ("a", "https://a.com")])
+        path = tmp_path / "built.snapshot"
+        build_replica_snapshot(source, path)
+        replica = ReplicaStorage(path)
+        replica.init()
+        assert replica.scan() == [("a", "https://a.com"), ("b", "https://b.com")]
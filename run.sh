@@ -1 +1,19 @@
-uv run uvicorn main:app --host 0.0.0.0 --port 8080
\ No newline at end of file
+# FAST_PATH=1 serves cache-hit redirects from a raw ASGI app ahead of FastAPI
+APP="main:app"
+if [ "${FAST_PATH:-0}" = "1" ]; then
+    APP="main:fast_app"
+fi
+
+# WORKERS=N runs N processes that share one read cache through SHARED_CACHE_DIR
+export WORKERS="${WORKERS:-1}"
+if [ "$WORKERS" -gt 1 ]; then
+    # Each worker would own its own copy of these backends
+    case "${STORAGE_BACKEND:-sqlite}" in
+        log|memory)
+            echo "STORAGE_BACKEND=$STORAGE_BACKEND supports a single worker; use WORKERS=1" >&2
+            exit 1
+            ;;
+    esac
+    export SHARED_CACHE_DIR="${SHARED_CACHE_DIR:-.shared-cache}"
+fi
+uv run uvicorn "$APP" --host 0.0.0.0 --port 8080 --workers "$WORKERS"
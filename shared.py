@@ -0,0 +1,267 @@
+"""Read cache shared by every worker process
+
+Workers map the same snapshot file (see snapshot.py), so a multi-worker
+deployment keeps one warm copy of the code -> URL map instead of one cold cache
+per process. Mutations are published to an invalidation log, a fixed-size ring
+of records in a memory-mapped file. Every worker polls the ring's sequence
+number (a plain memory read) before lookups, marks changed codes as dirty so
+they bypass the snapshot, and drops them from its local cache.
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+
+from snapshot import Snapshot, SnapshotError, write_snapshot
+
+OP_CREATE = 1
+OP_UPDATE = 2
+OP_DELETE = 3
+# Drop everything: a code too long for a slot, or a reader that fell behind
+OP_RESET = 4
+
+LOG_MAGIC = b"USINVLOG"
+LOG_HEADER = struct.Struct("<8sQ")
+SLOT = struct.Struct("<QBH")
+SLOT_SIZE = 512
+MAX_CODE_BYTES = SLOT_SIZE - SLOT.size
+
+
+class InvalidationLog:
+    """Fixed-size ring of (sequence, op, code) records shared between processes"""
+
+    def __init__(self, path, slots=65536):
+        self.path = path
+        self.slots = slots
+        size = LOG_HEADER.size + slots * SLOT_SIZE
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, LOG_HEADER.pack(LOG_MAGIC, 0), 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._mm = mmap.mmap(self._fd, size)
+
+    @property
+    def seq(self):
+        """Sequence number of the most recent record"""
+        return LOG_HEADER.unpack_from(self._mm, 0)[1]
+
+    def _slot_offset(self, seq):
+        return LOG_HEADER.size + (seq % self.slots) * SLOT_SIZE
+
+    def append(self, op, code):
+        """Publish a record, returning its sequence number"""
+        data = code.encode() if code is not None else b""
+        if len(data) > MAX_CODE_BYTES:
+            op, data = OP_RESET, b""
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                seq = self.seq + 1
+                offset = self._slot_offset(seq)
+                SLOT.pack_into(self._mm, offset, seq, op, len(data))
+                self._mm[offset + SLOT.size:offset + SLOT.size + len(data)] = data
+                # Publish the slot before the sequence number that exposes it
+                LOG_HEADER.pack_into(self._mm, 0, LOG_MAGIC, seq)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return seq
+
+    def read_since(self, after):
+        """Return (latest seq, records after ``after``)
+
+        Records are (seq, op, code) tuples. If some of them were already
+        overwritten by newer ones the records are None and the caller must
+        assume everything changed.
+        """
+        latest = self.seq
+        if latest - after > self.slots:
+            return latest, None
+        records = []
+        for seq in range(after + 1, latest + 1):
+            offset = self._slot_offset(seq)
+            slot_seq, op, length = SLOT.unpack_from(self._mm, offset)
+            if slot_seq != seq:
+                return latest, None
+            code = self._mm[offset + SLOT.size:offset + SLOT.size + length].decode()
+            records.append((seq, op, code))
+        return latest, records
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
+
+
+class SharedCache:
+    """Snapshot-backed code -> URL map with cross-process invalidation
+
+    ``poll`` and ``get`` are meant to be called from a single thread (the event
+    loop). ``rebuild`` only writes a new snapshot file, so it is safe to run on
+    a worker thread; the next ``poll`` notices the new file and swaps it in.
+
+    The snapshot and log only describe the storage while some worker is
+    running to publish its writes, so a worker joins with ``attach``, which
+    rebuilds the snapshot when no other worker is running.
+    """
+
+    def __init__(self, directory, on_invalidate=None, max_dirty=10_000, reload_interval=1.0, slots=65536):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, "snapshot.bin")
+        self.log = InvalidationLog(os.path.join(directory, "invalidations.log"), slots=slots)
+        self.on_invalidate = on_invalidate
+        self.max_dirty = max_dirty
+        self.reload_interval = reload_interval
+        self.snapshot = None
+        self.hits = 0
+        self.misses = 0
+        # code -> sequence of its latest change not reflected in the snapshot
+        self._dirty = {}
+        self._seen = self.log.seq
+        self._next_reload_check = 0.0
+        # Held with a shared lock by every attached worker
+        self._worker_fd = os.open(os.path.join(directory, "workers.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+
+    def attach(self, read_rows):
+        """Join as a worker and load the snapshot, rebuilding it first when needed (blocking)
+
+        The first worker to start finds no other attached: the snapshot and
+        log were left by an earlier run, and the storage may have changed
+        while nothing was running, so the snapshot is discarded and rebuilt
+        from ``read_rows()`` before any worker loads it. Workers starting
+        meanwhile wait for that on the shared lock.
+        """
+        try:
+            fcntl.flock(self._worker_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            pass
+        else:
+            try:
+                os.unlink(self.snapshot_path)
+            except FileNotFoundError:
+                pass
+            self.rebuild(read_rows)
+        fcntl.flock(self._worker_fd, fcntl.LOCK_SH)
+        if not self.load():
+            # Another worker may be building it already; polling picks it up later
+            self.rebuild(read_rows)
+            self.load()
+
+    def load(self):
+        """Swap in the snapshot file if present and still consistent with the log
+
+        Returns True when a usable snapshot is loaded.
+        """
+        try:
+            snapshot = Snapshot(self.snapshot_path)
+        except (FileNotFoundError, SnapshotError):
+            return False
+        latest, records = self.log.read_since(snapshot.log_seq)
+        if snapshot.log_seq > latest or records is None:
+            # Built against a different log, or too many changes since
+            snapshot.close()
+            return False
+        if self.snapshot is not None:
+            self.snapshot.close()
+        self.snapshot = snapshot
+        self._dirty = {code: seq for seq, _, code in records}
+        self._seen = latest
+        return True
+
+    def needs_rebuild(self):
+        return self.snapshot is None or len(self._dirty) > self.max_dirty
+
+    def rebuild(self, read_rows):
+        """Write a fresh snapshot from ``read_rows()`` unless another worker is already at it
+
+        Rows are (code, url) or (code, Redirect) pairs in code order.
+
+        Returns False if the rebuild was skipped because the lock was held.
+        """
+        lock_fd = os.open(os.path.join(self.directory, "rebuild.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            # Anything published after this point is replayed as dirty on load
+            log_seq = self.log.seq
+            write_snapshot(self.snapshot_path, read_rows(), log_seq=log_seq)
+            self._next_reload_check = 0.0
+            return True
+        finally:
+            os.close(lock_fd)
+
+    def poll(self):
+        """Apply invalidations published by any worker since the last poll"""
+        if self.log.seq != self._seen:
+            latest, records = self.log.read_since(self._seen)
+            self._seen = latest
+            if records is None or any(op == OP_RESET for _, op, _ in records):
+                self._reset()
+            else:
+                for seq, op, code in records:
+                    self._dirty[code] = seq
+                    if self.on_invalidate is not None:
+                        self.on_invalidate(op, code)
+
+        now = time.monotonic()
+        if now >= self._next_reload_check:
+            self._next_reload_check = now + self.reload_interval
+            self._reload_if_replaced()
+
+    def _reset(self):
+        if self.snapshot is not None:
+            self.snapshot.close()
+        self.snapshot = None
+        self._dirty = {}
+        if self.on_invalidate is not None:
+            self.on_invalidate(OP_RESET, None)
+
+    def _reload_if_replaced(self):
+        try:
+            stat = os.stat(self.snapshot_path)
+        except FileNotFoundError:
+            return
+        if self.snapshot is None or self.snapshot.inode != (stat.st_dev, stat.st_ino):
+            self.load()
+
+    def get_redirect(self, code):
+        """Return the Redirect from the snapshot, or None if absent or changed since"""
+        if self.snapshot is None or code in self._dirty:
+            self.misses += 1
+            return None
+        redirect = self.snapshot.get_redirect(code)
+        if redirect is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return redirect
+
+    def publish(self, op, code):
+        """Tell every worker (this one included, on its next poll) that a code changed"""
+        return self.log.append(op, code)
+
+    def stats(self):
+        return {
+            "snapshot_entries": len(self.snapshot) if self.snapshot is not None else 0,
+            "dirty": len(self._dirty),
+            "log_seq": self._seen,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def close(self):
+        if self.snapshot is not None:
+            self.snapshot.close()
+        self.log.close()
+        # Closing the descriptor detaches this worker
+        os.close(self._worker_fd)
@@ -0,0 +1,138 @@
+from policy import Redirect
+from shared import OP_DELETE, OP_RESET, OP_UPDATE, InvalidationLog, SharedCache
+
+ROWS = [("a", "https://a.com"), ("b", "https://b.com")]
+
+
+class TestInvalidationLog:
+    """Tests for the cross-process invalidation ring"""
+
+    def test_append_and_read(self, tmp_path):
+        log = InvalidationLog(tmp_path / "log", slots=8)
+        assert log.seq == 0
+        log.append(OP_UPDATE, "a")
+        log.append(OP_DELETE, "b")
+        latest, records = log.read_since(0)
+        assert latest == 2
+        assert records == [(1, OP_UPDATE, "a"), (2, OP_DELETE, "b")]
+        assert log.read_since(2) == (2, [])
+        log.close()
+
+    def test_shared_between_handles(self, tmp_path):
+        writer = InvalidationLog(tmp_path / "log", slots=8)
+        reader = InvalidationLog(tmp_path / "log", slots=8)
+        writer.append(OP_UPDATE, "a")
+        assert reader.read_since(0) == (1, [(1, OP_UPDATE, "a")])
+        writer.close()
+        reader.close()
+
+    def test_overrun_reader_gets_none(self, tmp_path):
+        log = InvalidationLog(tmp_path / "log", slots=4)
+        for i in range(6):
+            log.append(OP_UPDATE, f"c{i}")
+        assert log.read_since(0) == (6, None)
+        assert [code for _, _, code in log.read_since(2)[1]] == ["c2", "c3", "c4", "c5"]
+        log.close()
+
+    def test_overlong_code_becomes_reset(self, tmp_path):
+        log = InvalidationLog(tmp_path / "log", slots=4)
+        log.append(OP_UPDATE, "x" * 1000)
+        assert log.read_since(0)[1] == [(1, OP_RESET, "")]
+        log.close()
+
+
+class TestSharedCache:
+    """Tests for the snapshot-backed cache shared by workers"""
+
+    def test_rebuild_and_lookup(self, tmp_path):
+        cache = SharedCache(tmp_path)
+        assert cache.needs_rebuild()
+        assert cache.rebuild(lambda: iter(ROWS))
+        assert cache.load()
+        assert cache.get_redirect("a") == Redirect("https://a.com")
+        assert cache.get_redirect("missing") is None
+        assert not cache.needs_rebuild()
+        cache.close()
+
+    def test_invalidation_reaches_other_worker(self, tmp_path):
+        seen = []
+        worker1 = SharedCache(tmp_path)
+        worker2 = SharedCache(tmp_path, on_invalidate=lambda op, code: seen.append((op, code)))
+        worker1.rebuild(lambda: iter(ROWS))
+        worker1.load()
+        worker2.load()
+
+        worker1.publish(OP_UPDATE, "a")
+        worker2.poll()
+        assert seen == [(OP_UPDATE, "a")]
+        # The changed code bypasses the snapshot; others are still served
+        assert worker2.get_redirect("a") is None
+        assert worker2.get_redirect("b") == Redirect("https://b.com")
+        worker1.close()
+        worker2.close()
+
+    def test_new_snapshot_is_swapped_in(self, tmp_path):
+        worker1 = SharedCache(tmp_path, reload_interval=0)
+        worker2 = SharedCache(tmp_path, reload_interval=0)
+        worker1.rebuild(lambda: iter(ROWS))
+        worker2.load()
+        worker1.publish(OP_UPDATE, "a")
+        worker2.poll()
+        assert worker2.get_redirect("a") is None
+
+        worker1.rebuild(lambda: iter([("a", "https://new-a.com"), ("b", "https://b.com")]))
+        worker2.poll()
+        assert worker2.get_redirect("a") == Redirect("https://new-a.com")
+        assert worker2.stats()["dirty"] == 0
+        worker1.close()
+        worker2.close()
+
+    def test_falling_behind_resets(self, tmp_path):
+        seen = []
+        writer = SharedCache(tmp_path, slots=4)
+        reader = SharedCache(tmp_path, slots=4, on_invalidate=lambda op, code: seen.append(op))
+        writer.rebuild(lambda: iter(ROWS))
+        reader.load()
+        for i in range(10):
+            writer.publish(OP_UPDATE, f"c{i}")
+        reader.poll()
+        assert seen == [OP_RESET]
+        assert reader.snapshot is None
+        assert reader.get_redirect("b") is None
+        assert reader.needs_rebuild()
+        writer.close()
+        reader.close()
+
+    def test_rebuild_skipped_while_locked(self, tmp_path):
+        import fcntl
+        import os
+
+        cache = SharedCache(tmp_path)
+        fd = os.open(tmp_path / "rebuild.lock", os.O_RDWR | os.O_CREAT)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            assert not cache.rebuild(lambda: iter(ROWS))
+        finally:
+            os.close(fd)
+        assert cache.rebuild(lambda: iter(ROWS))
+        cache.close()
+
+    def test_first_worker_rebuilds_a_leftover_snapshot(self, tmp_path):
+        old = SharedCache(tmp_path)
+        old.attach(lambda: iter(ROWS))
+        assert old.get_redirect("a") == Redirect("https://a.com")
+        old.close()
+
+        # The storage changed while no worker was running
+        rows = [("a", "https://changed.com")]
+        first = SharedCache(tmp_path)
+        first.attach(lambda: iter(rows))
+        assert first.get_redirect("a") == Redirect("https://changed.com")
+        assert first.get_redirect("b") is None
+
+        # A worker joining a running one trusts the snapshot it finds
+        second = SharedCache(tmp_path)
+        second.attach(lambda: iter(ROWS))
+        assert second.get_redirect("a") == Redirect("https://changed.com")
+        first.close()
+        second.close()
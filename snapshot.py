@@ -0,0 +1,158 @@
+"""Compact, memory-mapped snapshot of the urls table
+
+File layout (little endian):
+
+    header   magic "USNP", version u16, flags u16, count u64, log_seq u64,
+             index_offset u64
+    data     code bytes followed by url bytes, for every entry in code order;
+             the url bytes carry the redirect policy (``policy.encode_redirect``)
+    index    count entries of (data offset u64, code length u32, url length u32)
+
+Entries are sorted by the UTF-8 bytes of the code, which is the order SQLite's
+default BINARY collation returns for ``ORDER BY code``, so lookups are a binary
+search over the fixed-width index directly in the mapped file.
+"""
+
+import mmap
+import os
+import struct
+
+from policy import Redirect, decode_redirect, encode_redirect
+
+MAGIC = b"USNP"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQQQ")
+ENTRY = struct.Struct("<QII")
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is missing, truncated or of another format"""
+
+
+def write_snapshot(path, rows, log_seq=0):
+    """Write ``rows`` of (code, url or Redirect), sorted by code, to ``path`` atomically
+
+    The file is written next to ``path`` and renamed over it, so readers see
+    either the old snapshot or the complete new one.
+    """
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(bytes(HEADER.size))
+            index = bytearray()
+            offset = HEADER.size
+            count = 0
+            previous = None
+            for code, target in rows:
+                if isinstance(target, str):
+                    target = Redirect(target)
+                code_bytes = code.encode()
+                url_bytes = encode_redirect(target)
+                if previous is not None and code_bytes <= previous:
+                    raise ValueError("Snapshot rows must be sorted by code without duplicates")
+                f.write(code_bytes)
+                f.write(url_bytes)
+                index += ENTRY.pack(offset, len(code_bytes), len(url_bytes))
+                offset += len(code_bytes) + len(url_bytes)
+                count += 1
+                previous = code_bytes
+            f.write(index)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, 0, count, log_seq, offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+class Snapshot:
+    """Read-only view of a snapshot file, mapped into memory
+
+    The mapping is shared with every other process that opens the same file,
+    so N workers hold one copy of the table in the page cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size < HEADER.size:
+                raise SnapshotError(f"{path} is too small to be a snapshot")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.inode = (stat.st_dev, stat.st_ino)
+        self.mtime_ns = stat.st_mtime_ns
+        magic, version, _, self.count, self.log_seq, self._index = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise SnapshotError(f"{path} is not a version {VERSION} snapshot")
+        if self._index + self.count * ENTRY.size > len(self._mm):
+            self._mm.close()
+            raise SnapshotError(f"{path} is truncated")
+
+    def __len__(self):
+        return self.count
+
+    def _entry(self, position):
+        return ENTRY.unpack_from(self._mm, self._index + position * ENTRY.size)
+
+    def _bisect_left(self, key):
+        mm = self._mm
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset, code_length, _ = self._entry(middle)
+            if mm[offset:offset + code_length] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _item(self, position):
+        offset, code_length, url_length = self._entry(position)
+        start = offset + code_length
+        return self._mm[offset:start].decode(), decode_redirect(self._mm[start:start + url_length])
+
+    def get_redirect(self, code):
+        """Return the Redirect for a code, or None if the snapshot doesn't contain it"""
+        key = code.encode()
+        position = self._bisect_left(key)
+        if position == self.count:
+            return None
+        offset, code_length, url_length = self._entry(position)
+        mm = self._mm
+        if mm[offset:offset + code_length] != key:
+            return None
+        start = offset + code_length
+        return decode_redirect(mm[start:start + url_length])
+
+    def get(self, code):
+        """Return the URL for a code, or None if the snapshot doesn't contain it"""
+        redirect = self.get_redirect(code)
+        return None if redirect is None else redirect.url
+
+    def scan(self, after=None, limit=100):
+        """Return up to ``limit`` (code, url) pairs in code order, starting after ``after``"""
+        start = 0
+        if after is not None:
+            key = after.encode()
+            start = self._bisect_left(key)
+            if start < self.count:
+                offset, code_length, _ = self._entry(start)
+                if self._mm[offset:offset + code_length] == key:
+                    start += 1
+        positions = range(start, min(start + limit, self.count))
+        return [(code, redirect.url) for code, redirect in map(self._item, positions)]
+
+    def iter_redirects(self):
+        """Yield every (code, Redirect) pair in code order"""
+        for position in range(self.count):
+            yield self._item(position)
+
+    def __iter__(self):
+        for code, redirect in self.iter_redirects():
+            yield code, redirect.url
+
+    def close(self):
+        self._mm.close()
@@ -0,0 +1,81 @@
+import pytest
+
+from snapshot import Snapshot, SnapshotError, write_snapshot
+
+
+class TestSnapshot:
+    """Tests for the memory-mapped snapshot file"""
+
+    def test_round_trip(self, tmp_path):
+        path = tmp_path / "snapshot.bin"
+        rows = [("a", "https://a.com"), ("b", "https://b.com"), ("café", "https://café.fr")]
+        write_snapshot(path, rows, log_seq=7)
+        snapshot = Snapshot(path)
+        assert len(snapshot) == 3
+        assert snapshot.log_seq == 7
+        assert snapshot.get("a") == "https://a.com"
+        assert snapshot.get("café") == "https://café.fr"
+        assert snapshot.get("c") is None
+        assert snapshot.get("") is None
+        assert list(snapshot) == rows
+        snapshot.close()
+
+    def test_many_entries(self, tmp_path):
+        path = tmp_path / "snapshot.bin"
+        rows = sorted((f"code{i}", f"https://example.com/{i}") for i in range(1000))
+        write_snapshot(path, rows)
+        snapshot = Snapshot(path)
+        for code, url in rows:
+            assert snapshot.get(code) == url
+        assert snapshot.get("code1000") is None
+        snapshot.close()
+
+    def test_empty(self, tmp_path):
+        path = tmp_path / "snapshot.bin"
+        write_snapshot(path, [])
+        snapshot = Snapshot(path)
+        assert len(snapshot) == 0
+        assert snapshot.get("a") is None
+        snapshot.close()
+
+    def test_rejects_unsorted_rows_and_keeps_old_file(self, tmp_path):
+        path = tmp_path / "snapshot.bin"
+        write_snapshot(path, [("a", "https://a.com")])
+        with pytest.raises(ValueError):
+            write_snapshot(path, [("b", "https://b.com"), ("a", "https://a.com")])
+        snapshot = Snapshot(path)
+        assert snapshot.get("a") == "https://a.com"
+        snapshot.close()
+        assert [p.name for p in tmp_path.iterdir()] == ["snapshot.bin"]
+
+    def test_rejects_other_files(self, tmp_path):
+        path = tmp_path / "snapshot.bin"
+        path.write_bytes(b"not a snapshot at all, just some bytes")
+        with pytest.raises(SnapshotError):
+            Snapshot(path)
+
+    def test_scan(self, tmp_path):
+        path = tmp_path / "snapshot.bin"
+        rows = [("a", "https://a.com"), ("c", "https://c.com"), ("e", "https://e.com")]
+        write_snapshot(path, rows)
+        snapshot = Snapshot(path)
+        assert snapshot.scan() == rows
+        assert snapshot.scan(limit=2) == rows[:2]
+        assert snapshot.scan("a") == rows[1:]
+        assert snapshot.scan("b", limit=1) == [("c", "https://c.com")]
+        assert snapshot.scan("e") == []
+        snapshot.close()
+
+    def test_redirect_policies(self, tmp_path):
+        from policy import Redirect
+
+        path = tmp_path / "snapshot.bin"
+        rows = [("a", Redirect("https://a.com", 301, 60, True)), ("b", "https://b.com")]
+        write_snapshot(path, rows)
+        snapshot = Snapshot(path)
+        assert snapshot.get_redirect("a") == Redirect("https://a.com", 301, 60, True)
+        assert snapshot.get_redirect("b") == Redirect("https://b.com")
+        assert snapshot.get("a") == "https://a.com"
+        assert list(snapshot) == [("a", "https://a.com"), ("b", "https://b.com")]
+        assert next(snapshot.iter_redirects()) == rows[0]
+        snapshot.close()
@@ -0,0 +1,799 @@
+import bisect
+import heapq
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from analytics import (
+    code_series,
+    create_click_tables,
+    current_minute,
+    store_counts,
+    top_codes,
+)
+from batching import run_batch
+from dedupe import DigestIndex, normalize_url, url_digest
+from export import iter_rows
+from policy import Redirect
+from pool import ConnectionPool, connect
+
+# Columns added to urls after it was first created, as (name, definition)
+ADDED_COLUMNS = (
+    ("status", "INTEGER NOT NULL DEFAULT 302"),
+    ("max_age", "INTEGER"),
+    ("immutable", "INTEGER NOT NULL DEFAULT 0"),
+    ("host", "TEXT"),
+    ("url_digest", "INTEGER"),
+    # Rowid of the entry in urls_fts; an explicit value, so VACUUM leaves it alone
+    ("search_id", "INTEGER"),
+)
+
+
+# Shortest text the trigram search index can look up
+SEARCH_MIN_LENGTH = 3
+
+
+def redirect_from_row(url, status, max_age, immutable):
+    return Redirect(url, status, max_age, bool(immutable))
+
+
+def url_host(url):
+    """The lowercased host name of a URL, or "" if it has none"""
+    try:
+        return urlsplit(url).hostname or ""
+    except ValueError:
+        return ""
+
+
+def prefix_upper_bound(prefix):
+    """The smallest string greater than every string starting with ``prefix``, or None
+
+    Code points sort like their UTF-8 bytes, so this bounds a prefix range
+    under SQLite's default collation as well as in Python.
+    """
+    while prefix:
+        last = ord(prefix[-1]) + 1
+        if 0xD800 <= last <= 0xDFFF:
+            last = 0xE000
+        if last <= 0x10FFFF:
+            return prefix[:-1] + chr(last)
+        prefix = prefix[:-1]
+    return None
+
+
+def create_search_index(cursor):
+    """Create and fill urls_fts unless it exists
+
+    Returns False when this SQLite build has no FTS5 trigram tokenizer.
+    """
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(urls_fts)")]
+    if columns == ["code", "url"]:
+        return True
+    # Gone, or an earlier layout without the code
+    cursor.execute("DROP TABLE IF EXISTS urls_fts")
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE urls_fts USING fts5(code UNINDEXED, url, tokenize = 'trigram')")
+    except sqlite3.OperationalError:
+        return False
+    cursor.execute("INSERT INTO urls_fts (rowid, code, url) SELECT rowid, code, url FROM urls")
+    cursor.execute("UPDATE urls SET search_id = rowid")
+    return True
+
+
+def matching_code(entries, redirect):
+    """The first code in (code, Redirect or None) ``entries`` that dedupes with ``redirect``"""
+    normalized = normalize_url(redirect.url)
+    for code, existing in entries:
+        if existing is not None and existing.policy == redirect.policy and normalize_url(existing.url) == normalized:
+            return code
+    return None
+
+
+def listing_key(code, redirect, by_host):
+    """Position of an entry in ``list_entries`` order, used as the ``after`` cursor"""
+    return (url_host(redirect.url), code) if by_host else (code,)
+
+
+class CodeExists(Exception):
+    """Raised by ``put`` when the code is already taken"""
+
+
+class StorageReadOnly(Exception):
+    """Raised by writes to a backend that only serves reads"""
+
+
+class Storage:
+    """Interface for the code -> URL store behind the handlers
+
+    Every call is blocking; the app runs reads on the database reader pool and
+    writes on the single writer thread. Backends must implement
+    ``get_redirect``, ``put``, ``update``, ``delete`` and ``scan``. Everything
+    else has a default built on those (or, for the code counter and click
+    analytics, kept in memory) that a backend can replace with something
+    faster or durable.
+
+    Each code has a URL and a redirect policy (see ``policy.Redirect``).
+    ``get`` and ``scan`` deal in URLs alone; ``get_redirect`` and
+    ``iter_redirects`` return the policy as well.
+
+    Writes are addressed by name (``"put"``, ``"update"``, ...) when they go
+    through ``write_batch``, so a backend can run a group of them in one
+    transaction.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_code = None
+        self._clicks = {}
+        # (clicks, minute of the flush that last added to them)
+        self._referrers = {}
+        self._clicks_before = None
+
+    def init(self):
+        """Create whatever the backend needs; safe to call more than once"""
+
+    def close(self):
+        pass
+
+    def get_redirect(self, code):
+        """Return the ``Redirect`` for ``code``, or None"""
+        raise NotImplementedError
+
+    def get(self, code):
+        """Return the URL for ``code``, or None"""
+        redirect = self.get_redirect(code)
+        return None if redirect is None else redirect.url
+
+    def put(self, code, url, status=302, max_age=None, immutable=False):
+        """Create an entry, raising CodeExists if the code is taken"""
+        raise NotImplementedError
+
+    def update(self, code, url, policy=None):
+        """Point an existing code at a new URL; returns False if there is no such code
+
+        The policy is kept unless ``policy`` gives a new (status, max_age,
+        immutable), in which case both change together or not at all.
+        """
+        raise NotImplementedError
+
+    def delete(self, code):
+        """Remove a code; returns False if there was no such code"""
+        raise NotImplementedError
+
+    def scan(self, after=None, limit=100):
+        """Return up to ``limit`` (code, url) pairs in code order, starting after ``after``"""
+        raise NotImplementedError
+
+    def get_redirects(self, codes):
+        """Return {code: Redirect} for the codes that exist"""
+        found = {}
+        for code in codes:
+            redirect = self.get_redirect(code)
+            if redirect is not None:
+                found[code] = redirect
+        return found
+
+    def put_many(self, entries):
+        """Create many (code, url) entries, optionally followed by the policy fields of ``put``
+
+        Returns one boolean per entry: True if it was created, False if the
+        code already existed (in the store or earlier in the same batch).
+        """
+        created = []
+        for code, *target in entries:
+            try:
+                self.put(code, *target)
+            except CodeExists:
+                created.append(False)
+            else:
+                created.append(True)
+        return created
+
+    def write_batch(self, ops):
+        """Apply (name, args) write ops in order, returning a (result, exception) pair per op
+
+        A CodeExists (or StorageReadOnly) from one op is reported without
+        affecting the others.
+        """
+        results = []
+        for name, args in ops:
+            try:
+                results.append((getattr(self, name)(*args), None))
+            except (CodeExists, StorageReadOnly) as exc:
+                results.append((None, exc))
+        return results
+
+    def iter_entries(self, chunk_size=1000):
+        """Yield every (code, url) pair in code order"""
+        after = None
+        while True:
+            entries = self.scan(after, chunk_size)
+            yield from entries
+            if len(entries) < chunk_size:
+                return
+            after = entries[-1][0]
+
+    def iter_redirects(self, chunk_size=1000):
+        """Yield every (code, Redirect) pair in code order"""
+        for code, _ in self.iter_entries(chunk_size):
+            redirect = self.get_redirect(code)
+            if redirect is not None:
+                yield code, redirect
+
+    def iter_rows(self, chunk_size=1000):
+        """Yield the column names, then lists of rows, for ``export``"""
+        yield ["code", "url", "status", "max_age", "immutable", "host"]
+        chunk = []
+        for code, redirect in self.iter_redirects(chunk_size):
+            url = redirect.url
+            chunk.append((code, url, redirect.status, redirect.max_age, int(redirect.immutable), url_host(url)))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def list_entries(self, after=None, limit=100, code_prefix=None, host_prefix=None):
+        """Return up to ``limit`` (code, Redirect) pairs for a filtered listing
+
+        Entries are in code order, or in (host, code) order when filtering by
+        host prefix. ``after`` is the ``listing_key`` of the last entry of the
+        previous page. This default walks every entry; backends with indexes
+        do better.
+        """
+        by_host = host_prefix is not None
+        after = tuple(after) if after is not None else None
+        matches = []
+        for code, redirect in self.iter_redirects():
+            if code_prefix and not code.startswith(code_prefix):
+                continue
+            key = listing_key(code, redirect, by_host)
+            if by_host and not key[0].startswith(host_prefix):
+                continue
+            if after is not None and key <= after:
+                continue
+            matches.append((key, code, redirect))
+            if not by_host and len(matches) == limit:
+                # Already in code order
+                break
+        return [(code, redirect) for _, code, redirect in heapq.nsmallest(limit, matches)]
+
+    def search(self, text, limit=100):
+        """Return up to ``limit`` (code, Redirect) pairs whose URL contains ``text``
+
+        Case is ignored and results come in no particular order. This default
+        reads every entry.
+        """
+        text = text.lower()
+        results = []
+        for code, redirect in self.iter_redirects():
+            if len(results) == limit:
+                break
+            if text in redirect.url.lower():
+                results.append((code, redirect))
+        return results
+
+    def find_code(self, redirect):
+        """Return a code with the same policy whose URL normalizes like ``redirect.url``, or None
+
+        The smallest such code wins. This default reads every entry.
+        """
+        return matching_code(self.iter_redirects(), redirect)
+
+    def count(self):
+        return sum(1 for _ in self.iter_entries())
+
+    def version(self):
+        """Return a string that changes whenever an entry changes, or None if there is no cheap one
+
+        Listings use it as their ETag.
+        """
+
+    def lease_codes(self, size, start):
+        """Reserve ``size`` values of the code counter, which begins at ``start``; returns the first"""
+        with self._lock:
+            first = start if self._next_code is None else self._next_code
+            self._next_code = first + size
+            return first
+
+    def store_clicks(self, minute_counts, referrer_counts, before=None):
+        """Add aggregated click counters (see ``analytics.ClickRecorder``)
+
+        With ``before``, minutes older than it are dropped, along with
+        referrer counters that have had no clicks since then.
+        """
+        flushed = current_minute()
+        with self._lock:
+            for key, count in minute_counts.items():
+                self._clicks[key] = self._clicks.get(key, 0) + count
+            for key, count in referrer_counts.items():
+                clicks, _ = self._referrers.get(key, (0, None))
+                self._referrers[key] = (clicks + count, flushed)
+            # The cutoff moves once a minute, so most flushes have nothing to drop
+            if before is not None and before != self._clicks_before:
+                self._clicks_before = before
+                self._clicks = {key: clicks for key, clicks in self._clicks.items() if key[1] >= before}
+                self._referrers = {key: entry for key, entry in self._referrers.items() if entry[1] >= before}
+
+    def top_codes(self, since, limit):
+        with self._lock:
+            totals = {}
+            for (code, minute), clicks in self._clicks.items():
+                if minute >= since:
+                    totals[code] = totals.get(code, 0) + clicks
+        ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [{"code": code, "clicks": clicks} for code, clicks in ranked]
+
+    def code_series(self, code, since, referrer_limit=10):
+        with self._lock:
+            series = sorted(
+                (minute, clicks)
+                for (clicked, minute), clicks in self._clicks.items()
+                if clicked == code and minute >= since
+            )
+            referrers = sorted(
+                ((referrer, clicks) for (clicked, referrer), (clicks, _) in self._referrers.items() if clicked == code),
+                key=lambda item: (-item[1], item[0]),
+            )[:referrer_limit]
+        return {
+            "code": code,
+            "series": [{"minute": minute, "clicks": clicks} for minute, clicks in series],
+            "referrers": [{"referrer": referrer, "clicks": clicks} for referrer, clicks in referrers],
+        }
+
+
+class MemoryStorage(Storage):
+    """Everything in process memory, for cache-only deployments and tests
+
+    A dict of Redirects answers lookups; a sorted array of codes serves
+    ordered scans. A url_digest index for ``find_code`` is built on first use
+    and kept up to date from then on. Nothing survives a restart and nothing
+    is shared between worker processes.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._redirects = {}
+        self._codes = []
+        self._digests = None
+        # The epoch keeps versions from a previous process from matching
+        self._epoch = os.urandom(4).hex()
+        self._version = 0
+
+    def get_redirect(self, code):
+        return self._redirects.get(code)
+
+    def put(self, code, url, status=302, max_age=None, immutable=False):
+        with self._lock:
+            if code in self._redirects:
+                raise CodeExists(code)
+            self._redirects[code] = Redirect(url, status, max_age, immutable)
+            bisect.insort(self._codes, code)
+            self._version += 1
+            if self._digests is not None:
+                self._digests.add(code, url)
+
+    def update(self, code, url, policy=None):
+        with self._lock:
+            redirect = self._redirects.get(code)
+            if redirect is None:
+                return False
+            self._redirects[code] = redirect._replace(url=url) if policy is None else Redirect(url, *policy)
+            self._version += 1
+            if self._digests is not None:
+                self._digests.replace(code, redirect.url, url)
+            return True
+
+    def delete(self, code):
+        with self._lock:
+            redirect = self._redirects.pop(code, None)
+            if redirect is None:
+                return False
+            del self._codes[bisect.bisect_left(self._codes, code)]
+            self._version += 1
+            if self._digests is not None:
+                self._digests.discard(code, redirect.url)
+            return True
+
+    def scan(self, after=None, limit=100):
+        with self._lock:
+            start = 0 if after is None else bisect.bisect_right(self._codes, after)
+            return [(code, self._redirects[code].url) for code in self._codes[start:start + limit]]
+
+    def iter_redirects(self, chunk_size=1000):
+        with self._lock:
+            entries = [(code, self._redirects[code]) for code in self._codes]
+        yield from entries
+
+    def find_code(self, redirect):
+        with self._lock:
+            if self._digests is None:
+                self._digests = DigestIndex((code, existing.url) for code, existing in self._redirects.items())
+            codes = self._digests.candidates(redirect.url)
+        return matching_code(((code, self._redirects.get(code)) for code in codes), redirect)
+
+    def count(self):
+        return len(self._redirects)
+
+    def version(self):
+        return f"{self._epoch}-{self._version}"
+
+
+class SqliteStorage(Storage):
+    """The urls table in SQLite
+
+    Reads use a pool of read-only connections, which never take a write lock;
+    writes use a separate pool. Each public write commits on its own, while
+    ``write_batch`` runs a whole group of writes in one transaction with a
+    savepoint per op. Given a metrics registry, time spent waiting for a
+    connection and holding it is recorded per role.
+
+    Every write that changes urls also bumps a counter in ``table_versions``,
+    in the same transaction, so the table version is one primary key lookup.
+    With ``search_index`` the same writes keep urls_fts, a trigram index of
+    the URLs, in step. Each urls row stores the rowid of its urls_fts entry
+    in ``search_id``, and the entry stores the code, so neither depends on
+    urls rowids, which VACUUM may renumber. Turning the index off drops it;
+    turning it back on rebuilds it.
+    """
+
+    def __init__(self, database, profile=None, pool_size=8, read_pool_size=8, metrics=None, search_index=True):
+        super().__init__()
+        self.database = database
+        self.profile = profile
+        self.search_index = search_index
+        self._pools = {
+            False: ConnectionPool(database, size=pool_size, profile=profile),
+            True: ConnectionPool(database, size=read_pool_size, profile=profile, readonly=True),
+        }
+        self._wait_seconds = self._query_seconds = None
+        if metrics is not None:
+            self._wait_seconds = metrics.histogram(
+                "db_connection_wait_seconds", "Time spent waiting for a pooled connection", ("role",)
+            )
+            self._query_seconds = metrics.histogram(
+                "db_query_seconds", "Time a pooled connection was held for queries", ("role",)
+            )
+
+    def init(self):
+        """Create or migrate the schema in one write transaction
+
+        Workers starting together take turns, each seeing the schema the last
+        one left, and a crash part way through leaves it as it was.
+        """
+        conn = connect(self.database, profile=self.profile)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS urls (
+                    code TEXT PRIMARY KEY,
+                    url TEXT NOT NULL
+                )
+            """)
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(urls)")}
+            for name, definition in ADDED_COLUMNS:
+                if name not in columns:
+                    cursor.execute(f"ALTER TABLE urls ADD COLUMN {name} {definition}")
+            # Fill in columns derived from the URL for rows written before they existed
+            for name, derive in (("host", url_host), ("url_digest", url_digest)):
+                if name not in columns:
+                    conn.create_function(derive.__name__, 1, derive, deterministic=True)
+                    cursor.execute(f"UPDATE urls SET {name} = {derive.__name__}(url)")
+            # Host-filtered listings are a range scan over this index
+            cursor.execute("CREATE INDEX IF NOT EXISTS urls_host_code ON urls (host, code)")
+            # Eight-byte keys, so deduplicated creation costs little index space
+            cursor.execute("CREATE INDEX IF NOT EXISTS urls_url_digest ON urls (url_digest)")
+            if self.search_index:
+                self.search_index = create_search_index(cursor)
+            else:
+                cursor.execute("DROP TABLE IF EXISTS urls_fts")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS id_blocks (
+                    name TEXT PRIMARY KEY,
+                    next INTEGER NOT NULL
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS table_versions (
+                    name TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                )
+            """)
+            # A random start, so a recreated database doesn't repeat versions
+            # that clients still hold
+            cursor.execute(
+                "INSERT OR IGNORE INTO table_versions (name, version) VALUES ('urls', random() & 281474976710655)"
+            )
+            create_click_tables(cursor)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def close(self):
+        for pool in self._pools.values():
+            pool.close()
+
+    def stats(self):
+        return {"read_pool": self._pools[True].stats(), "write_pool": self._pools[False].stats()}
+
+    @contextmanager
+    def connection(self, readonly=False):
+        """Check a pooled connection out, recording wait and hold times"""
+        if self._wait_seconds is None:
+            with self._pools[readonly].connection() as conn:
+                yield conn
+            return
+        role = "read" if readonly else "write"
+        start = time.perf_counter()
+        with self._pools[readonly].connection() as conn:
+            acquired = time.perf_counter()
+            self._wait_seconds.observe(acquired - start, role)
+            try:
+                yield conn
+            finally:
+                self._query_seconds.observe(time.perf_counter() - acquired, role)
+
+    def _commit(self, fn, *args):
+        with self.connection() as conn:
+            result = fn(conn, *args)
+            conn.commit()
+            return result
+
+    def get(self, code):
+        with self.connection(readonly=True) as conn:
+            row = conn.execute("SELECT url FROM urls WHERE code = ?", (code,)).fetchone()
+        return row[0] if row else None
+
+    def get_redirect(self, code):
+        with self.connection(readonly=True) as conn:
+            row = conn.execute(
+                "SELECT url, status, max_age, immutable FROM urls WHERE code = ?", (code,)
+            ).fetchone()
+        return redirect_from_row(*row) if row else None
+
+    def _select_many(self, columns, codes):
+        codes = list(codes)
+        with self.connection(readonly=True) as conn:
+            # Stay well below SQLite's bound parameter limit
+            for start in range(0, len(codes), 500):
+                chunk = codes[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                yield from conn.execute(f"SELECT code, {columns} FROM urls WHERE code IN ({placeholders})", chunk)
+
+    def get_redirects(self, codes):
+        return {
+            code: redirect_from_row(*row)
+            for code, *row in self._select_many("url, status, max_age, immutable", codes)
+        }
+
+    def scan(self, after=None, limit=100):
+        with self.connection(readonly=True) as conn:
+            if after is None:
+                cursor = conn.execute("SELECT code, url FROM urls ORDER BY code LIMIT ?", (limit,))
+            else:
+                cursor = conn.execute(
+                    "SELECT code, url FROM urls WHERE code > ? ORDER BY code LIMIT ?",
+                    (after, limit),
+                )
+            return cursor.fetchall()
+
+    def count(self):
+        with self.connection(readonly=True) as conn:
+            return conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def version(self):
+        with self.connection(readonly=True) as conn:
+            return str(conn.execute("SELECT version FROM table_versions WHERE name = 'urls'").fetchone()[0])
+
+    def list_entries(self, after=None, limit=100, code_prefix=None, host_prefix=None):
+        """Each page is one range scan: over the primary key, or over urls_host_code
+        when filtering by host"""
+        conditions = []
+        params = []
+
+        def prefix_range(column, prefix):
+            conditions.append(f"{column} >= ?")
+            params.append(prefix)
+            upper = prefix_upper_bound(prefix)
+            if upper is not None:
+                conditions.append(f"{column} < ?")
+                params.append(upper)
+
+        if host_prefix is not None:
+            order = "host, code"
+            prefix_range("host", host_prefix)
+            if after is not None:
+                conditions.append("(host, code) > (?, ?)")
+                params.extend(after)
+        else:
+            order = "code"
+            if after is not None:
+                conditions.append("code > ?")
+                params.append(after[0])
+        if code_prefix:
+            prefix_range("code", code_prefix)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.connection(readonly=True) as conn:
+            rows = conn.execute(
+                f"SELECT code, url, status, max_age, immutable FROM urls {where} ORDER BY {order} LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        return [(code, redirect_from_row(*row)) for code, *row in rows]
+
+    def search(self, text, limit=100):
+        """Looks ``text`` up in urls_fts when it is long enough to hold a trigram"""
+        if not self.search_index or len(text) < SEARCH_MIN_LENGTH:
+            return super().search(text, limit)
+        # A quoted phrase of trigrams matches exactly the URLs containing it
+        phrase = '"' + text.replace('"', '""') + '"'
+        with self.connection(readonly=True) as conn:
+            rows = conn.execute(
+                "SELECT urls.code, urls.url, status, max_age, immutable FROM urls_fts"
+                " CROSS JOIN urls ON urls.code = urls_fts.code AND urls.search_id = urls_fts.rowid"
+                " WHERE urls_fts MATCH ? LIMIT ?",
+                (phrase, limit),
+            ).fetchall()
+        return [(code, redirect_from_row(*row)) for code, *row in rows]
+
+    def find_code(self, redirect):
+        """Candidates come from the urls_url_digest index and are compared in full"""
+        with self.connection(readonly=True) as conn:
+            rows = conn.execute(
+                "SELECT code, url, status, max_age, immutable FROM urls WHERE url_digest = ? ORDER BY code",
+                (url_digest(redirect.url),),
+            ).fetchall()
+        return matching_code(((code, redirect_from_row(*row)) for code, *row in rows), redirect)
+
+    def _changed(self, conn, changed):
+        if changed:
+            conn.execute("UPDATE table_versions SET version = version + 1 WHERE name = 'urls'")
+        return changed
+
+    def _put(self, conn, code, url, status=302, max_age=None, immutable=False):
+        try:
+            conn.execute(
+                "INSERT INTO urls (code, url, status, max_age, immutable, host, url_digest)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (code, url, status, max_age, immutable, url_host(url), url_digest(url)),
+            )
+        except sqlite3.IntegrityError:
+            raise CodeExists(code) from None
+        if self.search_index:
+            self._index_urls(conn, [(code, url)])
+        self._changed(conn, True)
+
+    def _put_many(self, conn, entries):
+        cursor = conn.cursor()
+        codes = list({code for code, *_ in entries})
+        existing = set()
+        for start in range(0, len(codes), 500):
+            chunk = codes[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f"SELECT code FROM urls WHERE code IN ({placeholders})", chunk)
+            existing.update(row[0] for row in cursor.fetchall())
+
+        created = []
+        rows = []
+        for code, *target in entries:
+            if code in existing:
+                created.append(False)
+            else:
+                existing.add(code)
+                redirect = Redirect(*target)
+                rows.append((code, *redirect, url_host(redirect.url), url_digest(redirect.url)))
+                created.append(True)
+        cursor.executemany(
+            "INSERT INTO urls (code, url, status, max_age, immutable, host, url_digest) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        if self.search_index:
+            self._index_urls(conn, [(code, url) for code, url, *_ in rows])
+        self._changed(conn, rows)
+        return created
+
+    def _index_urls(self, conn, entries):
+        """Add new (code, url) rows to urls_fts and record where they went"""
+        ids = [
+            (conn.execute("INSERT INTO urls_fts (code, url) VALUES (?, ?)", entry).lastrowid, entry[0])
+            for entry in entries
+        ]
+        conn.executemany("UPDATE urls SET search_id = ? WHERE code = ?", ids)
+
+    def _update(self, conn, code, url, policy=None):
+        if self.search_index:
+            conn.execute(
+                "UPDATE urls_fts SET url = ? WHERE rowid = (SELECT search_id FROM urls WHERE code = ?)", (url, code)
+            )
+        if policy is None:
+            cursor = conn.execute(
+                "UPDATE urls SET url = ?, host = ?, url_digest = ? WHERE code = ?",
+                (url, url_host(url), url_digest(url), code),
+            )
+        else:
+            cursor = conn.execute(
+                "UPDATE urls SET url = ?, host = ?, url_digest = ?, status = ?, max_age = ?, immutable = ?"
+                " WHERE code = ?",
+                (url, url_host(url), url_digest(url), *policy, code),
+            )
+        return self._changed(conn, cursor.rowcount > 0)
+
+    def _delete(self, conn, code):
+        if self.search_index:
+            conn.execute("DELETE FROM urls_fts WHERE rowid = (SELECT search_id FROM urls WHERE code = ?)", (code,))
+        return self._changed(conn, conn.execute("DELETE FROM urls WHERE code = ?", (code,)).rowcount > 0)
+
+    def _store_clicks(self, conn, minute_counts, referrer_counts, before=None):
+        store_counts(conn, minute_counts, referrer_counts, before)
+
+    def put(self, code, url, status=302, max_age=None, immutable=False):
+        self._commit(self._put, code, url, status, max_age, immutable)
+
+    def put_many(self, entries):
+        return self._commit(self._put_many, entries)
+
+    def update(self, code, url, policy=None):
+        return self._commit(self._update, code, url, policy)
+
+    def delete(self, code):
+        return self._commit(self._delete, code)
+
+    def store_clicks(self, minute_counts, referrer_counts, before=None):
+        self._commit(self._store_clicks, minute_counts, referrer_counts, before)
+
+    def write_batch(self, ops):
+        with self.connection() as conn:
+            return run_batch(
+                conn,
+                [(getattr(self, "_" + name), args) for name, args in ops],
+                isolate=(sqlite3.Error, CodeExists),
+            )
+
+    def _dedicated_connection(self):
+        # Long scans get their own connection so they don't hold a pooled one
+        # for as long as a client takes to read the result
+        return connect(self.database, readonly=True, profile=self.profile, check_same_thread=False)
+
+    def iter_entries(self, chunk_size=1000):
+        conn = self._dedicated_connection()
+        try:
+            yield from conn.execute("SELECT code, url FROM urls ORDER BY code")
+        finally:
+            conn.close()
+
+    def iter_redirects(self, chunk_size=1000):
+        conn = self._dedicated_connection()
+        try:
+            for code, *row in conn.execute("SELECT code, url, status, max_age, immutable FROM urls ORDER BY code"):
+                yield code, redirect_from_row(*row)
+        finally:
+            conn.close()
+
+    def iter_rows(self, chunk_size=1000):
+        """Every column of the urls table, read from one consistent snapshot"""
+        conn = self._dedicated_connection()
+        try:
+            yield from iter_rows(conn, chunk_size)
+        finally:
+            conn.close()
+
+    def lease_codes(self, size, start):
+        with self.connection() as conn:
+            conn.execute("INSERT OR IGNORE INTO id_blocks (name, next) VALUES ('codes', ?)", (start,))
+            end = conn.execute(
+                "UPDATE id_blocks SET next = next + ? WHERE name = 'codes' RETURNING next",
+                (size,),
+            ).fetchone()[0]
+            conn.commit()
+        return end - size
+
+    def top_codes(self, since, limit):
+        with self.connection(readonly=True) as conn:
+            return top_codes(conn, since, limit)
+
+    def code_series(self, code, since, referrer_limit=10):
+        with self.connection(readonly=True) as conn:
+            return code_series(conn, code, since, referrer_limit)
@@ -0,0 +1,421 @@
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from unittest.mock import patch
+
+import pytest
+
+from logstore import LogStorage
+from policy import Redirect
+from pool import StorageProfile
+from storage import CodeExists, MemoryStorage, SqliteStorage, prefix_upper_bound
+
+
+def open_sqlite(tmp_path):
+    return SqliteStorage(str(tmp_path / "urls.db"))
+
+
+def open_memory(tmp_path):
+    return MemoryStorage()
+
+
+def open_log(tmp_path):
+    return LogStorage(str(tmp_path / "logstore"))
+
+
+def open_compacting_log(tmp_path):
+    # Compacts after nearly every write, so reads mix index and overlay
+    return LogStorage(str(tmp_path / "logstore"), max_delta=1)
+
+
+BACKENDS = {
+    "sqlite": open_sqlite,
+    "memory": open_memory,
+    "log": open_log,
+    "log-compacting": open_compacting_log,
+}
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def store(request, tmp_path):
+    store = BACKENDS[request.param](tmp_path)
+    store.init()
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def populated(store):
+    for code in ("b", "d", "a", "c"):
+        store.put(code, f"https://{code}.com")
+    return store
+
+
+class TestStorageConformance:
+    """Behaviour shared by every storage backend"""
+
+    def test_get_missing(self, store):
+        assert store.get("nope") is None
+
+    def test_put_and_get(self, store):
+        store.put("abc", "https://example.com")
+        assert store.get("abc") == "https://example.com"
+
+    def test_put_existing_code_raises(self, store):
+        store.put("abc", "https://example.com")
+        with pytest.raises(CodeExists):
+            store.put("abc", "https://other.com")
+        assert store.get("abc") == "https://example.com"
+
+    def test_update(self, populated):
+        assert populated.update("a", "https://new.com") is True
+        assert populated.get("a") == "https://new.com"
+        assert populated.update("missing", "https://new.com") is False
+        assert populated.get("missing") is None
+
+    def test_delete(self, populated):
+        assert populated.delete("a") is True
+        assert populated.get("a") is None
+        assert populated.delete("a") is False
+        assert [code for code, _ in populated.scan()] == ["b", "c", "d"]
+
+    def test_scan_in_code_order(self, populated):
+        assert populated.scan() == [(code, f"https://{code}.com") for code in "abcd"]
+
+    def test_scan_after_and_limit(self, populated):
+        assert [code for code, _ in populated.scan(limit=2)] == ["a", "b"]
+        assert [code for code, _ in populated.scan(after="b", limit=10)] == ["c", "d"]
+        assert [code for code, _ in populated.scan(after="bb", limit=1)] == ["c"]
+        assert populated.scan(after="d") == []
+
+    def test_put_many_reports_conflicts(self, populated):
+        created = populated.put_many([("a", "https://x.com"), ("e", "https://e.com"), ("e", "https://dup.com")])
+        assert created == [False, True, False]
+        assert populated.get("a") == "https://a.com"
+        assert populated.get("e") == "https://e.com"
+
+    def test_write_batch_isolates_conflicts(self, populated):
+        results = populated.write_batch(
+            [
+                ("put", ("e", "https://e.com")),
+                ("put", ("a", "https://x.com")),
+                ("update", ("b", "https://new.com")),
+                ("delete", ("missing",)),
+            ]
+        )
+        assert [result for result, _ in results] == [None, None, True, False]
+        assert isinstance(results[1][1], CodeExists)
+        assert populated.get("e") == "https://e.com"
+        assert populated.get("b") == "https://new.com"
+
+    def test_iter_entries_and_count(self, populated):
+        assert list(populated.iter_entries(chunk_size=3)) == populated.scan()
+        assert populated.count() == 4
+
+    def test_iter_rows(self, populated):
+        rows = populated.iter_rows(chunk_size=3)
+        columns = next(rows)
+        assert columns[:2] == ["code", "url"]
+        chunks = list(rows)
+        assert [len(chunk) for chunk in chunks] == [3, 1]
+        assert [tuple(row[:2]) for chunk in chunks for row in chunk] == populated.scan()
+
+    def test_redirect_policy(self, populated):
+        assert populated.get_redirect("a") == Redirect("https://a.com")
+        assert populated.get_redirect("missing") is None
+        populated.put("e", "https://e.com", 308, 3600, True)
+        assert populated.get_redirect("e") == Redirect("https://e.com", 308, 3600, True)
+        assert populated.get("e") == "https://e.com"
+
+    def test_update_keeps_policy(self, populated):
+        populated.update("a", "https://a.com", (301, None, False))
+        populated.update("a", "https://new.com")
+        assert populated.get_redirect("a") == Redirect("https://new.com", 301)
+
+    def test_update_with_policy(self, populated):
+        assert populated.update("a", "https://new.com", (308, 60, True)) is True
+        assert populated.get_redirect("a") == Redirect("https://new.com", 308, 60, True)
+        assert populated.update("missing", "https://new.com", (308, 60, True)) is False
+        populated.write_batch([("update", ("b", "https://b2.com", (301, None, False)))])
+        assert populated.get_redirect("b") == Redirect("https://b2.com", 301)
+
+    def test_recreated_code_starts_with_default_policy(self, populated):
+        populated.update("a", "https://a.com", (301, 60, True))
+        populated.delete("a")
+        populated.put("a", "https://again.com")
+        assert populated.get_redirect("a") == Redirect("https://again.com")
+
+    def test_policies_in_bulk_reads_and_writes(self, populated):
+        populated.put_many([("e", "https://e.com", 307, 10, False), ("f", "https://f.com")])
+        populated.write_batch([("update", ("b", "https://b.com", (301, None, True)))])
+        assert populated.get_redirects(["b", "e", "f", "x"]) == {
+            "b": Redirect("https://b.com", 301, None, True),
+            "e": Redirect("https://e.com", 307, 10, False),
+            "f": Redirect("https://f.com"),
+        }
+        redirects = list(populated.iter_redirects())
+        assert [code for code, _ in redirects] == ["a", "b", "c", "d", "e", "f"]
+        assert redirects[1][1].immutable is True
+        rows = populated.iter_rows()
+        assert next(rows) == ["code", "url", "status", "max_age", "immutable", "host"]
+        expected = ("e", "https://e.com", 307, 10, 0, "e.com")
+        assert [tuple(row) for chunk in rows for row in chunk][4] == expected
+
+    def test_version_changes_only_with_entries(self, populated):
+        versions = [populated.version()]
+        populated.get("a")
+        populated.scan()
+        populated.update("missing", "https://x.com")
+        populated.delete("missing")
+        with pytest.raises(CodeExists):
+            populated.put("a", "https://x.com")
+        assert populated.version() == versions[-1]
+        for write in (
+            lambda: populated.put("e", "https://e.com"),
+            lambda: populated.put_many([("f", "https://f.com")]),
+            lambda: populated.update("a", "https://new.com"),
+            lambda: populated.update("a", "https://new.com", (301, None, False)),
+            lambda: populated.delete("b"),
+        ):
+            write()
+            versions.append(populated.version())
+        assert len(set(versions)) == len(versions)
+
+    def test_list_entries(self, populated):
+        populated.put_many([("ab", "https://x.org/a", 301), ("ac", "https://WWW.x.org"), ("b2", "https://y.net")])
+        page = populated.list_entries(limit=3)
+        assert [code for code, _ in page] == ["a", "ab", "ac"]
+        assert [code for code, _ in populated.list_entries(after=("ac",), limit=3)] == ["b", "b2", "c"]
+        assert populated.list_entries(code_prefix="a", after=("a",)) == [
+            ("ab", Redirect("https://x.org/a", 301)),
+            ("ac", Redirect("https://WWW.x.org")),
+        ]
+        by_host = populated.list_entries(host_prefix="")
+        assert [code for code, _ in by_host][:3] == ["a", "b", "c"]
+        assert [code for code, _ in by_host][-3:] == ["ac", "ab", "b2"]
+        assert [code for code, _ in populated.list_entries(host_prefix="x")] == ["ab"]
+        assert [code for code, _ in populated.list_entries(host_prefix="www.x")] == ["ac"]
+        assert [code for code, _ in populated.list_entries(host_prefix="x.", after=("x.org", "aa"))] == ["ab"]
+        assert [code for code, _ in populated.list_entries(host_prefix="", code_prefix="b")] == ["b", "b2"]
+
+    def test_list_entries_follows_updates(self, populated):
+        populated.update("a", "https://z.com")
+        populated.delete("b")
+        assert [code for code, _ in populated.list_entries(host_prefix="")] == ["c", "d", "a"]
+        assert [code for code, _ in populated.list_entries(code_prefix="b")] == []
+
+    def test_search(self, populated):
+        populated.put_many([("p1", "https://Example.com/promo/1"), ("p2", "https://example.com/PROMO/2")])
+        populated.put("p3", "https://example.com/other")
+        populated.update("p3", "https://example.com/promo/3")
+        populated.update("a", "https://a.com/promo")
+        populated.delete("p2")
+        found = populated.search("example.com/promo")
+        assert sorted(found) == [
+            ("p1", Redirect("https://Example.com/promo/1")),
+            ("p3", Redirect("https://example.com/promo/3")),
+        ]
+        assert sorted(code for code, _ in populated.search("PROMO")) == ["a", "p1", "p3"]
+        assert len(populated.search("promo", limit=2)) == 2
+        assert sorted(code for code, _ in populated.search("b.")) == ["b"]
+        assert populated.search("other") == []
+        assert populated.search('"promo') == []
+
+    def test_find_code(self, populated):
+        populated.put_many([("x2", "https://Example.com:443"), ("x1", "https://example.com/", 301)])
+        populated.put("x3", "https://example.com/")
+        assert populated.find_code(Redirect("https://EXAMPLE.com")) == "x2"
+        assert populated.find_code(Redirect("https://example.com", 301)) == "x1"
+        assert populated.find_code(Redirect("https://example.com", 308)) is None
+        assert populated.find_code(Redirect("http://example.com")) is None
+        populated.update("x2", "https://example.org")
+        populated.delete("x1")
+        assert populated.find_code(Redirect("https://example.com")) == "x3"
+        assert populated.find_code(Redirect("https://example.com", 301)) is None
+        assert populated.find_code(Redirect("https://example.org")) == "x2"
+
+    def test_lease_codes_never_overlap(self, store):
+        first = store.lease_codes(10, start=1000)
+        second = store.lease_codes(5, start=1000)
+        assert first == 1000
+        assert second == 1010
+
+    def test_click_analytics(self, store):
+        store.store_clicks({("a", 60): 2, ("b", 60): 1}, {("a", "news.com"): 2})
+        store.store_clicks({("a", 120): 3}, {("a", ""): 3})
+        assert store.top_codes(since=0, limit=10) == [{"code": "a", "clicks": 5}, {"code": "b", "clicks": 1}]
+        assert store.top_codes(since=120, limit=10) == [{"code": "a", "clicks": 3}]
+        series = store.code_series("a", since=0)
+        assert series["series"] == [{"minute": 60, "clicks": 2}, {"minute": 120, "clicks": 3}]
+        assert series["referrers"] == [{"referrer": "", "clicks": 3}, {"referrer": "news.com", "clicks": 2}]
+
+    def test_click_analytics_retention(self, store):
+        with patch("analytics.time.time", return_value=60):
+            store.store_clicks({("a", 60): 2}, {("a", "old.com"): 2})
+        with patch("analytics.time.time", return_value=180):
+            store.store_clicks({("a", 180): 1}, {("a", "new.com"): 1}, before=120)
+        series = store.code_series("a", since=0)
+        assert series["series"] == [{"minute": 180, "clicks": 1}]
+        assert series["referrers"] == [{"referrer": "new.com", "clicks": 1}]
+
+
+class TestPrefixUpperBound:
+    """Tests for the exclusive upper bound of a prefix range"""
+
+    def test_bounds(self):
+        assert prefix_upper_bound("ab") == "ac"
+        assert prefix_upper_bound("a\ud7ff") == "a\ue000"
+        assert prefix_upper_bound("a\U0010ffff") == "b"
+        assert prefix_upper_bound("\U0010ffff") is None
+        assert prefix_upper_bound("") is None
+
+
+class TestSqliteStorage:
+    """Tests specific to the SQLite backend"""
+
+    def test_adds_columns_to_existing_table(self, tmp_path):
+        path = str(tmp_path / "urls.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE urls (code TEXT PRIMARY KEY, url TEXT NOT NULL)")
+        conn.execute("INSERT INTO urls VALUES ('old', 'https://old.com')")
+        conn.commit()
+        conn.close()
+
+        store = SqliteStorage(path)
+        store.init()
+        store.init()
+        assert store.get_redirect("old") == Redirect("https://old.com")
+        assert store.update("old", "https://old.com", (308, 60, False)) is True
+        assert store.get_redirect("old") == Redirect("https://old.com", 308, 60)
+        assert store.list_entries(host_prefix="old") == [("old", Redirect("https://old.com", 308, 60))]
+        assert store.find_code(Redirect("https://OLD.com/", 308, 60)) == "old"
+        store.close()
+
+    def test_concurrent_migrations_take_turns(self, tmp_path):
+        path = str(tmp_path / "urls.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE urls (code TEXT PRIMARY KEY, url TEXT NOT NULL)")
+        conn.executemany("INSERT INTO urls VALUES (?, ?)", [(f"c{i}", f"https://h{i}.com") for i in range(500)])
+        conn.commit()
+        conn.close()
+
+        stores = [SqliteStorage(path, profile=StorageProfile()) for _ in range(4)]
+        barrier = threading.Barrier(len(stores))
+
+        def start(store):
+            barrier.wait()
+            store.init()
+
+        with ThreadPoolExecutor(len(stores)) as executor:
+            # result() re-raises anything init raised on its thread
+            for future in [executor.submit(start, store) for store in stores]:
+                future.result()
+        assert stores[0].list_entries(host_prefix="h499") == [("c499", Redirect("https://h499.com"))]
+        for store in stores:
+            store.close()
+
+    def test_failed_migration_is_rolled_back(self, tmp_path):
+        path = str(tmp_path / "urls.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE urls (code TEXT PRIMARY KEY, url TEXT NOT NULL)")
+        conn.execute("INSERT INTO urls VALUES ('old', 'https://old.com')")
+        conn.commit()
+        conn.close()
+
+        def crash(url):
+            raise RuntimeError("crash")
+
+        store = SqliteStorage(path)
+        # Fail the second backfill, after every column was added
+        with patch("storage.url_digest", crash), pytest.raises(sqlite3.Error):
+            store.init()
+        conn = sqlite3.connect(path)
+        assert [row[1] for row in conn.execute("PRAGMA table_info(urls)")] == ["code", "url"]
+        conn.close()
+        store.init()
+        assert store.find_code(Redirect("https://old.com")) == "old"
+        store.close()
+
+    def test_listings_are_index_range_scans(self, tmp_path):
+        store = open_sqlite(tmp_path)
+        store.init()
+        queries = []
+        with store.connection() as conn:
+            conn.set_trace_callback(queries.append)
+            store.connection = lambda readonly=False: nullcontext(conn)
+            store.list_entries(after=("a",), limit=10, code_prefix="a")
+            store.list_entries(after=("x.org", "a"), limit=10, host_prefix="x")
+            conn.set_trace_callback(None)
+            assert len(queries) == 2
+            for query in queries:
+                plan = " ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}"))
+                assert "USING" in plan and "SCAN" not in plan and "TEMP B-TREE" not in plan, plan
+        store.close()
+
+    def test_adds_last_minute_to_existing_click_referrers(self, tmp_path):
+        path = str(tmp_path / "urls.db")
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE click_referrers (code TEXT NOT NULL, referrer TEXT NOT NULL, clicks INTEGER NOT NULL,"
+            " PRIMARY KEY (code, referrer))"
+        )
+        conn.execute("INSERT INTO click_referrers VALUES ('a', 'news.com', 4)")
+        conn.commit()
+        conn.close()
+        store = SqliteStorage(path)
+        with patch("analytics.time.time", return_value=600):
+            store.init()
+        store.store_clicks({("a", 600): 1}, {}, before=600)
+        assert store.code_series("a", since=0)["referrers"] == [{"referrer": "news.com", "clicks": 4}]
+        store.store_clicks({("a", 660): 1}, {}, before=660)
+        assert store.code_series("a", since=0)["referrers"] == []
+        store.close()
+
+    def test_search_index_is_rebuilt_when_turned_back_on(self, tmp_path):
+        store = SqliteStorage(str(tmp_path / "urls.db"), search_index=False)
+        store.init()
+        store.put("a", "https://a.com/promo")
+        assert store.search("promo") == [("a", Redirect("https://a.com/promo"))]
+        store.close()
+
+        store = SqliteStorage(str(tmp_path / "urls.db"))
+        store.init()
+        store.put("b", "https://b.com/promo")
+        with store.connection() as conn:
+            assert conn.execute("SELECT code, url FROM urls_fts ORDER BY rowid").fetchall() == [
+                ("a", "https://a.com/promo"),
+                ("b", "https://b.com/promo"),
+            ]
+        assert sorted(code for code, _ in store.search("promo")) == ["a", "b"]
+        store.close()
+
+    def test_search_index_survives_renumbered_rowids(self, tmp_path):
+        store = open_sqlite(tmp_path)
+        store.init()
+        store.put_many([(code, f"https://{code}.com/promo") for code in ("a", "b", "c", "d")])
+        store.delete("a")
+        store.delete("b")
+        with store.connection() as conn:
+            # Renumber the remaining rows, as VACUUM is allowed to
+            conn.execute("UPDATE urls SET rowid = rowid - 2")
+            conn.commit()
+        assert sorted(code for code, _ in store.search("promo")) == ["c", "d"]
+        store.update("c", "https://c.com/other")
+        store.delete("d")
+        store.put("e", "https://e.com/promo")
+        assert sorted(code for code, _ in store.search("promo")) == ["e"]
+        assert store.search("other") == [("c", Redirect("https://c.com/other"))]
+        store.close()
+
+    def test_search_index_in_an_earlier_layout_is_rebuilt(self, tmp_path):
+        store = open_sqlite(tmp_path)
+        store.init()
+        store.put("a", "https://a.com/promo")
+        with store.connection() as conn:
+            conn.execute("DROP TABLE urls_fts")
+            conn.execute("CREATE VIRTUAL TABLE urls_fts USING fts5(url, tokenize = 'trigram')")
+            conn.commit()
+        store.init()
+        assert store.search("promo") == [("a", Redirect("https://a.com/promo"))]
+        store.close()
@@ -0,0 +1,39 @@
+"""Hot-code list used to warm the redirect cache before a worker reports ready
+
+The list is a JSON file of the most clicked codes, hottest first, as returned
+by ``Storage.top_codes``. Workers save it on shutdown and read it on startup,
+so a restarted node (or a replica, whose click counts live in memory) can
+preload the codes its traffic actually hits.
+"""
+
+import json
+import os
+import time
+
+
+def save_hot_codes(path, ranked):
+    """Write ``ranked`` ({"code", "clicks"} dicts, hottest first) to ``path`` atomically"""
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump({"saved_at": int(time.time()), "codes": ranked}, f)
+    os.replace(tmp_path, path)
+
+
+def load_hot_codes(path):
+    """Return the codes saved at ``path``, hottest first, or None if there is no usable file"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        return [entry["code"] for entry in data["codes"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def warm_order(codes, chunk_size):
+    """Split hottest-first ``codes`` into chunks to load, coldest first
+
+    An LRU cache keeps what was stored last the longest, so the hottest codes
+    go in at the end.
+    """
+    codes = codes[::-1]
+    return [codes[start:start + chunk_size] for start in range(0, len(codes), chunk_size)]
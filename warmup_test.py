@@ -0,0 +1,23 @@
+from warmup import load_hot_codes, save_hot_codes, warm_order
+
+
+class TestHotCodes:
+    """Tests for the persisted hot-code list"""
+
+    def test_round_trip(self, tmp_path):
+        path = tmp_path / "hot.json"
+        save_hot_codes(path, [{"code": "a", "clicks": 9}, {"code": "b", "clicks": 3}])
+        assert load_hot_codes(path) == ["a", "b"]
+        assert [p.name for p in tmp_path.iterdir()] == ["hot.json"]
+
+    def test_missing_or_corrupt_file(self, tmp_path):
+        assert load_hot_codes(tmp_path / "missing.json") is None
+        path = tmp_path / "hot.json"
+        path.write_text("{not json")
+        assert load_hot_codes(path) is None
+        path.write_text('{"codes": 3}')
+        assert load_hot_codes(path) is None
+
+    def test_warm_order_loads_hottest_last(self):
+        assert warm_order(["a", "b", "c", "d", "e"], 2) == [["e", "d"], ["c", "b"], ["a"]]
+        assert warm_order([], 2) == []